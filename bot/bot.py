@@ -1,5 +1,20 @@
+import asyncio
+import logging
+from telegram.ext import Application, CommandHandler, CallbackQueryHandler, ContextTypes, MessageHandler, filters
 from data_access.database import init_db
-from dialogs import handle_create_dialog_settings
+from dialogs import start, button_callback
+from handlers import handle_text_message
+from unit_of_work import UnitOfWorkApplication, BotContext
+from persistence import StatePersistence
+from supervisor import Supervisor
+from data_access.state_store import STATE_STORES
+from external_integrations.http_client import close_http_client
+import config
+from business_logic.message_sink import message_sink
+from business_logic.quota import quota_engine
+from business_logic.subscription_sweeper import subscription_sweeper
+from business_logic.payment_ingestion import payment_ingestor
+from external_integrations.payment_webhook import PaymentWebhookServer
 
 # Настройка логирования.
 logging.basicConfig(
@@ -10,34 +25,100 @@ logging.basicConfig(
 # Инициализация логгера с использованием имени текущего модуля.
 logger = logging.getLogger(__name__)
 
+# Прием уведомлений о платежах в процессе бота (если задан PAYMENT_WEBHOOK_PORT)
+payment_webhook: PaymentWebhookServer = None
+
+
+async def on_startup(application: Application):
+    # Фоновая пакетная запись сообщений диалогов
+    message_sink.start()
+    # Периодическая запись израсходованных квот
+    quota_engine.start()
+    # Фоновое снятие истекших подписок
+    subscription_sweeper.start()
+    # Пакетное применение уведомлений о платежах
+    payment_ingestor.start()
+    # В режиме supervisor прием уведомлений запускается отдельным процессом, а не в каждом рабочем
+    if config.PAYMENT_WEBHOOK_PORT and config.BOT_MODE != 'supervisor':
+        global payment_webhook
+        payment_webhook = PaymentWebhookServer()
+        await payment_webhook.start()
 
-# Определение команд
-def main():
 
+async def on_shutdown(application: Application):
+    # Записываем сообщения, еще не попавшие в БД
+    await subscription_sweeper.stop()
+    if payment_webhook is not None:
+        await payment_webhook.stop()
+    await payment_ingestor.stop()
+    await message_sink.stop()
+    await quota_engine.stop()
+    # Закрываем общий пул HTTP-соединений внешних интеграций
+    await close_http_client()
+
+
+def build_application() -> Application:
     """
     Создаем Updater и передаем ему токен
     Updater - это основной класс для работы с Telegram API. Он управляет соединением с API и отправляет обновления (updates) боту.
     """
-    application = Application.builder().token("7672229960:AAGJ3nYrvj_LG9Gzu_UfsS-PsV4K3p1T0yE").build()
+    builder = (
+        Application.builder()
+        .token(config.BOT_TOKEN)
+        # Одна сессия БД на обновление: открывается лениво, фиксируется один раз в конце
+        .application_class(UnitOfWorkApplication)
+        .context_types(ContextTypes(context=BotContext))
+        # Ограниченная очередь: при перегрузке прием обновлений ждет, а не копит их в памяти
+        .update_queue(asyncio.Queue(maxsize=config.UPDATE_QUEUE_SIZE))
+        .post_init(on_startup)
+        .post_shutdown(on_shutdown)
+    )
+    if config.STATE_BACKEND != 'memory':
+        # user_data/chat_data во внешнем хранилище — процессов бота может быть несколько
+        builder = builder.persistence(StatePersistence(STATE_STORES[config.STATE_BACKEND]()))
+    return builder.build()
+
 
+def register_handlers(application: Application):
     """
-    Регистрация обработчиков команд
+    Регистрация обработчиков команд (общая для polling и webhook)
     Обработчики команд связывают текстовые команды с соответствующими функциями.
     Когда пользователь вводит команду (например, /start), соответствующая функция будет вызвана.
     """
     application.add_handler(CommandHandler("start", start))          # Обработчик для команды /start
     application.add_handler(CommandHandler('start', start))
-    application.add_handler(CallbackQueryHandler(handle_create_dialog_settings,
-                                                 pattern='start_dialog_settings'))
-    application.add_handler(CallbackQueryHandler(set_role_callback, pattern=r'^(role_1|role_2)_[0-9]+$'))
-    # Обработчик для выбора модели
-    application.add_handler(CallbackQueryHandler(handle_create_dialog_settings,
-                                                 pattern='^(gpt_4o_create|gpt_4o_mini_create|o1_create|o1_mini_create)$'))
-
+    # Все inline-кнопки — через таблицу действий (bot/dialogs.py)
     application.add_handler(CallbackQueryHandler(button_callback))
 
-    # updater.start_polling()
-    application.run_polling()
+    # Текстовые сообщения — ведение диалога с моделью (ответ показывается по мере генерации)
+    application.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, handle_text_message))
+
+
+# Определение команд
+def main():
+    if config.BOT_MODE == 'supervisor':
+        # Обработка в нескольких процессах; каждый сам строит приложение через build_application
+        Supervisor().run()
+        return
+
+    application = build_application()
+    register_handlers(application)
+
+    if config.BOT_MODE == 'webhook':
+        if not config.WEBHOOK_SECRET_TOKEN:
+            raise RuntimeError("Для режима webhook нужно задать WEBHOOK_SECRET_TOKEN")
+        # Встроенный сервер принимает POST от Telegram на WEBHOOK_PATH и проверяет
+        # заголовок X-Telegram-Bot-Api-Secret-Token (без него — 403)
+        application.run_webhook(
+            listen=config.WEBHOOK_LISTEN,
+            port=config.WEBHOOK_PORT,
+            url_path=config.WEBHOOK_PATH,
+            webhook_url=config.WEBHOOK_URL or None,
+            secret_token=config.WEBHOOK_SECRET_TOKEN,
+        )
+    else:
+        # updater.start_polling()
+        application.run_polling()
 
 
 if __name__ == '__main__':
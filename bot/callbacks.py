@@ -0,0 +1,113 @@
+import logging
+from typing import Callable, Dict, List, NamedTuple, Optional, Tuple
+
+from telegram import Update
+from telegram.ext import CallbackContext
+
+logger = logging.getLogger(__name__)
+
+"""
+Маршрутизация нажатий inline-кнопок.
+
+callback_data кодируется как "<код>:<значение>:<значение>...": код определяет действие,
+значения — его параметры. Действия без параметров — это просто их код (например, 'buy'),
+поэтому старые постоянные кнопки кодировать не нужно. Таблица действий собирается один раз
+при запуске; нажатие разбирается одним split и находится в словаре по коду.
+"""
+
+SEPARATOR = ':'
+# Ограничение Telegram на длину callback_data в байтах
+MAX_CALLBACK_DATA = 64
+
+# Коды действий с параметрами
+SELECT_DIALOG = 'dlg'   # dialog_id
+SET_ROLE = 'role'       # role, dialog_id
+SET_MODEL = 'model'     # model
+DIALOG_PAGE = 'page'    # direction ('next' | 'prev'), cursor
+
+
+def encode_callback(code: str, *values) -> str:
+    """
+    Собирает callback_data из кода действия и значений параметров.
+
+    Args:
+        code (str): Код действия.
+        *values: Значения параметров в порядке их объявления.
+
+    Returns:
+        str: callback_data не длиннее 64 байт.
+    """
+    parts = [code, *map(str, values)]
+    if any(SEPARATOR in part for part in parts):
+        raise ValueError(f"Значение callback_data не может содержать '{SEPARATOR}': {parts}")
+    data = SEPARATOR.join(parts)
+    if len(data.encode()) > MAX_CALLBACK_DATA:
+        raise ValueError(f"callback_data длиннее {MAX_CALLBACK_DATA} байт: {data}")
+    return data
+
+
+def decode_callback(data: str) -> Tuple[str, List[str]]:
+    """Разбирает callback_data на код действия и строковые значения параметров."""
+    code, *values = data.split(SEPARATOR)
+    return code, values
+
+
+class CallbackAction(NamedTuple):
+    handler: Callable
+    params: Tuple[Tuple[str, type], ...]
+
+
+class CallbackRouter:
+    """
+    Таблица действий inline-кнопок: код -> обработчик и типы его параметров.
+
+    Обработчик вызывается как handler(update, context, **params) с уже приведенными
+    к своим типам параметрами. На запрос отвечает роутер, обработчикам это делать не нужно.
+    """
+
+    def __init__(self):
+        self._actions: Dict[str, CallbackAction] = {}
+
+    def add(self, code: str, handler: Callable, **params: type):
+        """
+        Регистрирует действие.
+
+        Args:
+            code (str): Код действия (для действий без параметров — вся callback_data).
+            handler (Callable): Асинхронный обработчик.
+            **params: Имена и типы параметров в порядке их следования в callback_data.
+        """
+        if code in self._actions:
+            raise ValueError(f"Действие '{code}' уже зарегистрировано")
+        self._actions[code] = CallbackAction(handler, tuple(params.items()))
+
+    def resolve(self, data: str) -> Optional[Tuple[Callable, dict]]:
+        """
+        Находит обработчик и параметры для callback_data.
+
+        Returns:
+            Optional[Tuple[Callable, dict]]: (обработчик, параметры) или None, если данные не распознаны.
+        """
+        code, values = decode_callback(data)
+        action = self._actions.get(code)
+        if action is None or len(values) != len(action.params):
+            return None
+        try:
+            params = {name: kind(value) for (name, kind), value in zip(action.params, values)}
+        except ValueError:
+            return None
+        return action.handler, params
+
+    async def dispatch(self, update: Update, context: CallbackContext):
+        """Обработчик CallbackQueryHandler: отвечает на запрос и вызывает действие кнопки."""
+        query = update.callback_query
+        await query.answer()  # Обязательно отвечаем на запрос
+
+        resolved = self.resolve(query.data or '')
+        if resolved is None:
+            logger.info("Неизвестная callback_data: %r", query.data)
+            await query.edit_message_text("Неизвестное действие")
+            return
+
+        handler, params = resolved
+        await handler(update, context, **params)
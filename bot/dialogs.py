@@ -1,16 +1,15 @@
-from telegram import Update
+from telegram import InlineKeyboardMarkup, Update
 from telegram.ext import CallbackContext
 from keyboard import (
-    main_menu_keyboard, buy_menu_keyboard, dialog_menu_keyboard, subscriptions_keyboard, create_dialog_keyboard,
-    dialog_settings_keyboard, choose_dialog_keyboard, mode_choose_keyboard, dialog_create_model_choose_keyboard,
-    dialog_create_role_choose_keyboard, model_choose_keyboard, ddddd_keyboard, dialog_change_role_choose_keyboard
+    main_menu_keyboard, buy_menu_keyboard, dialog_menu_keyboard, subscriptions_keyboard,
+    dialog_settings_keyboard, mode_choose_keyboard, model_choose_keyboard
 )
 import logging
-from data_access.database import get_session
-from business_logic.user_management import UserManager
+from business_logic.user_management import AsyncUserManager
+from callbacks import CallbackRouter, DIALOG_PAGE, SELECT_DIALOG, SET_MODEL, SET_ROLE
 from handlers import (
     handle_create_dialog_settings, create_dialog_list, handle_subscription_1, handle_button_click,
-    set_role_callback, handle_model_choose_keyboard
+    set_role_callback, handle_model_choose_keyboard, handle_dialog_page, handle_select_dialog, handle_role_choose
 )
 
 # Определяем этапы
@@ -26,97 +25,69 @@ async def start(update: Update, context: CallbackContext):
     user_id = str(update.effective_user.id)
     username = update.effective_user.username or "Неизвестный пользователь"
 
-    # Получаем сессию базы данных
-    session = get_session()
-    user_manager = UserManager(session)
-
-    try:
-        # Пробуем зарегистрировать пользователя
-        new_user = user_manager.register_user(user_name=username, telegram_id=user_id)
-        # Отправляем приветственное сообщение пользователю
-        await update.message.reply_text(f"Добро пожаловать, {new_user.user_name}! Вы успешно зарегистрированы.")
-    except ValueError as e:
-        # Обработка ошибки, если пользователь уже существует
-        await update.message.reply_text(f"Ошибка: {str(e)}")
-    finally:
-        session.close()
+    # Сессия базы данных текущего обновления
+    user_manager = AsyncUserManager(context.db_session)
+
+    # Регистрируем пользователя (или получаем уже зарегистрированного) одним запросом
+    user, created = await user_manager.register_user(user_name=username, telegram_id=user_id)
+
+    # Отправляем приветственное сообщение пользователю
+    if created:
+        await update.message.reply_text(f"Добро пожаловать, {user.user_name}! Вы успешно зарегистрированы.")
+    else:
+        await update.message.reply_text(f"С возвращением, {user.user_name}!")
 
     # Предлагаем пользователю выбрать опцию из основного меню
 
     await update.message.reply_text("Выберите опцию:", reply_markup=main_menu_keyboard())
 
 
+def show_menu(text: str, keyboard: InlineKeyboardMarkup):
+    """Обработчик кнопки, которая только показывает постоянное меню."""
+
+    async def handler(update: Update, context: CallbackContext):
+        await update.callback_query.edit_message_text(text, reply_markup=keyboard)
+
+    return handler
+
+
+async def show_text(update: Update, context: CallbackContext):
+    await update.callback_query.edit_message_text('ведение диалога')
+
+
+# Действия inline-кнопок; таблица собирается один раз при импорте
+callback_router = CallbackRouter()
+
+callback_router.add('buy', show_menu("Выберите действие:", buy_menu_keyboard()))
+callback_router.add('create_choose_dialog', show_menu('че то там', dialog_menu_keyboard()))
+callback_router.add('subscriptions', show_menu('че то там', subscriptions_keyboard()))
+
+callback_router.add('create_dialog', handle_create_dialog_settings)
+callback_router.add('start_dialog_settings', handle_create_dialog_settings)
+callback_router.add('choose_dialog', create_dialog_list)
+callback_router.add(SELECT_DIALOG, handle_select_dialog, dialog_id=int)
+callback_router.add(DIALOG_PAGE, handle_dialog_page, direction=str, cursor=int)
+
+for plan in ('basic', 'premium', 'unlimited'):
+    callback_router.add(plan, handle_subscription_1)
+
+callback_router.add('conduct_dialog', show_menu('че то там', mode_choose_keyboard()))
+callback_router.add('settings_dialog', show_menu('че то там', dialog_settings_keyboard()))
+callback_router.add('reset_dialog', handle_button_click)
+
+callback_router.add('text', show_text)
+callback_router.add('image', show_text)
+
+callback_router.add('model_choose', show_menu('че то там', model_choose_keyboard()))
+callback_router.add('role_choose', handle_role_choose)
+
+for model in ('gpt_4o_create', 'gpt_4o_mini_create', 'o1_create', 'o1_mini_create'):
+    callback_router.add(model, handle_create_dialog_settings)
+
+callback_router.add(SET_MODEL, handle_model_choose_keyboard, model=str)
+callback_router.add(SET_ROLE, set_role_callback, role=str, dialog_id=int)
+
+
 async def button_callback(update: Update, context: CallbackContext):
-    query = update.callback_query
-    await query.answer()  # Обязательно отвечаем на запрос
-
-    # Если выбрали диалог, извлекаем dialog_id
-    if query.data.startswith('dialog_'):
-        dialog_id = query.data.split('_')[1]  # Извлекаем ID диалога
-        context.user_data['current_dialog_id'] = dialog_id  # Сохраняем dialog_id в контексте
-
-        # Переходим к следующей клавиатуре
-        await query.edit_message_text("Выберите действие для диалога:", reply_markup=ddddd_keyboard())
-        return
-
-    # Словарь для сопоставления данных кнопок с действиями
-    actions = {
-        'buy': lambda: query.edit_message_text("Выберите действие:",
-                                               reply_markup=buy_menu_keyboard()),
-        'create_choose_dialog': lambda: query.edit_message_text('че то там',
-                                                                reply_markup=dialog_menu_keyboard()),
-
-        'subscriptions': lambda: query.edit_message_text('че то там',
-                                                        reply_markup=subscriptions_keyboard()),
-
-        'create_dialog': lambda: handle_create_dialog_settings(update, context),
-        'choose_dialog': lambda: create_dialog_list(update, context),
-
-        'basic': lambda: handle_subscription_1(update, context),
-        'premium': lambda: handle_subscription_1(update, context),
-        'unlimited': lambda: handle_subscription_1(update, context),
-
-        'conduct_dialog': lambda: query.edit_message_text('че то там',
-                                                          reply_markup=mode_choose_keyboard()),
-        'settings_dialog': lambda: query.edit_message_text('че то там',
-                                                           reply_markup=dialog_settings_keyboard()),
-        'reset_dialog': lambda: query.edit_message_text('че то там',
-                                                        reply_markup=handle_button_click(update, context)),
-
-        'text': lambda: query.edit_message_text('ведение диалога'),
-        'image': lambda: query.edit_message_text('ведение диалога'),
-
-        'model_choose': lambda: query.edit_message_text('че то там',
-                                                        reply_markup=model_choose_keyboard()),
-        'role_choose': lambda: query.edit_message_text('че то там',
-                                                       reply_markup=dialog_change_role_choose_keyboard(context.user_data.get('current_dialog_id'))),
-
-        'gpt_4o_mini_create': lambda: handle_create_dialog_settings(update, context),
-        'gpt_4o_create': lambda: handle_create_dialog_settings(update, context),
-        'o1_mini_create': lambda: handle_create_dialog_settings(update, context),
-        'o1_create': lambda: handle_create_dialog_settings(update, context),
-
-        'gpt_4o_mini': lambda: handle_model_choose_keyboard(update, context),
-        'gpt_4o': lambda: handle_model_choose_keyboard(update, context),
-        'o1_mini': lambda: handle_model_choose_keyboard(update, context),
-        'o1': lambda: handle_model_choose_keyboard(update, context),
-
-        'role_1': lambda: set_role_callback(update, context),
-        'role_2': lambda: set_role_callback(update, context)
-    }
-
-    # Получаем действие из словаря по значению query.data, если оно существует
-    action = actions.get(query.data)
-
-    # Если действие найдено, выполняем его
-    if action:
-        await action()
-    elif query.data.startswith('dialog_'):
-        dialog_id = query.data.split('_')[1]  # Извлекаем ID диалога
-        context.user_data['current_dialog_id'] = dialog_id  # Сохраняем dialog_id в контексте
-
-        # Переходим к следующей клавиатуре
-        await query.edit_message_text("Выберите действие для диалога:", reply_markup=ddddd_keyboard())
-        return
-    else:
-        await query.edit_message_text("Неизвестное действие")  # Обработка случая, если действие не найдено
+    # Все нажатия inline-кнопок проходят через таблицу действий
+    await callback_router.dispatch(update, context)
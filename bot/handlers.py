@@ -2,12 +2,17 @@ from telegram import Update
 from telegram.ext import (CallbackContext)
 from keyboard import (
     dialog_create_model_choose_keyboard, dialog_create_role_choose_keyboard, choose_dialog_keyboard,
-    create_dialog_keyboard
+    create_dialog_keyboard, ddddd_keyboard, dialog_change_role_choose_keyboard
 )
-from data_access.database import get_session
-from business_logic.user_management import UserManager
-from business_logic.dialog_management import DialogManager
-from business_logic.subscription_management import SubscriptionManager
+from business_logic.user_management import AsyncUserManager
+from business_logic.dialog_management import AsyncDialogManager
+from business_logic.message_sink import message_sink
+from business_logic.quota import quota_engine
+from business_logic.entitlements import entitlements
+from business_logic.llm_scheduler import FREE_TIER
+from business_logic.subscription_management import AsyncSubscriptionManager
+from external_integrations.openai_integration import build_prompt, stream_openai_response
+from streaming import ThrottledEditor
 
 
 async def handle_create_dialog_settings(update: Update, context: CallbackContext):
@@ -20,7 +25,6 @@ async def handle_create_dialog_settings(update: Update, context: CallbackContext
     """
 
     query = update.callback_query
-    await query.answer()  # Обязательно отвечаем на callback_query
 
     # Проверяем, что это первый вызов функции
     if query.data == 'create_dialog':  # Предположим, что это действие для начала
@@ -44,18 +48,56 @@ async def create_dialog_list(update: Update, context: CallbackContext):
     """
 
     telegram_id = str(update.effective_user.id)
-    session = get_session()
-    user_manager = UserManager(session)
-    user = user_manager.get_user_by_telegram_id(telegram_id)
-    user_id = user.user_id
+    user_manager = AsyncUserManager(context.db_session)
+    user_id = await user_manager.get_user_id_by_telegram_id(telegram_id)
 
-    # Создаем клавиатуру
-    keyboard = choose_dialog_keyboard(user_id)
+    # Первая страница диалогов пользователя (из кэша, если список не менялся)
+    dialog_manager = AsyncDialogManager(context.db_session)
+    keyboard = choose_dialog_keyboard(await dialog_manager.get_dialog_page(user_id))
 
     # Отправляем клавиатуру пользователю
     await update.callback_query.message.reply_text("Выберите диалог:", reply_markup=keyboard)
 
 
+async def handle_dialog_page(update: Update, context: CallbackContext, direction: str, cursor: int):
+    """
+    Листает список диалогов
+
+    :param update: Update
+    :param context: CallbackContext
+    :param direction: 'next' — вперед, 'prev' — назад
+    :param cursor: Крайний dialog_id текущей страницы
+    :return: InlineKeyboardMarkup
+    """
+
+    query = update.callback_query
+    user_id = await AsyncUserManager(context.db_session).get_user_id_by_telegram_id(str(update.effective_user.id))
+
+    dialog_manager = AsyncDialogManager(context.db_session)
+    if direction == 'next':
+        page = await dialog_manager.get_dialog_page(user_id, after=cursor)
+    else:
+        page = await dialog_manager.get_dialog_page(user_id, before=cursor)
+
+    await query.edit_message_reply_markup(reply_markup=choose_dialog_keyboard(page))
+
+
+async def handle_select_dialog(update: Update, context: CallbackContext, dialog_id: int):
+    """
+    Делает диалог текущим и показывает действия с ним
+
+    :param update: Update
+    :param context: CallbackContext
+    :param dialog_id: Идентификатор выбранного диалога
+    :return: InlineKeyboardMarkup
+    """
+
+    context.user_data['current_dialog_id'] = dialog_id  # Сохраняем dialog_id в контексте
+
+    # Переходим к следующей клавиатуре
+    await update.callback_query.edit_message_text("Выберите действие для диалога:", reply_markup=ddddd_keyboard())
+
+
 async def handle_subscription_1(update: Update, context: CallbackContext):
     """
     Осуществляет добавление подписки
@@ -71,34 +113,28 @@ async def handle_subscription_1(update: Update, context: CallbackContext):
     # Получение user_id (id telegram)
     telegram_id = str(update.effective_user.id)
 
-    # Начало сессии БД
-    session = get_session()
-
-    # Объект менеджера пользователя
-    user_manager = UserManager(session)
-    # Получение пользователя по telegram_id
-    user = user_manager.get_user_by_telegram_id(telegram_id)
-    user_id = user.user_id
+    # Объект менеджера пользователя (сессия БД — общая для всего обновления)
+    user_manager = AsyncUserManager(context.db_session)
+    # Получение идентификатора пользователя по telegram_id (из кэша, если есть)
+    user_id = await user_manager.get_user_id_by_telegram_id(telegram_id)
 
     # Объект менеджера подписок
-    sub_manager = SubscriptionManager(session)
-    sub = sub_manager.has_active_subscription(user_id, plan=plan)
+    sub_manager = AsyncSubscriptionManager(context.db_session)
+    # Действующая подписка — из снимка прав (менеджер подписок сбрасывает его при изменениях)
+    sub = (await entitlements.get(context.db_session, user_id)).plan is not None
 
     # Если подписка есть - удалить и добавить новую, если нет - добавить новую
     if sub == True:
-        sub_manager.remove_subscription(user_id)
-        sub_manager.add_subscription(user_id, plan, 30)
+        await sub_manager.remove_subscription(user_id)
+        await sub_manager.add_subscription(user_id, plan, 30)
     else:
-        sub_manager.add_subscription(user_id, plan, 30)
-
-    session.commit()
-    session.close()
+        await sub_manager.add_subscription(user_id, plan, 30)
 
     query = update.callback_query
     await query.edit_message_text("Подписка 1")
 
 
-def handle_button_click(update: Update, context: CallbackContext):
+async def handle_button_click(update: Update, context: CallbackContext):
     """
     Осуществляет сброс контекста
 
@@ -108,97 +144,141 @@ def handle_button_click(update: Update, context: CallbackContext):
     """
 
     query = update.callback_query
-    query.answer()
 
-    if query.data == 'dialog_reset':
+    if query.data in ('dialog_reset', 'reset_dialog'):
         # Сбрасываем контекст
         context.user_data['ignore_history'] = True
-        query.edit_message_text(text="Контекст сброшен. Вы можете начать новый диалог.",
-                                reply_markup=create_dialog_keyboard())
+        await query.edit_message_text(text="Контекст сброшен. Вы можете начать новый диалог.",
+                                      reply_markup=create_dialog_keyboard())
     else:
         # Обработка других кнопок
-        query.edit_message_text(text=f"Вы нажали кнопку: {query.data}", reply_markup=create_dialog_keyboard())
+        await query.edit_message_text(text=f"Вы нажали кнопку: {query.data}", reply_markup=create_dialog_keyboard())
 
 
-async def set_role_callback(update: Update, context: CallbackContext):
+async def handle_role_choose(update: Update, context: CallbackContext):
     """
-    Осуществляет выбор роли
+    Показывает выбор роли для текущего диалога
 
     :param update: Update
     :param context: CallbackContext
-    :return: Message
+    :return: InlineKeyboardMarkup
     """
 
     query = update.callback_query
-    await query.answer()
 
-    # Извлекаем dialog_id и выбранную роль
     dialog_id = context.user_data.get('current_dialog_id')
     if not dialog_id:
         await query.edit_message_text("Ошибка: ID диалога не найден.")
         return
 
-    parts = query.data.split('_')
-    if len(parts) < 3:
-        await query.edit_message_text("Ошибка: некорректный формат callback_data.")
-        return
+    await query.edit_message_text('че то там', reply_markup=dialog_change_role_choose_keyboard(int(dialog_id)))
+
 
-    role_prefix, selected_role, dialog_id = parts
-    selected_role = f"{role_prefix}_{selected_role}"  # Получим, например, "role_1".
+async def set_role_callback(update: Update, context: CallbackContext, role: str, dialog_id: int):
+    """
+    Осуществляет выбор роли
+
+    :param update: Update
+    :param context: CallbackContext
+    :param role: Выбранная роль, например "role_1"
+    :param dialog_id: Идентификатор диалога из кнопки
+    :return: Message
+    """
+
+    query = update.callback_query
+    selected_role = role
 
     # Обновляем роль в базе данных
-    session = get_session()
-    dialog_manager = DialogManager(session)
-    dialog_manager.update_dialog(dialog_id=dialog_id, role_type=selected_role)
+    dialog_manager = AsyncDialogManager(context.db_session)
+    await dialog_manager.update_dialog(dialog_id=dialog_id, role_type=selected_role)
 
     await query.edit_message_text(f"Роль для диалога {dialog_id} изменена на: {selected_role}.")
 
 
-async def handle_model_choose_keyboard(update: Update, context: CallbackContext):
+async def handle_model_choose_keyboard(update: Update, context: CallbackContext, model: str):
     """
-    Осуществляет выбор модели
+    Осуществляет выбор модели для текущего диалога
 
     :param update: Update
     :param context: CallbackContext
+    :param model: Выбранная модель (bot_type), например "gpt_4o_mini"
     :return: Message
     """
 
     query = update.callback_query
-    await query.answer()
 
-    # Извлекаем dialog_id и выбранную модель
     dialog_id = context.user_data.get('current_dialog_id')
     if not dialog_id:
         await query.edit_message_text("Ошибка: ID диалога не найден.")
         return
+    dialog_id = int(dialog_id)
 
-    parts = query.data.split('_')
-    if len(parts) < 2:
-        await query.edit_message_text("Ошибка: некорректный формат callback_data.")
+    # Обновляем диалог с выбранной моделью
+    dialog_manager = AsyncDialogManager(context.db_session)
+    try:
+        await dialog_manager.update_dialog(dialog_id=dialog_id, bot_type=model)
+    except ValueError:
+        await query.edit_message_text("Ошибка: диалог не найден.")
         return
 
-    model_prefix, selected_model = parts
-    selected_model = f"{model_prefix}_{selected_model}"  # Например, "model_1".
+    await query.edit_message_text(f"Выбрана модель: {model} для диалога {dialog_id}.")
 
-    # Получаем информацию о пользователе
-    telegram_id = str(update.effective_user.id)
-    session = get_session()
-    user_manager = UserManager(session)
-    user = user_manager.get_user_by_telegram_id(telegram_id)
-    user_id = user.user_id
 
-    # Получаем диалоги пользователя
-    dialog_manager = DialogManager(session)
-    dialogs = dialog_manager.get_user_dialogs(user_id)
+async def handle_text_message(update: Update, context: CallbackContext):
+    """
+    Ведение диалога: отправляет сообщение модели и показывает ответ по мере генерации
+
+    :param update: Update
+    :param context: CallbackContext
+    :return: Message
+    """
 
-    if not dialogs:
-        await query.edit_message_text("Ошибка: диалоги пользователя не найдены.")
+    dialog_id = context.user_data.get('current_dialog_id')
+    if not dialog_id:
+        await update.message.reply_text("Сначала выберите диалог.")
         return
+    dialog_id = int(dialog_id)
 
-    dialog = dialogs[0]  # Предполагаем, что мы берем первый диалог
-    dialog_id = dialog.dialog_id
+    user_message = update.message.text
+    ignore_history = context.user_data.get('ignore_history', False)
 
-    # Обновляем диалог с выбранной моделью
-    dialog_manager.update_dialog(dialog_id=dialog_id, bot_type=selected_model)
+    user_manager = AsyncUserManager(context.db_session)
+    user_id = await user_manager.get_user_id_by_telegram_id(str(update.effective_user.id))
 
-    await query.edit_message_text(f"Выбрана модель: {selected_model} для диалога {dialog_id}.")
+    dialog_manager = AsyncDialogManager(context.db_session)
+    dialog = await dialog_manager.get_dialog_by_id(dialog_id)
+    if dialog is None:
+        await update.message.reply_text("Ошибка: диалог не найден.")
+        return
+
+    dialog_history = '' if ignore_history else await dialog_manager.get_dialog_history(dialog_id)
+    # Тариф определяет место запроса в очереди к модели (снимок прав в памяти)
+    tier = (await entitlements.get(context.db_session, user_id)).plan or FREE_TIER
+    # Лимит подписки и частота запросов проверяются в памяти
+    decision = await quota_engine.consume(context.db_session, user_id)
+    if not decision.allowed:
+        if decision.reason == 'rate':
+            await update.message.reply_text(
+                f"Слишком много запросов. Попробуйте через {max(1, round(decision.retry_after))} с.")
+        else:
+            await update.message.reply_text("Лимит запросов по вашей подписке исчерпан.")
+        return
+    # Чтение закончено: освобождаем соединение, чтобы не держать его из пула все время генерации
+    await context.db_session.commit()
+
+    # Заглушка, которую будем редактировать по мере поступления ответа
+    placeholder = await update.message.reply_text("…")
+    editor = ThrottledEditor(placeholder)
+
+    response_text = ''
+    # Ответ на запрос без истории зависит только от модели, роли и текста — его можно взять из кэша
+    async for delta in stream_openai_response(build_prompt(dialog_history, user_message, ignore_history),
+                                              dialog.bot_type, user_id=user_id, tier=tier,
+                                              role=dialog.role_type, use_cache=not dialog_history):
+        response_text += delta
+        await editor.update(response_text)
+    await editor.finish(response_text)
+
+    # Сообщение пользователя и ответ ставим в очередь на пакетную запись, после окончания генерации
+    await message_sink.enqueue(dialog_id, user_id, user_message)
+    await message_sink.enqueue(dialog_id, user_id, response_text)
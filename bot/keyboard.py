@@ -1,137 +1,167 @@
+from functools import lru_cache
+
 from telegram import InlineKeyboardMarkup, InlineKeyboardButton
-from business_logic.dialog_management import DialogManager
-from business_logic.user_management import UserManager
-from data_access.database import get_session
-from telegram.ext import CallbackContext
+
+from callbacks import DIALOG_PAGE, SELECT_DIALOG, SET_MODEL, SET_ROLE, encode_callback
+
+# Постоянные клавиатуры собираются один раз при импорте модуля. InlineKeyboardMarkup
+# неизменяем, поэтому один экземпляр безопасно отдавать во все обработчики.
+
+MAIN_MENU_KEYBOARD = InlineKeyboardMarkup((
+    (InlineKeyboardButton("Купить", callback_data='buy'),),
+    (InlineKeyboardButton("Создать/настроить диалог", callback_data='create_choose_dialog'),),
+))
+
+BUY_MENU_KEYBOARD = InlineKeyboardMarkup((
+    (InlineKeyboardButton('Подписки', callback_data='subscriptions'),),
+    (InlineKeyboardButton('Назад', callback_data='back'),),
+))
+
+DIALOG_MENU_KEYBOARD = InlineKeyboardMarkup((
+    (InlineKeyboardButton('Создать диалог', callback_data='create_dialog'),),
+    (InlineKeyboardButton('Выбрать диалог', callback_data='choose_dialog'),),
+    (InlineKeyboardButton('Назад', callback_data='back'),),
+))
+
+SUBSCRIPTIONS_KEYBOARD = InlineKeyboardMarkup((
+    (InlineKeyboardButton('Подписка База', callback_data='basic'),),
+    (InlineKeyboardButton('Подписка Премиум', callback_data='premium'),),
+    (InlineKeyboardButton('Подписка Безлимит', callback_data='unlimited'),),
+    (InlineKeyboardButton('Назад', callback_data='back'),),
+))
+
+CREATE_DIALOG_KEYBOARD = InlineKeyboardMarkup((
+    (InlineKeyboardButton('Настроить диалог', callback_data='dialog_settings'),),
+    (InlineKeyboardButton('Назад', callback_data='back'),),
+))
+
+DIALOG_SETTINGS_KEYBOARD = InlineKeyboardMarkup((
+    (InlineKeyboardButton('Выбор модели', callback_data='model_choose'),),
+    (InlineKeyboardButton('Выбор роли', callback_data='role_choose'),),
+    (InlineKeyboardButton('Объем диалога', callback_data='dialog_volume'),),
+    (InlineKeyboardButton('Назад', callback_data='back'),),
+))
+
+DIALOG_CREATE_MODEL_CHOOSE_KEYBOARD = InlineKeyboardMarkup((
+    (InlineKeyboardButton('GPT 4o', callback_data='gpt_4o_create'),),
+    (InlineKeyboardButton('GPT 4o mini', callback_data='gpt_4o_mini_create'),),
+    (InlineKeyboardButton('o1', callback_data='o1_create'),),
+    (InlineKeyboardButton('o1 mini', callback_data='o1_mini_create'),),
+    (InlineKeyboardButton('Назад', callback_data='back'),),
+))
+
+DIALOG_CREATE_ROLE_CHOOSE_KEYBOARD = InlineKeyboardMarkup((
+    (InlineKeyboardButton('Роль 1', callback_data='role_1_create'),),
+    (InlineKeyboardButton('Роль 2', callback_data='role_2_create'),),
+    (InlineKeyboardButton('Назад', callback_data='back'),),
+))
+
+MODEL_CHOOSE_KEYBOARD = InlineKeyboardMarkup((
+    (InlineKeyboardButton('GPT 4o', callback_data=encode_callback(SET_MODEL, 'gpt_4o')),),
+    (InlineKeyboardButton('GPT 4o mini', callback_data=encode_callback(SET_MODEL, 'gpt_4o_mini')),),
+    (InlineKeyboardButton('o1', callback_data=encode_callback(SET_MODEL, 'o1')),),
+    (InlineKeyboardButton('o1 mini', callback_data=encode_callback(SET_MODEL, 'o1_mini')),),
+    (InlineKeyboardButton('Назад', callback_data='back'),),
+))
+
+MODE_CHOOSE_KEYBOARD = InlineKeyboardMarkup((
+    (InlineKeyboardButton('Текст', callback_data='text'),),
+    (InlineKeyboardButton('Изображения', callback_data='image'),),
+    (InlineKeyboardButton('Назад', callback_data='back'),),
+))
+
+DDDDD_KEYBOARD = InlineKeyboardMarkup((
+    (InlineKeyboardButton('Ведение диалога', callback_data='conduct_dialog'),),
+    (InlineKeyboardButton('Настроить диалог', callback_data='settings_dialog'),),
+    (InlineKeyboardButton('Сбросить диалог', callback_data='reset_dialog'),),
+    (InlineKeyboardButton('Назад', callback_data='back'),),
+))
+
+EMPTY_KEYBOARD = InlineKeyboardMarkup(())
 
 
 def main_menu_keyboard():
-    keyboard = [
-        [InlineKeyboardButton("Купить", callback_data='buy')],
-        [InlineKeyboardButton("Создать/настроить диалог", callback_data='create_choose_dialog')]
-    ]
-    return InlineKeyboardMarkup(keyboard)
+    return MAIN_MENU_KEYBOARD
 
 
 def buy_menu_keyboard():
-    keyboard = [
-        [InlineKeyboardButton('Подписки', callback_data='subscriptions')],
-        [InlineKeyboardButton('Назад', callback_data='back')]
-    ]
-    return InlineKeyboardMarkup(keyboard)
+    return BUY_MENU_KEYBOARD
 
 
 def dialog_menu_keyboard():
-    keyboard = [
-        [InlineKeyboardButton('Создать диалог', callback_data='create_dialog')],
-        [InlineKeyboardButton('Выбрать диалог', callback_data='choose_dialog')],
-        [InlineKeyboardButton('Назад', callback_data='back')]
-    ]
-    return InlineKeyboardMarkup(keyboard)
+    return DIALOG_MENU_KEYBOARD
 
 
 def subscriptions_keyboard():
-    keyboard = [
-        [InlineKeyboardButton('Подписка База', callback_data='basic')],
-        [InlineKeyboardButton('Подписка Премиум', callback_data='premium')],
-        [InlineKeyboardButton('Подписка Безлимит', callback_data='unlimited')],
-        [InlineKeyboardButton('Назад', callback_data='back')]
-    ]
-    return InlineKeyboardMarkup(keyboard)
+    return SUBSCRIPTIONS_KEYBOARD
 
 
 def create_dialog_keyboard():
-    keyboard = [
-        [InlineKeyboardButton('Настроить диалог', callback_data='dialog_settings')],
-        [InlineKeyboardButton('Назад', callback_data='back')]
-    ]
-    return InlineKeyboardMarkup(keyboard)
+    return CREATE_DIALOG_KEYBOARD
 
 
 def dialog_settings_keyboard():
-    keyboard = [
-        [InlineKeyboardButton('Выбор модели', callback_data='model_choose')],
-        [InlineKeyboardButton('Выбор роли', callback_data='role_choose')],
-        [InlineKeyboardButton('Объем диалога', callback_data='dialog_volume')],
-        [InlineKeyboardButton('Назад', callback_data='back')]
-    ]
-    return InlineKeyboardMarkup(keyboard)
+    return DIALOG_SETTINGS_KEYBOARD
 
 
 def dialog_create_model_choose_keyboard():
-    keyboard = [
-        [InlineKeyboardButton('GPT 4o', callback_data='gpt_4o_create')],
-        [InlineKeyboardButton('GPT 4o mini', callback_data='gpt_4o_mini_create')],
-        [InlineKeyboardButton('o1', callback_data='o1_create')],
-        [InlineKeyboardButton('o1 mini', callback_data='o1_mini_create')],
-        [InlineKeyboardButton('Назад', callback_data='back')]
-    ]
-    return InlineKeyboardMarkup(keyboard)
+    return DIALOG_CREATE_MODEL_CHOOSE_KEYBOARD
 
 
 def dialog_create_role_choose_keyboard():
-    keyboard = [
-        [InlineKeyboardButton('Роль 1', callback_data='role_1_create')],
-        [InlineKeyboardButton('Роль 2', callback_data='role_2_create')],
-        [InlineKeyboardButton('Назад', callback_data='back')]
-    ]
-    return InlineKeyboardMarkup(keyboard)
+    return DIALOG_CREATE_ROLE_CHOOSE_KEYBOARD
 
 
-def dialog_change_role_choose_keyboard(dialog_id: str) -> InlineKeyboardMarkup:
-    keyboard = [
-        [InlineKeyboardButton('Роль 1', callback_data=f'role_1_{dialog_id}')],
-        [InlineKeyboardButton('Роль 2', callback_data=f'role_2_{dialog_id}')],
-        [InlineKeyboardButton('Назад', callback_data=f'back_{dialog_id}')]
-    ]
+@lru_cache(maxsize=4096)
+def dialog_change_role_choose_keyboard(dialog_id: int) -> InlineKeyboardMarkup:
+    # Зависит только от dialog_id — собранные клавиатуры переиспользуются
+    keyboard = (
+        (InlineKeyboardButton('Роль 1', callback_data=encode_callback(SET_ROLE, 'role_1', dialog_id)),),
+        (InlineKeyboardButton('Роль 2', callback_data=encode_callback(SET_ROLE, 'role_2', dialog_id)),),
+        (InlineKeyboardButton('Назад', callback_data='back'),),
+    )
     return InlineKeyboardMarkup(keyboard)
 
 
 def model_choose_keyboard():
-    keyboard = [
-        [InlineKeyboardButton('GPT 4o', callback_data='gpt_4o')],
-        [InlineKeyboardButton('GPT 4o mini', callback_data='gpt_4o_mini')],
-        [InlineKeyboardButton('o1', callback_data='o1')],
-        [InlineKeyboardButton('o1 mini', callback_data='o1_mini')],
-        [InlineKeyboardButton('Назад', callback_data='back')]
-    ]
-    return InlineKeyboardMarkup(keyboard)
+    return MODEL_CHOOSE_KEYBOARD
 
 
-def choose_dialog_keyboard(user_id: int) -> InlineKeyboardMarkup:
-    session = get_session()  # Получаем сессию
-    dialog_manager = DialogManager(session)
-    keyboard = []
+def choose_dialog_keyboard(page) -> InlineKeyboardMarkup:
+    """
+    Клавиатура одной страницы списка диалогов.
 
-    # Получаем диалоги пользователя
-    user_dialogs = dialog_manager.get_user_dialogs(user_id)
+    :param page: DialogPage (business_logic.dialog_management)
+    :return: InlineKeyboardMarkup с кнопками диалогов и переходами между страницами
+    """
 
     # Проверяем, есть ли диалоги
-    if not user_dialogs:
-        return InlineKeyboardMarkup([])  # Возвращаем пустую клавиатуру, если нет диалогов
+    if not page.dialogs:
+        return EMPTY_KEYBOARD  # Возвращаем пустую клавиатуру, если нет диалогов
 
-    for index, dialog in enumerate(user_dialogs):
-        title = dialog.title if hasattr(dialog, 'title') else "Без названия"
-        button = InlineKeyboardButton(text=f"Диалог {index + 1}: {title}", callback_data=f"dialog_{dialog.dialog_id}")
-        keyboard.append([button])  # Добавляем кнопку в строку
+    keyboard = [
+        [InlineKeyboardButton(text=f"Диалог {dialog.dialog_id}: {dialog.bot_type}, {dialog.role_type}",
+                              callback_data=encode_callback(SELECT_DIALOG, dialog.dialog_id))]
+        for dialog in page.dialogs
+    ]
+
+    # Курсоры страниц — крайние dialog_id текущей страницы
+    navigation = []
+    if page.has_prev:
+        navigation.append(InlineKeyboardButton(
+            '«', callback_data=encode_callback(DIALOG_PAGE, 'prev', page.dialogs[0].dialog_id)))
+    if page.has_next:
+        navigation.append(InlineKeyboardButton(
+            '»', callback_data=encode_callback(DIALOG_PAGE, 'next', page.dialogs[-1].dialog_id)))
+    if navigation:
+        keyboard.append(navigation)
 
     return InlineKeyboardMarkup(keyboard)
 
 
 def mode_choose_keyboard():
-    keyboard = [
-        [InlineKeyboardButton('Текст', callback_data='text')],
-        [InlineKeyboardButton('Изображения', callback_data='image')],
-        [InlineKeyboardButton('Назад', callback_data='back')]
-    ]
-    return InlineKeyboardMarkup(keyboard)
+    return MODE_CHOOSE_KEYBOARD
 
 
 def ddddd_keyboard():
-    keyboard = [
-        [InlineKeyboardButton('Ведение диалога', callback_data='conduct_dialog')],
-        [InlineKeyboardButton('Настроить диалог', callback_data='settings_dialog')],
-        [InlineKeyboardButton('Сбросить диалог', callback_data='reset_dialog')],
-        [InlineKeyboardButton('Назад', callback_data='back')]
-    ]
-    return InlineKeyboardMarkup(keyboard)
+    return DDDDD_KEYBOARD
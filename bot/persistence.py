@@ -0,0 +1,125 @@
+import json
+import time
+from typing import Dict, Optional, Tuple
+
+from telegram.ext import BasePersistence, PersistenceInput
+
+import config
+from monitoring.metrics import registry
+
+"""
+Хранение context.user_data и context.chat_data вне процесса.
+
+Состояние пользователя загружается лениво — перед обработкой его обновления, а не целиком
+при запуске. Изменения PTB передает пачкой раз в update_interval секунд; запись в хранилище
+выполняется, только если сериализованное состояние действительно изменилось. Пока локальная
+копия содержит незаписанные изменения, она не перечитывается из хранилища.
+"""
+
+USER = 'user'
+CHAT = 'chat'
+
+
+def encode_state(data: dict) -> str:
+    return json.dumps(data, ensure_ascii=False, sort_keys=True, separators=(',', ':'))
+
+
+class StatePersistence(BasePersistence):
+    def __init__(self, store, cache_ttl: float = None, update_interval: float = None):
+        """
+        Args:
+            store: Хранилище из data_access.state_store (load/save/delete/close).
+            cache_ttl (float): Сколько секунд локальная копия считается актуальной;
+                0 — перечитывать перед каждым обновлением (несколько реплик без шардирования).
+            update_interval (float): Период записи изменений в хранилище в секундах.
+        """
+        super().__init__(
+            store_data=PersistenceInput(user_data=True, chat_data=True, bot_data=False, callback_data=False),
+            update_interval=config.STATE_FLUSH_INTERVAL if update_interval is None else update_interval,
+        )
+        self.store = store
+        self.cache_ttl = config.STATE_CACHE_TTL if cache_ttl is None else cache_ttl
+        # (kind, key) -> (последнее загруженное или записанное состояние, когда это было)
+        self._snapshots: Dict[Tuple[str, int], Tuple[str, float]] = {}
+
+    async def _refresh(self, kind: str, key: int, data: dict):
+        snapshot = self._snapshots.get((kind, key))
+        if snapshot is not None:
+            stored, synced_at = snapshot
+            if encode_state(data) != stored:
+                # Локальные изменения еще не записаны — они новее, чем в хранилище
+                return
+            if time.monotonic() - synced_at < self.cache_ttl:
+                return
+
+        stored = await self.store.load(kind, key)
+        registry.counter('state_loads_total', kind=kind).inc()
+        data.clear()
+        if stored:
+            data.update(json.loads(stored))
+        self._snapshots[(kind, key)] = (encode_state(data), time.monotonic())
+
+    async def _update(self, kind: str, key: int, data: dict):
+        encoded = encode_state(data)
+        snapshot = self._snapshots.get((kind, key))
+        if snapshot is not None and snapshot[0] == encoded:
+            # Обновление не изменило состояние — запись не нужна
+            registry.counter('state_writes_skipped_total', kind=kind).inc()
+            return
+        await self.store.save(kind, key, encoded)
+        registry.counter('state_writes_total', kind=kind).inc()
+        self._snapshots[(kind, key)] = (encoded, time.monotonic())
+
+    async def _drop(self, kind: str, key: int):
+        self._snapshots.pop((kind, key), None)
+        await self.store.delete(kind, key)
+
+    # Загрузка при запуске: ничего не читаем, состояние подтягивается по мере обновлений
+    async def get_user_data(self) -> Dict[int, dict]:
+        return {}
+
+    async def get_chat_data(self) -> Dict[int, dict]:
+        return {}
+
+    async def get_bot_data(self) -> dict:
+        return {}
+
+    async def get_callback_data(self) -> Optional[tuple]:
+        return None
+
+    async def get_conversations(self, name: str) -> dict:
+        return {}
+
+    async def refresh_user_data(self, user_id: int, user_data: dict):
+        await self._refresh(USER, user_id, user_data)
+
+    async def refresh_chat_data(self, chat_id: int, chat_data: dict):
+        await self._refresh(CHAT, chat_id, chat_data)
+
+    async def refresh_bot_data(self, bot_data: dict):
+        pass
+
+    async def update_user_data(self, user_id: int, data: dict):
+        await self._update(USER, user_id, data)
+
+    async def update_chat_data(self, chat_id: int, data: dict):
+        await self._update(CHAT, chat_id, data)
+
+    async def update_bot_data(self, data: dict):
+        pass
+
+    async def update_callback_data(self, data: tuple):
+        pass
+
+    async def update_conversation(self, name: str, key: tuple, new_state: Optional[object]):
+        pass
+
+    async def drop_user_data(self, user_id: int):
+        await self._drop(USER, user_id)
+
+    async def drop_chat_data(self, chat_id: int):
+        await self._drop(CHAT, chat_id)
+
+    async def flush(self):
+        # PTB уже записал изменения через update_*_data перед вызовом flush
+        await self.store.close()
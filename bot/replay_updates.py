@@ -0,0 +1,78 @@
+# Повтор записанных обновлений Telegram на webhook бота: локальная проверка и нагрузочные прогоны
+import argparse
+import asyncio
+import json
+import logging
+import time
+from collections import Counter
+from typing import Iterator, List
+
+import httpx
+
+import config
+
+logger = logging.getLogger(__name__)
+
+SECRET_HEADER = 'X-Telegram-Bot-Api-Secret-Token'
+
+
+def read_updates(path: str) -> Iterator[dict]:
+    """Читает обновления из JSONL-файла (один объект Update на строку)."""
+    with open(path, encoding='utf-8') as stream:
+        for line in stream:
+            if line.strip():
+                yield json.loads(line)
+
+
+async def replay(updates: List[dict], url: str, secret_token: str, concurrency: int) -> Counter:
+    """
+    Отправляет обновления POST-запросами, как это делает Telegram.
+
+    Args:
+        updates (List[dict]): Обновления в формате Bot API.
+        url (str): Адрес webhook, например http://127.0.0.1:8443/telegram.
+        secret_token (str): Значение заголовка X-Telegram-Bot-Api-Secret-Token.
+        concurrency (int): Одновременных запросов.
+
+    Returns:
+        Counter: Количество ответов по HTTP-статусам ('error' — запрос не выполнен).
+    """
+    statuses = Counter()
+    semaphore = asyncio.Semaphore(concurrency)
+    headers = {SECRET_HEADER: secret_token} if secret_token else {}
+
+    async with httpx.AsyncClient(limits=httpx.Limits(max_connections=concurrency)) as client:
+        async def send(update: dict):
+            async with semaphore:
+                try:
+                    response = await client.post(url, json=update, headers=headers)
+                    statuses[response.status_code] += 1
+                except httpx.HTTPError as error:
+                    logger.warning("Обновление %s не доставлено: %s", update.get('update_id'), error)
+                    statuses['error'] += 1
+
+        await asyncio.gather(*(send(update) for update in updates))
+    return statuses
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Повтор записанных обновлений Telegram на webhook бота")
+    parser.add_argument('path', help="JSONL-файл с обновлениями")
+    parser.add_argument('--url', default=f"http://127.0.0.1:{config.WEBHOOK_PORT}/{config.WEBHOOK_PATH}",
+                        help="Адрес webhook")
+    parser.add_argument('--secret-token', default=config.WEBHOOK_SECRET_TOKEN, help="Секретный токен webhook")
+    parser.add_argument('--concurrency', type=int, default=10, help="Одновременных запросов")
+    parser.add_argument('--repeat', type=int, default=1, help="Сколько раз повторить файл")
+    args = parser.parse_args()
+
+    updates = list(read_updates(args.path)) * args.repeat
+    started = time.perf_counter()
+    statuses = asyncio.run(replay(updates, args.url, args.secret_token, args.concurrency))
+    elapsed = time.perf_counter() - started
+    logger.info("Отправлено %d обновлений за %.2f с (%.1f/с), ответы: %s",
+                len(updates), elapsed, len(updates) / elapsed if elapsed else 0.0, dict(statuses))
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO)
+    main()
@@ -0,0 +1,71 @@
+import asyncio
+import logging
+import time
+
+from telegram import Message
+from telegram.error import BadRequest, RetryAfter
+
+import config
+
+logger = logging.getLogger(__name__)
+
+# Максимальная длина текста одного сообщения Telegram
+MESSAGE_LIMIT = 4096
+
+
+class ThrottledEditor:
+    """
+    Показывает потоковый ответ модели, редактируя одно сообщение.
+
+    Частые обновления текста объединяются: сообщение редактируется не чаще, чем раз
+    в min_interval секунд, и только если текст изменился. Если Telegram все же ответил
+    RetryAfter, следующее редактирование откладывается на указанное время.
+    """
+
+    def __init__(self, message: Message, min_interval: float = None):
+        """
+        Args:
+            message (Message): Сообщение-заглушка, которое будет редактироваться.
+            min_interval (float): Минимальный интервал между редактированиями в секундах.
+        """
+        self.message = message
+        self.min_interval = config.STREAM_EDIT_INTERVAL if min_interval is None else min_interval
+        self._shown_text = message.text or ''
+        self._next_edit_at = 0.0
+
+    async def update(self, text: str):
+        """Обновляет сообщение, если с прошлого редактирования прошло достаточно времени."""
+        if time.monotonic() >= self._next_edit_at:
+            # Пока ответ не закончен, показываем его хвост, помещающийся в одно сообщение
+            await self._edit(text[-MESSAGE_LIMIT:])
+
+    async def finish(self, text: str):
+        """
+        Показывает окончательный текст. Длинный ответ разбивается на несколько сообщений.
+        """
+        chunks = [text[i:i + MESSAGE_LIMIT] for i in range(0, len(text), MESSAGE_LIMIT)] or ['…']
+        delay = self._next_edit_at - time.monotonic()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        await self._edit(chunks[0], force=True)
+        for chunk in chunks[1:]:
+            await self.message.reply_text(chunk)
+
+    async def _edit(self, text: str, force: bool = False):
+        if not text or text == self._shown_text:
+            return
+        try:
+            await self.message.edit_text(text)
+            self._shown_text = text
+            self._next_edit_at = time.monotonic() + self.min_interval
+        except RetryAfter as e:
+            # В новых версиях python-telegram-bot retry_after — timedelta, в старых — секунды
+            retry_after = e.retry_after if isinstance(e.retry_after, (int, float)) else e.retry_after.total_seconds()
+            self._next_edit_at = time.monotonic() + retry_after
+            if force:
+                # Окончательный текст должен быть показан обязательно
+                await asyncio.sleep(retry_after)
+                await self._edit(text, force=True)
+        except BadRequest as e:
+            # "Message is not modified" и подобные ошибки не мешают продолжать
+            logger.debug("Не удалось отредактировать сообщение: %s", e)
@@ -0,0 +1,267 @@
+import asyncio
+import logging
+import multiprocessing
+import os
+import queue
+import signal
+import time
+from typing import List, Optional
+
+import httpx
+
+import config
+from monitoring.metrics import merge_snapshots, registry
+
+logger = logging.getLogger(__name__)
+
+"""
+Режим с несколькими рабочими процессами (BOT_MODE=supervisor).
+
+Управляющий процесс получает обновления long polling и раскладывает их по очередям рабочих
+процессов по идентификатору пользователя: все обновления одного пользователя попадают в один
+процесс и обрабатываются там по порядку. Каждый рабочий процесс — обычное приложение PTB со
+своим циклом событий, пулом соединений и кэшами.
+
+Рабочие процессы раз в WORKER_HEARTBEAT_INTERVAL присылают heartbeat со снимком своих метрик.
+Heartbeat отправляет отдельная задача цикла событий, поэтому он показывает, что цикл жив, а не
+что процесс успевает за потоком обновлений: занятый, но исправный процесс не перезапускается.
+Упавший процесс или процесс, переставший присылать heartbeat, перезапускается; необработанные
+обновления из его очереди переходят к новому процессу.
+"""
+
+# Максимальное время ожидания getUpdates; между запросами проверяется состояние процессов
+POLL_TIMEOUT = 10
+API_URL = 'https://api.telegram.org'
+
+
+def shard_key(update: dict) -> int:
+    """Пользователь (или чат), к которому относится обновление; иначе — update_id."""
+    for value in update.values():
+        if isinstance(value, dict):
+            for field in ('from', 'user', 'chat'):
+                sender = value.get(field)
+                if isinstance(sender, dict) and 'id' in sender:
+                    return sender['id']
+    return update['update_id']
+
+
+class WorkerHandle:
+    """Рабочий процесс глазами управляющего: очередь, процесс и последний heartbeat."""
+
+    def __init__(self, index: int, updates: multiprocessing.Queue):
+        self.index = index
+        self.updates = updates
+        self.process: Optional[multiprocessing.Process] = None
+        self.last_heartbeat = 0.0
+        self.metrics = {}
+        self.pending = 0      # Обновлений в очереди приложения рабочего процесса (по последнему heartbeat)
+        self.restarts = 0
+
+
+class Supervisor:
+    def __init__(self, workers: int = None, token: str = None):
+        """
+        Args:
+            workers (int): Количество рабочих процессов (по умолчанию BOT_WORKERS).
+            token (str): Токен бота (по умолчанию BOT_TOKEN).
+        """
+        # spawn: рабочий процесс начинает с чистого интерпретатора, без унаследованных соединений БД
+        self._context = multiprocessing.get_context('spawn')
+        self.token = token or config.BOT_TOKEN
+        self.status = self._context.Queue()
+        self.workers: List[WorkerHandle] = [
+            WorkerHandle(index, self._context.Queue(maxsize=config.WORKER_QUEUE_SIZE))
+            for index in range(workers or config.BOT_WORKERS)
+        ]
+        self._offset: Optional[int] = None
+        self._stopping = False
+        self._metrics_logged_at = time.monotonic()
+
+    # --- Рабочие процессы ---
+
+    def _start_worker(self, worker: WorkerHandle):
+        worker.process = self._context.Process(
+            target=run_worker, name=f'bot-worker-{worker.index}', daemon=True,
+            args=(worker.index, worker.updates, self.status, config.WORKER_HEARTBEAT_INTERVAL))
+        worker.process.start()
+        # Время на запуск до первого heartbeat
+        worker.last_heartbeat = time.monotonic()
+        logger.info("Рабочий процесс %d запущен (pid %d)", worker.index, worker.process.pid)
+
+    def _restart_worker(self, worker: WorkerHandle, reason: str):
+        logger.error("Рабочий процесс %d перезапускается: %s", worker.index, reason)
+        if worker.process.is_alive():
+            worker.process.kill()
+        worker.process.join()
+
+        # Очередь, из которой читал убитый процесс, могла остаться заблокированной —
+        # переносим из нее все, что удается забрать, в новую очередь
+        old_updates = worker.updates
+        worker.updates = self._context.Queue(maxsize=config.WORKER_QUEUE_SIZE)
+        moved = 0
+        while True:
+            try:
+                worker.updates.put_nowait(old_updates.get_nowait())
+                moved += 1
+            except (queue.Empty, queue.Full):
+                break
+        if moved:
+            logger.info("В очередь нового процесса %d перенесено обновлений: %d", worker.index, moved)
+
+        worker.restarts += 1
+        registry.counter('supervisor_worker_restarts_total', worker=worker.index).inc()
+        self._start_worker(worker)
+
+    def check_workers(self):
+        """Принимает heartbeat и перезапускает упавшие или зависшие процессы."""
+        while True:
+            try:
+                index, pid, pending, metrics = self.status.get_nowait()
+            except queue.Empty:
+                break
+            worker = self.workers[index]
+            if worker.process is not None and worker.process.pid == pid:
+                worker.last_heartbeat = time.monotonic()
+                worker.pending = pending
+                worker.metrics = metrics
+
+        for worker in self.workers:
+            if not worker.process.is_alive():
+                self._restart_worker(worker, f"процесс завершился с кодом {worker.process.exitcode}")
+            elif time.monotonic() - worker.last_heartbeat > config.WORKER_HEARTBEAT_TIMEOUT:
+                self._restart_worker(worker, "нет heartbeat")
+
+        if time.monotonic() - self._metrics_logged_at >= config.WORKER_METRICS_LOG_INTERVAL:
+            self._metrics_logged_at = time.monotonic()
+            logger.info("Рабочие процессы: %s", self.stats())
+            logger.info("Метрики рабочих процессов: %s", self.metrics())
+
+    def stats(self) -> list:
+        """Состояние рабочих процессов."""
+        now = time.monotonic()
+        return [{
+            'worker': worker.index,
+            'pid': worker.process.pid if worker.process else None,
+            'alive': bool(worker.process and worker.process.is_alive()),
+            'heartbeat_age': round(now - worker.last_heartbeat, 1),
+            'pending': worker.pending,
+            'restarts': worker.restarts,
+        } for worker in self.workers]
+
+    def metrics(self) -> dict:
+        """Метрики всех рабочих процессов (по последним heartbeat), сведенные в один снимок."""
+        return merge_snapshots([worker.metrics for worker in self.workers] + [registry.snapshot('supervisor_')])
+
+    # --- Получение и раскладка обновлений ---
+
+    def dispatch(self, update: dict):
+        """Кладет обновление в очередь процесса пользователя; при полной очереди ждет."""
+        worker = self.workers[shard_key(update) % len(self.workers)]
+        while True:
+            try:
+                worker.updates.put(update, timeout=config.WORKER_HEARTBEAT_INTERVAL)
+                break
+            except queue.Full:
+                # Процесс не успевает — заодно проверяем, жив ли он (после перезапуска очередь новая)
+                self.check_workers()
+        registry.counter('supervisor_updates_dispatched_total', worker=worker.index).inc()
+
+    def _call(self, client: httpx.Client, method: str, timeout: float = 10.0, **params):
+        response = client.post(f"{API_URL}/bot{self.token}/{method}", json=params, timeout=timeout)
+        response.raise_for_status()
+        return response.json()['result']
+
+    def poll(self, client: httpx.Client):
+        params = {'timeout': POLL_TIMEOUT}
+        if self._offset is not None:
+            params['offset'] = self._offset
+        for update in self._call(client, 'getUpdates', timeout=POLL_TIMEOUT + 10, **params):
+            self.dispatch(update)
+            self._offset = update['update_id'] + 1
+
+    def stop(self, *_):
+        self._stopping = True
+
+    def run(self):
+        signal.signal(signal.SIGINT, self.stop)
+        signal.signal(signal.SIGTERM, self.stop)
+
+        for worker in self.workers:
+            self._start_worker(worker)
+
+        with httpx.Client() as client:
+            # Обновления получает только управляющий процесс
+            self._call(client, 'deleteWebhook')
+            try:
+                while not self._stopping:
+                    try:
+                        self.poll(client)
+                    except httpx.HTTPError as error:
+                        logger.warning("Ошибка getUpdates: %s", error)
+                        time.sleep(1)
+                    self.check_workers()
+            finally:
+                self.shutdown()
+
+    def shutdown(self):
+        """Останавливает рабочие процессы: они дорабатывают уже полученные обновления."""
+        for worker in self.workers:
+            try:
+                worker.updates.put(None, timeout=1)
+            except queue.Full:
+                pass
+        for worker in self.workers:
+            worker.process.join(timeout=config.WORKER_HEARTBEAT_TIMEOUT)
+            if worker.process.is_alive():
+                logger.warning("Рабочий процесс %d не завершился, остановка принудительно", worker.index)
+                worker.process.kill()
+
+
+def run_worker(index: int, updates: multiprocessing.Queue, status: multiprocessing.Queue,
+               heartbeat_interval: float):
+    """Точка входа рабочего процесса."""
+    # Ctrl+C получает управляющий процесс и останавливает рабочие через очередь
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    asyncio.run(_serve_updates(index, updates, status, heartbeat_interval))
+
+
+async def _serve_updates(index: int, updates: multiprocessing.Queue, status: multiprocessing.Queue,
+                         heartbeat_interval: float):
+    from telegram import Update
+    from bot import build_application, register_handlers
+
+    application = build_application()
+    register_handlers(application)
+
+    # То же, что делает run_polling, но обновления приходят из очереди управляющего процесса
+    await application.initialize()
+    if application.post_init:
+        await application.post_init(application)
+    await application.start()
+
+    loop = asyncio.get_running_loop()
+    heartbeat = loop.create_task(_send_heartbeats(index, status, application, heartbeat_interval))
+    try:
+        while True:
+            try:
+                data = await loop.run_in_executor(None, updates.get, True, heartbeat_interval)
+            except queue.Empty:
+                continue
+            if data is None:
+                break
+            # Приложение обрабатывает обновления по одному — порядок для пользователя сохраняется.
+            # Если его очередь заполнена, ждем здесь; heartbeat при этом продолжает уходить
+            await application.update_queue.put(Update.de_json(data, application.bot))
+    finally:
+        heartbeat.cancel()
+        await application.stop()
+        await application.shutdown()
+        if application.post_shutdown:
+            await application.post_shutdown(application)
+
+
+async def _send_heartbeats(index: int, status: multiprocessing.Queue, application, heartbeat_interval: float):
+    """Отправляет heartbeat управляющему процессу, пока цикл событий рабочего процесса жив."""
+    while True:
+        status.put((index, os.getpid(), application.update_queue.qsize(), registry.snapshot()))
+        await asyncio.sleep(heartbeat_interval)
@@ -0,0 +1,122 @@
+import logging
+from contextvars import ContextVar
+from typing import Optional
+
+from sqlalchemy import event
+from sqlalchemy.ext.asyncio import AsyncSession
+from telegram.ext import Application, CallbackContext
+
+from data_access.database import async_engine, get_async_session, on_commit
+
+logger = logging.getLogger(__name__)
+
+"""
+Единица работы (Unit of Work) на одно обновление Telegram.
+
+Все обработчики одного обновления используют одну и ту же сессию базы данных.
+Сессия открывается лениво при первом обращении, а в конце обработки обновления
+транзакция один раз фиксируется (или откатывается, если обработчик упал) и соединение
+возвращается в пул. Менеджеры бизнес-логики при этом только делают flush, а кэши в памяти
+сбрасывают действиями после фиксации (on_commit): они выполняются после commit и
+отбрасываются при откате.
+"""
+
+# Единица работы текущего обновления (у каждой задачи asyncio свой контекст)
+_current_unit_of_work: ContextVar[Optional['UnitOfWork']] = ContextVar('current_unit_of_work', default=None)
+
+
+class UnitOfWork:
+    def __init__(self, session_factory=get_async_session):
+        """
+        Args:
+            session_factory: Фабрика асинхронных сессий.
+        """
+        self._session_factory = session_factory
+        self._session: Optional[AsyncSession] = None
+        self.failed = False          # Обработчик завершился ошибкой — транзакцию нужно откатить
+        self.sessions_opened = 0     # Сколько сессий открыто за обновление
+        self.queries = 0             # Сколько SQL-запросов выполнено за обновление
+
+    @property
+    def session(self) -> AsyncSession:
+        """Сессия обновления; открывается при первом обращении."""
+        if self._session is None:
+            self._session = self._session_factory()
+            self.sessions_opened += 1
+        return self._session
+
+    def on_commit(self, callback):
+        """Выполняет callback после фиксации транзакции обновления (при откате — не выполняет)."""
+        on_commit(self.session, callback)
+
+    async def complete(self):
+        """Фиксирует или откатывает транзакцию и закрывает сессию."""
+        if self._session is None:
+            return
+        try:
+            if self.failed:
+                await self._session.rollback()
+            else:
+                await self._session.commit()
+        except Exception:
+            await self._session.rollback()
+            raise
+        finally:
+            await self._session.close()
+            self._session = None
+
+
+def current_unit_of_work() -> UnitOfWork:
+    """Возвращает единицу работы обрабатываемого обновления."""
+    unit_of_work = _current_unit_of_work.get()
+    if unit_of_work is None:
+        raise RuntimeError("Нет активной единицы работы: обращение к БД вне обработки обновления")
+    return unit_of_work
+
+
+@event.listens_for(async_engine.sync_engine, 'before_cursor_execute')
+def _count_query(conn, cursor, statement, parameters, context, executemany):
+    # Считаем запросы той единицы работы, в контексте которой они выполняются
+    unit_of_work = _current_unit_of_work.get()
+    if unit_of_work is not None:
+        unit_of_work.queries += 1
+
+
+class BotContext(CallbackContext):
+    """Контекст обработчиков с доступом к сессии текущего обновления."""
+
+    @property
+    def db_session(self) -> AsyncSession:
+        return current_unit_of_work().session
+
+
+class UnitOfWorkApplication(Application):
+    """
+    Application, оборачивающий обработку каждого обновления в единицу работы.
+
+    Подключается через Application.builder().application_class(UnitOfWorkApplication).
+    """
+
+    async def process_update(self, update: object) -> None:
+        unit_of_work = UnitOfWork()
+        token = _current_unit_of_work.set(unit_of_work)
+        try:
+            await super().process_update(update)
+        except Exception:
+            unit_of_work.failed = True
+            raise
+        finally:
+            try:
+                await unit_of_work.complete()
+            finally:
+                _current_unit_of_work.reset(token)
+            logger.debug("Обновление обработано: сессий %d, запросов %d",
+                         unit_of_work.sessions_opened, unit_of_work.queries)
+
+    async def process_error(self, update, error, job=None, coroutine=None) -> bool:
+        # Application перехватывает исключения обработчиков сам, поэтому отмечаем
+        # единицу работы как неудачную здесь, чтобы в конце выполнить откат
+        unit_of_work = _current_unit_of_work.get()
+        if unit_of_work is not None:
+            unit_of_work.failed = True
+        return await super().process_error(update, error, job=job, coroutine=coroutine)
@@ -1,17 +1,20 @@
-# Импорт библиотеки openai для взаимодействия с OpenAI API
-import openai
+# Импорт асинхронного клиента OpenAI, работающего через общий пул HTTP-соединений
+from external_integrations.openai_client import OpenAIClient
 
-# Импорт библиотеки requests для отправки HTTP-запросов
-import requests
+# Импорт планировщика запросов к моделям
+from business_logic.llm_scheduler import FREE_TIER, llm_scheduler
 
-# Импорт типов для аннотации типов в функции
-from typing import Dict, Any
+# Импорт кэша ответов модели
+from external_integrations.response_cache import get_response_cache
 
-# Импорт функции get_session из модуля database
-from data_access.database import get_session
+# Импорт объединения одинаковых запросов на генерацию изображений
+from external_integrations.dalle_integration import image_flight, image_key
 
-# Импорт модели ImageRequest из модуля models
-from data_access.models import ImageRequest
+# Импорт асинхронной сессии SQLAlchemy
+from sqlalchemy.ext.asyncio import AsyncSession
+
+# Импорт модели DALLEMessage из модуля models
+from data_access.models import DALLEMessage
 
 # Импорт класса datetime из модуля datetime
 from datetime import datetime
@@ -26,82 +29,97 @@ class APIIntegration:
             openai_api_key (str): API-ключ для OpenAI.
             dalle_api_key (str): API-ключ для DALL-E.
         """
-        openai.api_key = openai_api_key
-        self.dalle_api_key = dalle_api_key
+        # Клиенты с разными ключами используют общий пул соединений
+        self.openai_client = OpenAIClient(api_key=openai_api_key)
+        self.dalle_client = OpenAIClient(api_key=dalle_api_key)
 
-    @staticmethod
-    def generate_text(prompt: str, model: str = "text-davinci-003") -> str:
+    async def generate_text(self, prompt: str, model: str = "gpt-4o-mini", use_cache: bool = False,
+                            user_id: int = None, tier: str = FREE_TIER) -> str:
         """
         Генерация текста с использованием OpenAI GPT.
 
+        Запрос ждет свободного слота модели в планировщике, как и запросы из диалогов.
+
         Args:
             prompt (str): Текстовый запрос для генерации.
             model (str): Модель для генерации текста.
+            use_cache (bool): Разрешить кэш ответов (только для одиночного запроса без истории).
+            user_id (int): Пользователь, от имени которого выполняется запрос.
+            tier (str): Тариф пользователя (FREE_TIER — без подписки).
 
         Returns:
             str: Сгенерированный текст.
         """
+        cache = get_response_cache() if use_cache else None
+        params = {'max_tokens': 100, 'n': 1, 'temperature': 0.7}
+        if cache is not None:
+            cached = await cache.get(model, None, prompt, params)
+            if cached is not None:
+                return cached
+
         try:
-            response = openai.Completion.create(
-                model=model,
-                prompt=prompt,
-                max_tokens=100,
-                n=1,
-                stop=None,
-                temperature=0.7
-            )
-            return response.choices[0].text.strip()
+            async with llm_scheduler.slot(model, user_id, tier):
+                response_text = await self.openai_client.chat_completion(
+                    model=model,
+                    messages=[{"role": "user", "content": prompt}],
+                    **params
+                )
         except Exception as e:
             print(f"Ошибка при генерации текста: {e}")
             return ""
 
-    def generate_image(self, prompt: str) -> str:
+        if cache is not None:
+            await cache.set(model, None, prompt, response_text, params)
+        return response_text
+
+    async def generate_image(self, prompt: str, size: str = "1024x1024", session: AsyncSession = None,
+                             dialog_id: int = None, user_id: int = None) -> str:
         """
         Генерация изображения с использованием DALL-E.
 
+        Если передана сессия, запрос сохраняется в dalle_messages (фиксирует его вызывающий).
+
         Args:
             prompt (str): Описание изображения для генерации.
+            size (str): Размер изображения.
+            session (AsyncSession): Сессия текущего обновления (context.db_session).
+            dialog_id (int): Идентификатор диалога.
+            user_id (int): Идентификатор пользователя.
 
         Returns:
             str: URL сгенерированного изображения.
         """
-        url = "https://api.openai.com/v1/images/generations"
-        headers = {
-            "Authorization": f"Bearer {self.dalle_api_key}",
-            "Content-Type": "application/json"
-        }
-        data = {
-            "model": "image-alpha-001",
-            "prompt": prompt,
-            "num_images": 1
-        }
-
         try:
-            response = requests.post(url, json=data, headers=headers)
-            response_data = response.json()
-            image_url = response_data['data'][0]['url']
-            self.save_image_request(prompt, image_url)
-            return image_url
+            # Одинаковые одновременные запросы выполняются одним обращением к API
+            image_url = await image_flight.do(
+                image_key(prompt, size),
+                lambda: self.dalle_client.create_image(prompt=prompt, size=size)
+            )
         except Exception as e:
             print(f"Ошибка при генерации изображения: {e}")
             return ""
 
+        if session is not None:
+            await self.save_image_request(session, dialog_id, user_id, prompt, image_url)
+        return image_url
+
     @staticmethod
-    def save_image_request(prompt: str, image_url: str):
+    async def save_image_request(session: AsyncSession, dialog_id: int, user_id: int, prompt: str, image_url: str):
         """
         Сохраняет запрос на генерацию изображения в базу данных.
 
         Args:
+            session (AsyncSession): Сессия текущего обновления.
+            dialog_id (int): Идентификатор диалога.
+            user_id (int): Идентификатор пользователя.
             prompt (str): Описание изображения.
             image_url (str): URL сгенерированного изображения.
         """
-        session = get_session()
-        image_request = ImageRequest(
-            user_id=1,  # Здесь можно указать реального пользователя, если требуется
-            prompt_text=prompt,
-            image_url=image_url,
-            timestamp=datetime.now()
-        )
-
-        session.add(image_request)
-        session.commit()
+        session.add(DALLEMessage(
+            dialog_id=dialog_id,
+            user_id=user_id,
+            message_text=prompt,
+            dalle_image=image_url,
+            message_time=datetime.now()
+        ))
+        await session.flush()
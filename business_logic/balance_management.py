@@ -1,6 +1,171 @@
+import argparse
+import asyncio
+import logging
+import time
+
 from sqlalchemy.orm import Session
+from sqlalchemy import and_, func, insert, or_, select, update
+from sqlalchemy.ext.asyncio import AsyncSession
 from datetime import datetime
-from data_access.models import User, Transaction
+from typing import AsyncIterator, Iterator, NamedTuple, Optional, Tuple
+
+import config
+from data_access.database import dialect_insert, get_async_session
+from data_access.models import BalanceHistory, UserBalance, Transaction
+from monitoring.metrics import registry
+
+logger = logging.getLogger(__name__)
+
+"""
+Баланс пользователя.
+
+Остаток хранится в user_balances и меняется только одним оператором без предварительного
+чтения: пополнение — INSERT ... ON CONFLICT DO UPDATE (balance_now = balance_now + сумма),
+списание — UPDATE ... WHERE balance_now >= сумма RETURNING balance_now. Проверка достаточности
+средств выполняется самой СУБД под блокировкой строки, поэтому одновременные списания с одного
+счета не теряют обновлений и не уводят баланс в минус.
+
+Каждое изменение дописывает строку в transactions (сумма операции); журнал только пополняется.
+Каждая BALANCE_CHECKPOINT_INTERVAL-я операция по счету дописывает в balance_history контрольную
+точку: остаток после нее и последнюю учтенную транзакцию. Баланс на момент времени — это
+последняя контрольная точка до него плюс сумма немногих транзакций после нее, без обхода всей
+истории. Блокировка строки счета держится до конца транзакции, поэтому списание лучше
+выполнять ближе к ее концу.
+
+История транзакций выдается страницами от новых к старым по ключу (transaction_date,
+transaction_id) без OFFSET.
+
+Нагрузочный прогон списаний с одного счета (пропускная способность горячего счета):
+python -m business_logic.balance_management --debits 2000 --concurrency 50
+"""
+
+# У пользователя один основной счет: строка user_balances с этим balance_id
+MAIN_BALANCE_ID = 1
+
+DEPOSIT = 'deposit'
+WITHDRAWAL = 'withdrawal'
+# Тип строк balance_history с контрольными точками
+CHECKPOINT = 'checkpoint'
+
+
+class InsufficientFundsError(ValueError):
+    """Списание отклонено: на счете меньше запрошенной суммы."""
+
+    def __init__(self):
+        super().__init__("Недостаточно средств на балансе")
+
+
+operations = {(kind, result): registry.counter('balance_operations_total', kind=kind, result=result)
+              for kind in (DEPOSIT, WITHDRAWAL) for result in ('ok', 'rejected')}
+
+
+class TransactionItem(NamedTuple):
+    transaction_id: int
+    amount: float
+    type: str
+    timestamp: datetime
+    description: Optional[str]
+
+
+class TransactionPage(NamedTuple):
+    transactions: Tuple[TransactionItem, ...]
+    # Ключ (transaction_date, transaction_id) для запроса следующей страницы; None — страница последняя
+    next_cursor: Optional[Tuple[datetime, int]]
+
+
+def balance_statement(user_id: int):
+    """Текущий остаток основного счета."""
+    return select(UserBalance.balance_now).where(UserBalance.user_id == user_id,
+                                                 UserBalance.balance_id == MAIN_BALANCE_ID)
+
+
+def credit_statement(session, user_id: int, amount: float, now: datetime):
+    """Пополнение счета одним оператором; открывает счет при первом пополнении."""
+    statement = dialect_insert(session, UserBalance).values(
+        user_id=user_id, balance_id=MAIN_BALANCE_ID, balance_now=amount, up_date=now, op_count=1)
+    return statement.on_conflict_do_update(
+        index_elements=[UserBalance.user_id, UserBalance.balance_id],
+        set_={'balance_now': UserBalance.balance_now + statement.excluded.balance_now,
+              'up_date': statement.excluded.up_date,
+              'op_count': UserBalance.op_count + 1},
+    ).returning(UserBalance.balance_now, UserBalance.op_count)
+
+
+def debit_statement(user_id: int, amount: float, now: datetime):
+    """Условное списание: строка меняется, только если средств достаточно."""
+    return (update(UserBalance)
+            .where(UserBalance.user_id == user_id,
+                   UserBalance.balance_id == MAIN_BALANCE_ID,
+                   UserBalance.balance_now >= amount)
+            .values(balance_now=UserBalance.balance_now - amount, up_date=now,
+                    op_count=UserBalance.op_count + 1)
+            .returning(UserBalance.balance_now, UserBalance.op_count)
+            .execution_options(synchronize_session=False))
+
+
+def transaction_statement(user_id: int, amount: float, kind: str, now: datetime, description: str = None):
+    """Запись операции в журнал transactions."""
+    return insert(Transaction).values(
+        user_id=user_id, transaction_sum=amount, transaction_type=kind,
+        transaction_date=now, transaction_description=description,
+    ).returning(Transaction.transaction_id)
+
+
+def checkpoint_statement(user_id: int, balance: float, transaction_id: int, now: datetime):
+    """Контрольная точка: остаток после транзакции transaction_id."""
+    return insert(BalanceHistory).values(user_id=user_id, balance_sum=balance, transaction_type=CHECKPOINT,
+                                         created_at=now, last_transaction_id=transaction_id)
+
+
+def checkpoint_due(op_count: int) -> bool:
+    return op_count % config.BALANCE_CHECKPOINT_INTERVAL == 0
+
+
+def transaction_page_statement(user_id: int, before: Optional[Tuple[datetime, int]], limit: int):
+    """
+    Запрос страницы истории от новых к старым по ключу (transaction_date, transaction_id) без OFFSET.
+
+    Берется на одну строку больше limit, чтобы узнать, есть ли следующая страница.
+    """
+    statement = select(Transaction.transaction_id, Transaction.transaction_sum, Transaction.transaction_type,
+                       Transaction.transaction_date, Transaction.transaction_description
+                       ).where(Transaction.user_id == user_id)
+    if before is not None:
+        date, transaction_id = before
+        statement = statement.where(or_(
+            Transaction.transaction_date < date,
+            and_(Transaction.transaction_date == date, Transaction.transaction_id < transaction_id)))
+    return (statement.order_by(Transaction.transaction_date.desc(), Transaction.transaction_id.desc())
+            .limit(limit + 1))
+
+
+def build_transaction_page(rows, limit: int) -> TransactionPage:
+    transactions = tuple(TransactionItem(*row) for row in rows[:limit])
+    if len(rows) <= limit:
+        return TransactionPage(transactions, None)
+    last = transactions[-1]
+    return TransactionPage(transactions, (last.timestamp, last.transaction_id))
+
+
+def last_checkpoint_statement(user_id: int, at: datetime):
+    """Последняя контрольная точка не позже момента at."""
+    return (select(BalanceHistory.balance_sum, BalanceHistory.last_transaction_id, BalanceHistory.created_at)
+            .where(BalanceHistory.user_id == user_id,
+                   BalanceHistory.transaction_type == CHECKPOINT,
+                   BalanceHistory.created_at <= at)
+            .order_by(BalanceHistory.created_at.desc(), BalanceHistory.history_id.desc())
+            .limit(1))
+
+
+def tail_sum_statement(user_id: int, checkpoint, at: datetime):
+    """Сумма транзакций после контрольной точки (или всех, если ее нет) до момента at."""
+    statement = (select(func.coalesce(func.sum(Transaction.transaction_sum), 0.0))
+                 .where(Transaction.user_id == user_id, Transaction.transaction_date <= at))
+    if checkpoint is not None:
+        # Дата ограничивает просмотр индекса хвостом после точки, номер отсекает уже учтенные
+        statement = statement.where(Transaction.transaction_date >= checkpoint.created_at,
+                                    Transaction.transaction_id > checkpoint.last_transaction_id)
+    return statement
 
 
 class BalanceManager:
@@ -23,18 +188,18 @@ class BalanceManager:
         Returns:
             float: Текущий баланс пользователя.
         """
-        user = self.db.query(User).filter(User.id == user_id).first()
-        if user:
-            return user.balance
-        raise ValueError("Пользователь не найден")
+        # Остаток читается из БД, а не из объекта сессии: счет меняется операторами UPDATE
+        balance = self.db.execute(balance_statement(user_id)).scalar_one_or_none()
+        return balance if balance is not None else 0.0
 
-    def add_funds(self, user_id: int, amount: float) -> float:
+    def add_funds(self, user_id: int, amount: float, description: str = None) -> float:
         """
         Пополнение баланса пользователя.
 
         Args:
             user_id (int): Идентификатор пользователя.
             amount (float): Сумма пополнения.
+            description (str): Описание операции для журнала.
 
         Returns:
             float: Обновлённый баланс пользователя.
@@ -42,83 +207,293 @@ class BalanceManager:
         if amount <= 0:
             raise ValueError("Сумма пополнения должна быть больше 0")
 
-        user = self.db.query(User).filter(User.id == user_id).first()
-        if not user:
-            raise ValueError("Пользователь не найден")
+        balance, op_count = self.db.execute(credit_statement(self.db, user_id, amount, datetime.now())).one()
+        self._journal(user_id, amount, DEPOSIT, balance, op_count, description)
+        self.db.commit()
+        operations[DEPOSIT, 'ok'].inc()
+
+        return balance
+
+    def deduct_funds(self, user_id: int, amount: float, description: str = None) -> float:
+        """
+        Списание средств с баланса пользователя.
+
+        Args:
+            user_id (int): Идентификатор пользователя.
+            amount (float): Сумма для списания.
+            description (str): Описание операции для журнала.
+
+        Returns:
+            float: Обновлённый баланс пользователя.
 
-        # Обновляем баланс пользователя
-        user.balance += amount
+        Raises:
+            InsufficientFundsError: Если средств на счете недостаточно.
+        """
+        if amount <= 0:
+            raise ValueError("Сумма для списания должна быть больше 0")
 
-        # Создаем запись о транзакции
-        transaction = Transaction(
-            user_id=user.id,
-            amount=amount,
-            transaction_type="deposit",
-            timestamp=datetime.now()
-        )
+        row = self.db.execute(debit_statement(user_id, amount, datetime.now())).first()
+        if row is None:
+            # Счета нет или средств не хватило — ничего не изменено
+            self.db.rollback()
+            operations[WITHDRAWAL, 'rejected'].inc()
+            raise InsufficientFundsError()
 
-        # Добавляем транзакцию в базу данных
-        self.db.add(transaction)
+        balance, op_count = row
+        self._journal(user_id, -amount, WITHDRAWAL, balance, op_count, description)
         self.db.commit()
+        operations[WITHDRAWAL, 'ok'].inc()
+
+        return balance
+
+    def _journal(self, user_id: int, amount: float, kind: str, balance: float, op_count: int,
+                 description: Optional[str]):
+        # Время берется после изменения счета: под блокировкой строки даты идут в порядке операций
+        now = datetime.now()
+        transaction_id = self.db.execute(transaction_statement(user_id, amount, kind, now, description)).scalar_one()
+        if checkpoint_due(op_count):
+            self.db.execute(checkpoint_statement(user_id, balance, transaction_id, now))
+
+    def get_transaction_history(self, user_id: int, before: Tuple[datetime, int] = None,
+                                limit: int = None) -> TransactionPage:
+        """
+        Страница истории транзакций пользователя, от новых к старым.
+
+        Args:
+            user_id (int): Идентификатор пользователя.
+            before (Tuple[datetime, int]): next_cursor предыдущей страницы; None — первая страница.
+            limit (int): Размер страницы (по умолчанию TRANSACTION_PAGE_SIZE).
+
+        Returns:
+            TransactionPage: Транзакции страницы и ключ следующей.
+        """
+        limit = limit or config.TRANSACTION_PAGE_SIZE
+        rows = self.db.execute(transaction_page_statement(user_id, before, limit)).all()
+        return build_transaction_page(rows, limit)
 
-        return user.balance
+    def iter_transactions(self, user_id: int, page_size: int = None) -> Iterator[TransactionItem]:
+        """Все транзакции пользователя от новых к старым; в памяти держится одна страница."""
+        before = None
+        while True:
+            page = self.get_transaction_history(user_id, before, page_size)
+            yield from page.transactions
+            if page.next_cursor is None:
+                return
+            before = page.next_cursor
 
-    def deduct_funds(self, user_id: int, amount: float) -> float:
+    def get_balance_at(self, user_id: int, at: datetime) -> float:
+        """
+        Баланс пользователя на момент времени: контрольная точка плюс транзакции после нее.
+
+        Args:
+            user_id (int): Идентификатор пользователя.
+            at (datetime): Момент времени (в том же времени, что даты транзакций).
+
+        Returns:
+            float: Баланс на момент at.
+        """
+        checkpoint = self.db.execute(last_checkpoint_statement(user_id, at)).first()
+        tail = self.db.execute(tail_sum_statement(user_id, checkpoint, at)).scalar_one()
+        return (checkpoint.balance_sum if checkpoint is not None else 0.0) + tail
+
+
+class AsyncBalanceManager:
+    def __init__(self, db: AsyncSession):
+        """
+        Инициализация асинхронного менеджера баланса.
+        Изменения выполняются в транзакции сессии; фиксирует ее вызывающий код.
+
+        Args:
+            db (AsyncSession): Асинхронная сессия базы данных SQLAlchemy.
+        """
+        self.db = db
+
+    async def get_balance(self, user_id: int) -> float:
+        """
+        Получение текущего баланса пользователя.
+
+        Args:
+            user_id (int): Идентификатор пользователя.
+
+        Returns:
+            float: Текущий баланс пользователя.
+        """
+        balance = (await self.db.execute(balance_statement(user_id))).scalar_one_or_none()
+        return balance if balance is not None else 0.0
+
+    async def add_funds(self, user_id: int, amount: float, description: str = None) -> float:
+        """
+        Пополнение баланса пользователя.
+
+        Args:
+            user_id (int): Идентификатор пользователя.
+            amount (float): Сумма пополнения.
+            description (str): Описание операции для журнала.
+
+        Returns:
+            float: Обновлённый баланс пользователя.
+        """
+        if amount <= 0:
+            raise ValueError("Сумма пополнения должна быть больше 0")
+
+        balance, op_count = (await self.db.execute(credit_statement(self.db, user_id, amount, datetime.now()))).one()
+        await self._journal(user_id, amount, DEPOSIT, balance, op_count, description)
+        operations[DEPOSIT, 'ok'].inc()
+
+        return balance
+
+    async def deduct_funds(self, user_id: int, amount: float, description: str = None) -> float:
         """
         Списание средств с баланса пользователя.
 
         Args:
             user_id (int): Идентификатор пользователя.
             amount (float): Сумма для списания.
+            description (str): Описание операции для журнала.
 
         Returns:
             float: Обновлённый баланс пользователя.
+
+        Raises:
+            InsufficientFundsError: Если средств на счете недостаточно.
         """
         if amount <= 0:
             raise ValueError("Сумма для списания должна быть больше 0")
 
-        user = self.db.query(User).filter(User.id == user_id).first()
-        if not user:
-            raise ValueError("Пользователь не найден")
+        row = (await self.db.execute(debit_statement(user_id, amount, datetime.now()))).first()
+        if row is None:
+            # Счета нет или средств не хватило — ничего не изменено
+            operations[WITHDRAWAL, 'rejected'].inc()
+            raise InsufficientFundsError()
 
-        if user.balance < amount:
-            raise ValueError("Недостаточно средств на балансе")
+        balance, op_count = row
+        await self._journal(user_id, -amount, WITHDRAWAL, balance, op_count, description)
+        operations[WITHDRAWAL, 'ok'].inc()
 
-        # Списываем средства с баланса пользователя
-        user.balance -= amount
+        return balance
 
-        # Создаем запись о транзакции
-        transaction = Transaction(
-            user_id=user.id,
-            amount=-amount,
-            transaction_type="withdrawal",
-            timestamp=datetime.now()
-        )
+    async def _journal(self, user_id: int, amount: float, kind: str, balance: float, op_count: int,
+                       description: Optional[str]):
+        # Время берется после изменения счета: под блокировкой строки даты идут в порядке операций
+        now = datetime.now()
+        transaction_id = (await self.db.execute(
+            transaction_statement(user_id, amount, kind, now, description))).scalar_one()
+        if checkpoint_due(op_count):
+            await self.db.execute(checkpoint_statement(user_id, balance, transaction_id, now))
 
-        # Добавляем транзакцию в базу данных
-        self.db.add(transaction)
-        self.db.commit()
+    async def get_transaction_history(self, user_id: int, before: Tuple[datetime, int] = None,
+                                      limit: int = None) -> TransactionPage:
+        """
+        Страница истории транзакций пользователя, от новых к старым.
+
+        Args:
+            user_id (int): Идентификатор пользователя.
+            before (Tuple[datetime, int]): next_cursor предыдущей страницы; None — первая страница.
+            limit (int): Размер страницы (по умолчанию TRANSACTION_PAGE_SIZE).
+
+        Returns:
+            TransactionPage: Транзакции страницы и ключ следующей.
+        """
+        limit = limit or config.TRANSACTION_PAGE_SIZE
+        rows = (await self.db.execute(transaction_page_statement(user_id, before, limit))).all()
+        return build_transaction_page(rows, limit)
 
-        return user.balance
+    async def iter_transactions(self, user_id: int, page_size: int = None) -> AsyncIterator[TransactionItem]:
+        """Все транзакции пользователя от новых к старым; в памяти держится одна страница."""
+        before = None
+        while True:
+            page = await self.get_transaction_history(user_id, before, page_size)
+            for transaction in page.transactions:
+                yield transaction
+            if page.next_cursor is None:
+                return
+            before = page.next_cursor
 
-    def get_transaction_history(self, user_id: int):
+    async def get_balance_at(self, user_id: int, at: datetime) -> float:
         """
-        Получение истории транзакций пользователя.
+        Баланс пользователя на момент времени: контрольная точка плюс транзакции после нее.
 
         Args:
             user_id (int): Идентификатор пользователя.
+            at (datetime): Момент времени (в том же времени, что даты транзакций).
 
         Returns:
-            list: Список транзакций пользователя.
-        """
-        transactions = self.db.query(Transaction).filter(
-            Transaction.user_id == user_id).all()
-
-        # Формируем и возвращаем список транзакций
-        return [
-            {
-                "amount": trans.amount,
-                "type": trans.transaction_type,
-                "timestamp": trans.timestamp
-            }
-            for trans in transactions]
+            float: Баланс на момент at.
+        """
+        checkpoint = (await self.db.execute(last_checkpoint_statement(user_id, at))).first()
+        tail = (await self.db.execute(tail_sum_statement(user_id, checkpoint, at))).scalar_one()
+        return (checkpoint.balance_sum if checkpoint is not None else 0.0) + tail
+
+
+async def hot_account_load(user_id: int, debits: int, concurrency: int, amount: float = 1.0) -> Tuple[int, int, float]:
+    """
+    Параллельные списания с одного счета, каждое в своей транзакции.
+
+    Args:
+        user_id (int): Идентификатор пользователя.
+        debits (int): Количество списаний.
+        concurrency (int): Сколько списаний выполняется одновременно.
+        amount (float): Сумма одного списания.
+
+    Returns:
+        Tuple[int, int, float]: Выполненные и отклоненные списания, время прогона в секундах.
+    """
+    limit = asyncio.Semaphore(concurrency)
+
+    async def debit() -> bool:
+        async with limit, get_async_session() as session:
+            try:
+                await AsyncBalanceManager(session).deduct_funds(user_id, amount, "Нагрузочное списание")
+            except InsufficientFundsError:
+                await session.rollback()
+                return False
+            await session.commit()
+            return True
+
+    started = time.perf_counter()
+    results = await asyncio.gather(*(debit() for _ in range(debits)))
+    elapsed = time.perf_counter() - started
+    done = results.count(True)
+    logger.info("Списаний с одного счета: %d за %.2f с (%.1f/с), отклонено: %d",
+                done, elapsed, len(results) / elapsed if elapsed else 0.0, len(results) - done)
+    return done, len(results) - done, elapsed
+
+
+def main():
+    from business_logic.user_management import AsyncUserManager
+    from data_access.database import async_engine, init_db
+
+    parser = argparse.ArgumentParser(description="Нагрузочный прогон списаний с одного счета")
+    parser.add_argument('--debits', type=int, default=2000, help="Количество списаний")
+    parser.add_argument('--concurrency', type=int, default=50, help="Одновременных списаний")
+    parser.add_argument('--amount', type=float, default=1.0, help="Сумма одного списания")
+    parser.add_argument('--funds', type=float, default=None,
+                        help="Начальный остаток (по умолчанию хватает на все списания)")
+    args = parser.parse_args()
+
+    init_db()
+    funds = args.debits * args.amount if args.funds is None else args.funds
+
+    async def run():
+        try:
+            async with get_async_session() as session:
+                user, _ = await AsyncUserManager(session).register_user('Нагрузка', f"load-{time.time_ns()}")
+                await AsyncBalanceManager(session).add_funds(user.user_id, funds, "Пополнение для прогона")
+                await session.commit()
+                user_id = user.user_id
+
+            done, rejected, elapsed = await hot_account_load(user_id, args.debits, args.concurrency, args.amount)
+            async with get_async_session() as session:
+                balance = await AsyncBalanceManager(session).get_balance(user_id)
+        finally:
+            await async_engine.dispose()
+        # Остаток должен ровно сойтись с выполненными списаниями
+        logger.info("Остаток %.2f (ожидался %.2f), метрики: %s",
+                    balance, funds - done * args.amount, registry.snapshot('balance_'))
+
+    asyncio.run(run())
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO)
+    main()
@@ -0,0 +1,106 @@
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Hashable, Optional
+
+from monitoring.metrics import registry
+
+
+class TTLCache:
+    """
+    Ограниченный по размеру кэш в памяти процесса с вытеснением LRU и временем жизни записей.
+
+    Попадания, промахи и вытеснения считаются в реестре метрик под именем кэша.
+    """
+
+    def __init__(self, name: str, maxsize: int, ttl: float, max_bytes: Optional[int] = None,
+                 sizeof: Optional[Callable[[Any], int]] = None):
+        """
+        Args:
+            name (str): Имя кэша в метриках.
+            maxsize (int): Максимальное количество записей.
+            ttl (float): Время жизни записи в секундах.
+            max_bytes (int): Ограничение суммарного размера значений в байтах (None — без ограничения).
+            sizeof (Callable): Размер значения в байтах; обязателен вместе с max_bytes.
+        """
+        self.name = name
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.sizeof = sizeof
+        self.bytes = 0
+        # key -> (value, expires_at, size)
+        self._data: "OrderedDict[Hashable, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = registry.counter('cache_hits_total', cache=name)
+        self.misses = registry.counter('cache_misses_total', cache=name)
+        self.evictions = registry.counter('cache_evictions_total', cache=name)
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        """
+        Возвращает значение по ключу или default, если записи нет или она устарела.
+        """
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is not None:
+                value, expires_at, _ = entry
+                if expires_at > time.monotonic():
+                    self._data.move_to_end(key)
+                    self.hits.inc()
+                    return value
+                self._remove(key)
+            self.misses.inc()
+            return default
+
+    def set(self, key: Hashable, value: Any, ttl: Optional[float] = None):
+        """
+        Сохраняет значение; при переполнении вытесняет самые давно использованные записи.
+        """
+        size = self.sizeof(value) if self.sizeof else 0
+        if self.max_bytes is not None and size > self.max_bytes:
+            # Значение больше всего кэша — не вытесняем ради него остальные записи
+            return
+        with self._lock:
+            self._remove(key)
+            self._data[key] = (value, time.monotonic() + (self.ttl if ttl is None else ttl), size)
+            self.bytes += size
+            while len(self._data) > self.maxsize or (self.max_bytes is not None and self.bytes > self.max_bytes):
+                self._remove(next(iter(self._data)))
+                self.evictions.inc()
+
+    def invalidate(self, key: Hashable):
+        """Удаляет запись, если она есть."""
+        with self._lock:
+            self._remove(key)
+
+    def clear(self):
+        """Удаляет все записи."""
+        with self._lock:
+            self._data.clear()
+            self.bytes = 0
+
+    def values(self) -> list:
+        """Снимок неустаревших значений (не считается обращением и не меняет порядок LRU)."""
+        now = time.monotonic()
+        with self._lock:
+            return [value for value, expires_at, _ in self._data.values() if expires_at > now]
+
+    def _remove(self, key: Hashable):
+        entry = self._data.pop(key, None)
+        if entry is not None:
+            self.bytes -= entry[2]
+
+    def __len__(self):
+        return len(self._data)
+
+    def stats(self) -> dict:
+        """Счетчики кэша и доля попаданий."""
+        hits, misses = self.hits.value, self.misses.value
+        return {
+            'size': len(self._data),
+            'bytes': self.bytes,
+            'hits': hits,
+            'misses': misses,
+            'evictions': self.evictions.value,
+            'hit_rate': hits / (hits + misses) if hits + misses else 0.0,
+        }
@@ -0,0 +1,93 @@
+from collections import deque
+from typing import Iterable, Optional, Tuple
+
+import config
+from business_logic.cache import TTLCache
+
+"""
+Скользящий контекст диалога в памяти.
+
+Для каждого недавно активного диалога хранится окно последних сообщений вместе с оценкой
+их длины в токенах. Новые реплики дописываются в окно, а не приводят к повторной загрузке
+всей истории; из окна в запрос попадают самые новые сообщения, укладывающиеся в бюджет.
+"""
+
+
+def estimate_tokens(text: str) -> int:
+    """
+    Грубая оценка числа токенов: в среднем около четырех символов на токен.
+    Для ограничения длины запроса точного подсчета не требуется.
+    """
+    return len(text) // 4 + 1
+
+
+def format_message(user_id: Optional[int], message_text: str) -> str:
+    """Строка истории для одного сообщения."""
+    return f":User  {message_text}" if user_id else f"AI: {message_text}"
+
+
+class DialogContext:
+    def __init__(self, max_messages: int, token_budget: int, lines: Iterable[str] = ()):
+        """
+        Args:
+            max_messages (int): Сколько последних сообщений хранить.
+            token_budget (int): Сколько токенов истории отдавать в запрос.
+            lines (Iterable[str]): Начальные строки истории, от старых к новым.
+        """
+        self.max_messages = max_messages
+        self.token_budget = token_budget
+        self._lines: deque = deque(maxlen=max_messages)
+        for line in lines:
+            self.append(line)
+
+    def append(self, line: str):
+        """Добавляет строку истории; самая старая строка вытесняется при переполнении окна."""
+        self._lines.append((line, estimate_tokens(line)))
+
+    def render(self) -> str:
+        """Самые новые сообщения окна, укладывающиеся в бюджет токенов, в хронологическом порядке."""
+        selected, used = [], 0
+        for line, tokens in reversed(self._lines):
+            if used + tokens > self.token_budget:
+                break
+            selected.append(line)
+            used += tokens
+        return "\n".join(reversed(selected))
+
+
+class DialogContextCache:
+    """Кэш скользящих контекстов по dialog_id."""
+
+    def __init__(self, maxsize: int, ttl: float):
+        self._cache = TTLCache('dialog_context', maxsize=maxsize, ttl=ttl)
+
+    def get(self, dialog_id: int) -> Optional[DialogContext]:
+        return self._cache.get(int(dialog_id))
+
+    def put(self, dialog_id: int, context: DialogContext):
+        self._cache.set(int(dialog_id), context)
+
+    def append(self, dialog_id: int, line: str):
+        """Дописывает реплику в контекст, если диалог уже в кэше (иначе он загрузится при чтении)."""
+        context = self._cache.get(int(dialog_id))
+        if context is not None:
+            context.append(line)
+
+    def invalidate(self, dialog_id: int):
+        self._cache.invalidate(int(dialog_id))
+
+
+def history_window(dialog) -> Tuple[int, int]:
+    """
+    Размер окна истории для диалога: собственные настройки диалога или значения по умолчанию.
+
+    Returns:
+        Tuple[int, int]: (максимум сообщений, бюджет токенов).
+    """
+    max_messages = getattr(dialog, 'dialog_vol', None) or config.HISTORY_MAX_MESSAGES
+    token_budget = getattr(dialog, 'token_budget', None) or config.HISTORY_TOKEN_BUDGET
+    return max_messages, token_budget
+
+
+# Общий кэш контекстов процесса
+dialog_contexts = DialogContextCache(config.DIALOG_CONTEXT_CACHE_SIZE, config.DIALOG_CONTEXT_CACHE_TTL)
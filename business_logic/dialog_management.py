@@ -1,6 +1,70 @@
 from sqlalchemy.orm import Session
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 from data_access.models import Dialog, GPTMessage
 from datetime import datetime
+from functools import partial
+from typing import NamedTuple, Optional, Tuple
+import config
+from data_access.database import on_commit
+from business_logic.cache import TTLCache
+from business_logic.dialog_context import DialogContext, dialog_contexts, format_message, history_window
+from business_logic.message_sink import message_sink
+
+
+class DialogItem(NamedTuple):
+    """Поля диалога, нужные для кнопки в списке выбора."""
+    dialog_id: int
+    bot_type: str
+    role_type: str
+
+
+class DialogPage(NamedTuple):
+    dialogs: Tuple[DialogItem, ...]
+    has_prev: bool
+    has_next: bool
+
+
+# Страницы списка диалогов: user_id -> {(after, before, limit): DialogPage}.
+# Сбрасываются целиком при создании или изменении любого диалога пользователя.
+dialog_pages = TTLCache('dialog_pages', maxsize=config.DIALOG_PAGE_CACHE_SIZE, ttl=config.DIALOG_PAGE_CACHE_TTL)
+
+
+def dialog_page_statement(user_id: int, after: Optional[int], before: Optional[int], limit: int):
+    """
+    Запрос страницы диалогов по ключу (user_id, dialog_id) без OFFSET.
+
+    Берется на одну строку больше limit, чтобы узнать, есть ли следующая страница.
+    """
+    statement = select(Dialog.dialog_id, Dialog.bot_type, Dialog.role_type).where(Dialog.user_id == user_id)
+    if before is not None:
+        return statement.where(Dialog.dialog_id < before).order_by(Dialog.dialog_id.desc()).limit(limit + 1)
+    if after is not None:
+        statement = statement.where(Dialog.dialog_id > after)
+    return statement.order_by(Dialog.dialog_id).limit(limit + 1)
+
+
+def build_dialog_page(rows, after: Optional[int], before: Optional[int], limit: int) -> DialogPage:
+    more = len(rows) > limit
+    dialogs = [DialogItem(*row) for row in rows[:limit]]
+    if before is not None:
+        # Предыдущая страница выбиралась в обратном порядке
+        dialogs.reverse()
+        return DialogPage(tuple(dialogs), has_prev=more, has_next=True)
+    return DialogPage(tuple(dialogs), has_prev=after is not None, has_next=more)
+
+
+def _cached_page(user_id: int, after: Optional[int], before: Optional[int], limit: int) -> Optional[DialogPage]:
+    pages = dialog_pages.get(user_id)
+    return pages.get((after, before, limit)) if pages else None
+
+
+def _cache_page(user_id: int, after: Optional[int], before: Optional[int], limit: int, page: DialogPage):
+    pages = dialog_pages.get(user_id)
+    if pages is None:
+        pages = {}
+        dialog_pages.set(user_id, pages)
+    pages[(after, before, limit)] = page
 
 
 class DialogManager:
@@ -18,6 +82,7 @@ class DialogManager:
         )
         self.session.add(new_dialog)
         self.session.commit()
+        dialog_pages.invalidate(user_id)
         return new_dialog.dialog_id
 
     def update_dialog(self, dialog_id: int, bot_type: str = None, role_type: str = None, dialog_vol: int = None):
@@ -38,6 +103,9 @@ class DialogManager:
             dialog.dialog_vol = dialog_vol
 
         self.session.commit()
+        # Окно истории могло измениться — контекст будет собран заново
+        dialog_contexts.invalidate(dialog_id)
+        dialog_pages.invalidate(dialog.user_id)
 
     def save_message(self, dialog_id: int, user_id: int, message_text: str):
         """
@@ -52,33 +120,161 @@ class DialogManager:
             new_message = GPTMessage(dialog_id=dialog_id, user_id=user_id, message_text=message_text)
             self.session.add(new_message)
             self.session.commit()
+            dialog_contexts.append(dialog_id, format_message(user_id, message_text))
         except Exception as e:
             self.session.rollback()
             print(f"Ошибка при сохранении сообщения: {e}")
-        finally:
-            self.session.close()
 
     def get_dialog_history(self, dialog_id: int):
         """
         Извлекает историю сообщений для данного диалога.
 
+        В историю попадают последние сообщения, укладывающиеся в окно диалога
+        (dialog_vol сообщений и token_budget токенов). Окно держится в памяти и
+        дополняется новыми сообщениями; из БД оно загружается только при первом обращении.
+
         :param dialog_id: Идентификатор диалога
         :return: Строка с историей сообщений
         """
 
-        try:
-            messages = self.session.query(GPTMessage).filter(GPTMessage.dialog_id == dialog_id).order_by(
-                GPTMessage.message_time).all()
-            history = "\n".join(
-                [f":User  {msg.message_text}" if msg.user_id else f"AI: {msg.message_text}" for msg in messages])
-            return history
-        finally:
-            self.session.close()
+        context = dialog_contexts.get(dialog_id)
+        if context is None:
+            max_messages, token_budget = history_window(self.get_dialog_by_id(dialog_id))
+            # Последние max_messages сообщений по индексу (dialog_id, message_time)
+            messages = self.session.query(GPTMessage.user_id, GPTMessage.message_text).filter(
+                GPTMessage.dialog_id == dialog_id).order_by(
+                GPTMessage.message_time.desc(), GPTMessage.message_id.desc()).limit(max_messages).all()
+            context = DialogContext(max_messages, token_budget,
+                                    (format_message(msg.user_id, msg.message_text) for msg in reversed(messages)))
+            dialog_contexts.put(dialog_id, context)
+        return context.render()
 
     def get_user_dialogs(self, user_id: int):
         """Получает все диалоги для указанного пользователя."""
         return self.session.query(Dialog).filter(Dialog.user_id == user_id).all()
 
+    def get_dialog_page(self, user_id: int, after: int = None, before: int = None,
+                        limit: int = None) -> DialogPage:
+        """
+        Страница списка диалогов пользователя (кэшируется до изменения его диалогов).
+
+        :param user_id: Идентификатор пользователя
+        :param after: Последний dialog_id предыдущей страницы (страница вперед)
+        :param before: Первый dialog_id следующей страницы (страница назад)
+        :param limit: Диалогов на странице; по умолчанию DIALOG_PAGE_SIZE
+        :return: DialogPage
+        """
+        limit = limit or config.DIALOG_PAGE_SIZE
+        page = _cached_page(user_id, after, before, limit)
+        if page is None:
+            rows = self.session.execute(dialog_page_statement(user_id, after, before, limit)).all()
+            page = build_dialog_page(rows, after, before, limit)
+            _cache_page(user_id, after, before, limit, page)
+        return page
+
     def get_dialog_by_id(self, dialog_id: int):
         """Извлекает диалог по его ID."""
         return self.session.query(Dialog).filter(Dialog.dialog_id == dialog_id).first()
+
+
+class AsyncDialogManager:
+    """
+    Асинхронный вариант DialogManager для использования в обработчиках бота.
+
+    Методы только отправляют изменения в БД (flush); фиксирует транзакцию
+    единица работы обновления (bot/unit_of_work.py), а кэши в памяти обновляются после фиксации.
+    """
+
+    def __init__(self, session: AsyncSession):
+        self.session = session
+
+    async def create_dialog(self, user_id: int, bot_type: str, role_type: str) -> int:
+        """Создает новый диалог для пользователя и возвращает его ID."""
+        new_dialog = Dialog(
+            user_id=user_id,
+            bot_type=bot_type,
+            role_type=role_type,
+            created_at=datetime.utcnow(),
+            updated_at=datetime.utcnow()
+        )
+        self.session.add(new_dialog)
+        await self.session.flush()
+        on_commit(self.session, partial(dialog_pages.invalidate, user_id))
+        return new_dialog.dialog_id
+
+    async def update_dialog(self, dialog_id: int, bot_type: str = None, role_type: str = None,
+                            dialog_vol: int = None):
+        """Обновляет существующий диалог по его ID."""
+        dialog = await self.get_dialog_by_id(dialog_id)
+
+        if not dialog:
+            raise ValueError("Dialog not found")
+
+        if bot_type is not None:
+            dialog.bot_type = bot_type
+        if role_type is not None:
+            dialog.role_type = role_type
+        if dialog_vol is not None:
+            dialog.dialog_vol = dialog_vol
+
+        await self.session.flush()
+        on_commit(self.session, partial(dialog_contexts.invalidate, dialog_id))
+        on_commit(self.session, partial(dialog_pages.invalidate, dialog.user_id))
+
+    async def save_message(self, dialog_id: int, user_id: int, message_text: str):
+        """
+        Сохраняет сообщение в базе данных.
+
+        :param dialog_id: Идентификатор диалога
+        :param user_id: Идентификатор пользователя
+        :param message_text: Текст сообщения
+        """
+
+        self.session.add(GPTMessage(dialog_id=dialog_id, user_id=user_id, message_text=message_text))
+        await self.session.flush()
+        # При откате сообщения в БД не будет — и в контексте в памяти тоже
+        on_commit(self.session, partial(dialog_contexts.append, dialog_id, format_message(user_id, message_text)))
+
+    async def get_dialog_history(self, dialog_id: int):
+        """
+        Извлекает историю сообщений для данного диалога в пределах его окна.
+
+        :param dialog_id: Идентификатор диалога
+        :return: Строка с историей сообщений
+        """
+
+        context = dialog_contexts.get(dialog_id)
+        # Несохраненные сообщения диалога записываем до чтения из БД (в режиме durable — всегда)
+        if context is None or message_sink.durable:
+            await message_sink.flush_dialog(dialog_id)
+        if context is None:
+            max_messages, token_budget = history_window(await self.get_dialog_by_id(dialog_id))
+            result = await self.session.execute(
+                select(GPTMessage.user_id, GPTMessage.message_text)
+                .where(GPTMessage.dialog_id == dialog_id)
+                .order_by(GPTMessage.message_time.desc(), GPTMessage.message_id.desc())
+                .limit(max_messages))
+            context = DialogContext(max_messages, token_budget,
+                                    (format_message(msg.user_id, msg.message_text) for msg in reversed(result.all())))
+            dialog_contexts.put(dialog_id, context)
+        return context.render()
+
+    async def get_user_dialogs(self, user_id: int):
+        """Получает все диалоги для указанного пользователя."""
+        result = await self.session.execute(select(Dialog).where(Dialog.user_id == user_id))
+        return result.scalars().all()
+
+    async def get_dialog_page(self, user_id: int, after: int = None, before: int = None,
+                              limit: int = None) -> DialogPage:
+        """Страница списка диалогов пользователя (см. DialogManager.get_dialog_page)."""
+        limit = limit or config.DIALOG_PAGE_SIZE
+        page = _cached_page(user_id, after, before, limit)
+        if page is None:
+            result = await self.session.execute(dialog_page_statement(user_id, after, before, limit))
+            page = build_dialog_page(result.all(), after, before, limit)
+            _cache_page(user_id, after, before, limit, page)
+        return page
+
+    async def get_dialog_by_id(self, dialog_id: int):
+        """Извлекает диалог по его ID."""
+        return await self.session.get(Dialog, dialog_id)
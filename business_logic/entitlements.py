@@ -0,0 +1,99 @@
+from datetime import datetime
+from typing import FrozenSet, NamedTuple, Optional
+
+from sqlalchemy import or_, select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+import config
+from business_logic.cache import TTLCache
+from business_logic.events import SUBSCRIPTION_EXPIRED, event_bus
+from business_logic.quota import quota_engine
+from data_access.models import Subscription
+
+"""
+Права пользователя: действующий тариф, доступные функции и срок подписки.
+
+Снимок прав загружается из БД при первом обращении и хранится в памяти до истечения
+ENTITLEMENT_CACHE_TTL, но не дольше, чем до конца подписки. Изменение подписки через
+менеджер подписок и событие SUBSCRIPTION_EXPIRED сбрасывают снимок, поэтому проверки
+на пути обработки сообщения обычно не обращаются к БД.
+
+Подписка с истекшим end_date не дает прав, даже если обход еще не снял с нее is_active.
+"""
+
+
+class Entitlements(NamedTuple):
+    plan: Optional[str]                 # Тип действующей подписки (None — без подписки)
+    features: FrozenSet[str]
+    expires_at: Optional[datetime]
+    max_requests: Optional[int]         # Лимит запросов по подписке (None — без ограничения)
+
+
+# Права пользователя без подписки
+FREE_ENTITLEMENTS = Entitlements(None, frozenset(), None, None)
+
+
+class EntitlementService:
+    def __init__(self, maxsize: int = None, ttl: float = None):
+        """
+        Args:
+            maxsize (int): Максимум пользователей в кэше.
+            ttl (float): Время жизни снимка в секундах.
+        """
+        self._cache = TTLCache('entitlements', maxsize=maxsize or config.ENTITLEMENT_CACHE_SIZE,
+                               ttl=ttl or config.ENTITLEMENT_CACHE_TTL)
+
+    async def get(self, session: AsyncSession, user_id: int) -> Entitlements:
+        """
+        Снимок прав пользователя (из кэша или одним запросом к БД).
+
+        Args:
+            session (AsyncSession): Сессия текущего обновления.
+            user_id (int): Идентификатор пользователя.
+
+        Returns:
+            Entitlements: Тариф, функции, срок и лимит запросов.
+        """
+        entitlements = self._cache.get(user_id)
+        if entitlements is not None:
+            return entitlements
+
+        now = datetime.utcnow()
+        row = (await session.execute(
+            select(Subscription.subscription_type, Subscription.conditions, Subscription.end_date)
+            .where(Subscription.user_id == user_id, Subscription.is_active.is_(True),
+                   or_(Subscription.end_date.is_(None), Subscription.end_date > now))
+            .order_by(Subscription.end_date.desc())
+            .limit(1))).first()
+        if row is None:
+            entitlements = FREE_ENTITLEMENTS
+            ttl = None
+        else:
+            conditions = row.conditions or {}
+            entitlements = Entitlements(row.subscription_type, frozenset(conditions.get('features', ())),
+                                        row.end_date, conditions.get('max_requests'))
+            # Снимок не должен пережить подписку
+            ttl = min((row.end_date - now).total_seconds(), self._cache.ttl) if row.end_date else None
+        self._cache.set(user_id, entitlements, ttl=ttl)
+        return entitlements
+
+    async def has_feature(self, session: AsyncSession, user_id: int, feature: str) -> bool:
+        """Доступна ли пользователю функция (например, 'image_generation')."""
+        return feature in (await self.get(session, user_id)).features
+
+    @staticmethod
+    def remaining_requests(user_id: int) -> Optional[int]:
+        """Остаток запросов по подписке из счетчиков квот в памяти (None — без ограничения или неизвестно)."""
+        return quota_engine.remaining(user_id)
+
+    def invalidate(self, user_id: int):
+        """Сбрасывает снимок прав пользователя."""
+        self._cache.invalidate(user_id)
+
+    def stats(self) -> dict:
+        return self._cache.stats()
+
+
+# Общий кэш прав процесса
+entitlements = EntitlementService()
+event_bus.subscribe(SUBSCRIPTION_EXPIRED, lambda user_id, **_: entitlements.invalidate(user_id))
@@ -0,0 +1,40 @@
+import asyncio
+import logging
+from collections import defaultdict
+from typing import Callable, Dict, List
+
+logger = logging.getLogger(__name__)
+
+"""
+События бизнес-логики внутри процесса.
+
+Модули подписываются на событие по имени и получают его параметры именованными аргументами.
+Обработчик может быть обычной функцией или корутиной; ошибка одного обработчика
+записывается в лог и не мешает остальным.
+"""
+
+# Подписка истекла: subscription_id, user_id, plan
+SUBSCRIPTION_EXPIRED = 'subscription_expired'
+
+
+class EventBus:
+    def __init__(self):
+        self._handlers: Dict[str, List[Callable]] = defaultdict(list)
+
+    def subscribe(self, event: str, handler: Callable):
+        """Регистрирует обработчик события."""
+        self._handlers[event].append(handler)
+
+    async def publish(self, event: str, **payload):
+        """Вызывает обработчики события по порядку регистрации."""
+        for handler in self._handlers.get(event, ()):
+            try:
+                result = handler(**payload)
+                if asyncio.iscoroutine(result):
+                    await result
+            except Exception:
+                logger.exception("Ошибка обработчика события %s", event)
+
+
+# Общая шина событий процесса
+event_bus = EventBus()
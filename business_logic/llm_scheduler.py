@@ -0,0 +1,157 @@
+import asyncio
+import time
+from collections import OrderedDict, deque
+from contextlib import asynccontextmanager
+from typing import Dict, Optional
+
+import config
+from monitoring.metrics import registry
+
+"""
+Планировщик запросов к языковым моделям.
+
+Для каждой модели задано число одновременно выполняемых запросов; остальные ждут в очереди.
+Очередь разбита по тарифам: пока ждут запросы платных тарифов, бесплатные не выбираются
+(тариф unlimited с priority_support — первым). Внутри тарифа пользователи обслуживаются
+по кругу, поэтому один пользователь с пачкой запросов не занимает все слоты модели.
+"""
+
+# Приоритет тарифа: чем меньше число, тем раньше запрос выходит из очереди
+TIER_PRIORITY = {
+    'unlimited': 0,
+    'premium': 1,
+    'basic': 2,
+}
+# Пользователи без подписки
+FREE_TIER = 'free'
+FREE_PRIORITY = len(TIER_PRIORITY)
+
+
+def tier_priority(tier: Optional[str]) -> int:
+    return TIER_PRIORITY.get(tier, FREE_PRIORITY)
+
+
+class _ModelQueue:
+    """Слоты и очередь ожидания одной модели."""
+
+    def __init__(self, model: str, limit: int):
+        self.model = model
+        self.limit = limit
+        self.active = 0
+        # приоритет -> {user_id: deque(future)}; порядок пользователей — очередь обхода по кругу
+        self.waiting: Dict[int, "OrderedDict[int, deque]"] = {}
+        self.active_gauge = registry.gauge('llm_active_requests', model=model)
+
+    def depth(self) -> int:
+        return sum(len(futures) for users in self.waiting.values() for futures in users.values())
+
+    async def acquire(self, user_id: int, tier: str):
+        priority = tier_priority(tier)
+        tier_label = tier or FREE_TIER
+        depth = registry.gauge('llm_queue_depth', model=self.model, tier=tier_label)
+        started = time.perf_counter()
+
+        if self.active < self.limit and not self.waiting:
+            self.active += 1
+        else:
+            future = asyncio.get_running_loop().create_future()
+            self.waiting.setdefault(priority, OrderedDict()).setdefault(user_id, deque()).append(future)
+            depth.inc()
+            try:
+                await future
+            except asyncio.CancelledError:
+                if future.done() and not future.cancelled():
+                    # Слот уже был передан, но ожидающий отменен — возвращаем слот
+                    self.release()
+                else:
+                    self._forget(priority, user_id, future)
+                raise
+            finally:
+                depth.dec()
+
+        self.active_gauge.set(self.active)
+        registry.histogram('llm_queue_wait_seconds', model=self.model, tier=tier_label).observe(
+            time.perf_counter() - started)
+
+    def release(self):
+        self.active -= 1
+        # Передаем освободившийся слот следующему ожидающему
+        while self.active < self.limit and self.waiting:
+            future = self._next_waiter()
+            if future is not None and not future.done():
+                self.active += 1
+                future.set_result(None)
+        self.active_gauge.set(self.active)
+
+    def _next_waiter(self) -> Optional[asyncio.Future]:
+        priority = min(self.waiting)
+        users = self.waiting[priority]
+        user_id, futures = next(iter(users.items()))
+        future = futures.popleft()
+        # Пользователь уходит в конец круга (или из очереди, если больше не ждет)
+        del users[user_id]
+        if futures:
+            users[user_id] = futures
+        if not users:
+            del self.waiting[priority]
+        return future
+
+    def _forget(self, priority: int, user_id: int, future: asyncio.Future):
+        users = self.waiting.get(priority, {})
+        futures = users.get(user_id)
+        if futures is None:
+            return
+        try:
+            futures.remove(future)
+        except ValueError:
+            return
+        if not futures:
+            del users[user_id]
+        if not users:
+            self.waiting.pop(priority, None)
+
+
+class LLMScheduler:
+    def __init__(self, model_limits: Dict[str, int] = None, default_limit: int = None):
+        """
+        Args:
+            model_limits (Dict[str, int]): Одновременных запросов на модель.
+            default_limit (int): Ограничение для остальных моделей.
+        """
+        self.model_limits = config.LLM_MODEL_CONCURRENCY if model_limits is None else model_limits
+        self.default_limit = default_limit or config.LLM_DEFAULT_CONCURRENCY
+        self._queues: Dict[str, _ModelQueue] = {}
+
+    def _queue(self, model: str) -> _ModelQueue:
+        queue = self._queues.get(model)
+        if queue is None:
+            queue = self._queues[model] = _ModelQueue(model, self.model_limits.get(model, self.default_limit))
+        return queue
+
+    @asynccontextmanager
+    async def slot(self, model: str, user_id: Optional[int] = None, tier: Optional[str] = FREE_TIER):
+        """
+        Ожидает свободный слот модели и удерживает его до выхода из блока.
+
+        Args:
+            model (str): Название модели.
+            user_id (int): Пользователь, от имени которого выполняется запрос.
+            tier (str): Тариф пользователя (FREE_TIER или None — без подписки).
+        """
+        queue = self._queue(model)
+        await queue.acquire(user_id, tier)
+        try:
+            yield
+        finally:
+            queue.release()
+
+    def stats(self) -> dict:
+        """Занятые слоты и глубина очереди по моделям."""
+        return {
+            model: {'limit': queue.limit, 'active': queue.active, 'queued': queue.depth()}
+            for model, queue in self._queues.items()
+        }
+
+
+# Общий планировщик процесса
+llm_scheduler = LLMScheduler()
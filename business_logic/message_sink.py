@@ -0,0 +1,150 @@
+import asyncio
+import logging
+from collections import Counter
+from datetime import datetime
+from typing import Optional
+
+from sqlalchemy import insert
+
+import config
+from business_logic.dialog_context import dialog_contexts, format_message
+from data_access.database import get_async_session
+from data_access.models import GPTMessage
+from monitoring.metrics import registry
+
+logger = logging.getLogger(__name__)
+
+"""
+Отложенная (write-behind) запись сообщений диалогов.
+
+Обработчик не ждет записи сообщения в БД: сообщение попадает в буфер и сразу дописывается
+в контекст диалога в памяти, а фоновая задача сохраняет буфер одним многострочным INSERT,
+когда набирается пакет или проходит интервал. Перед чтением истории из БД несохраненные
+сообщения этого диалога записываются, при заполнении буфера обработчики ждут записи,
+а при остановке бота буфер записывается целиком.
+"""
+
+
+class MessageSink:
+    def __init__(self, batch_size: int = None, flush_interval: float = None, max_buffer: int = None,
+                 durable: bool = None, session_factory=get_async_session):
+        """
+        Args:
+            batch_size (int): Размер пакета, при котором запись начинается сразу.
+            flush_interval (float): Максимальное время ожидания записи в секундах.
+            max_buffer (int): Максимум несохраненных сообщений.
+            durable (bool): Записывать сообщения диалога перед каждым чтением его истории.
+            session_factory: Фабрика асинхронных сессий.
+        """
+        self.batch_size = batch_size or config.MESSAGE_SINK_BATCH_SIZE
+        self.flush_interval = flush_interval or config.MESSAGE_SINK_FLUSH_INTERVAL
+        self.max_buffer = max_buffer or config.MESSAGE_SINK_MAX_BUFFER
+        self.durable = config.MESSAGE_SINK_DURABLE if durable is None else durable
+        self._session_factory = session_factory
+        self._buffer = []
+        self._pending = Counter()  # dialog_id -> несохраненных сообщений
+        self._flush_lock = asyncio.Lock()
+        self._wakeup = asyncio.Event()
+        self._space = asyncio.Event()
+        self._stopping = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+        self.buffered = registry.gauge('message_sink_buffered')
+        self.batch_sizes = registry.histogram('message_sink_batch_size', (1, 5, 10, 50, 100, 200, 500, 1000))
+        self.failures = registry.counter('message_sink_flush_failures_total')
+
+    def start(self):
+        """Запускает фоновую запись."""
+        if self._task is None or self._task.done():
+            self._stopping.clear()
+            self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def enqueue(self, dialog_id: int, user_id: int, message_text: str):
+        """
+        Ставит сообщение в очередь на запись.
+
+        :param dialog_id: Идентификатор диалога
+        :param user_id: Идентификатор пользователя
+        :param message_text: Текст сообщения
+        """
+        self.start()
+        # Буфер заполнен — ждем, пока фоновая задача его запишет
+        while len(self._buffer) >= self.max_buffer:
+            self._space.clear()
+            self._wakeup.set()
+            await self._space.wait()
+
+        self._buffer.append({
+            'dialog_id': dialog_id,
+            'user_id': user_id,
+            'message_text': message_text,
+            # Время фиксируется при постановке в очередь, чтобы сохранить порядок реплик
+            'message_time': datetime.utcnow(),
+        })
+        self._pending[dialog_id] += 1
+        self.buffered.set(len(self._buffer))
+        dialog_contexts.append(dialog_id, format_message(user_id, message_text))
+
+        if len(self._buffer) >= self.batch_size:
+            self._wakeup.set()
+
+    def has_pending(self, dialog_id: int) -> bool:
+        return self._pending.get(dialog_id, 0) > 0
+
+    async def flush_dialog(self, dialog_id: int):
+        """Записывает буфер, если в нем есть сообщения диалога."""
+        if self.has_pending(dialog_id):
+            await self.flush()
+
+    async def flush(self):
+        """Записывает все буферизованные сообщения одним многострочным INSERT."""
+        async with self._flush_lock:
+            if not self._buffer:
+                return
+            rows, self._buffer = self._buffer, []
+            try:
+                async with self._session_factory() as session:
+                    await session.execute(insert(GPTMessage), rows)
+                    await session.commit()
+            except BaseException:
+                # Возвращаем пакет в начало буфера — запишем при следующей попытке (в том числе после отмены)
+                self._buffer[:0] = rows
+                self.failures.inc()
+                raise
+            finally:
+                self.buffered.set(len(self._buffer))
+
+            for row in rows:
+                self._pending[row['dialog_id']] -= 1
+                if self._pending[row['dialog_id']] <= 0:
+                    del self._pending[row['dialog_id']]
+            self.batch_sizes.observe(len(rows))
+            self._space.set()
+
+    async def _run(self):
+        while not self._stopping.is_set():
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            try:
+                await self.flush()
+            except Exception:
+                logger.exception("Не удалось записать пакет сообщений, повтор через %.1f с", self.flush_interval)
+                try:
+                    await asyncio.wait_for(self._stopping.wait(), timeout=self.flush_interval)
+                except asyncio.TimeoutError:
+                    pass
+
+    async def stop(self):
+        """Останавливает фоновую запись и записывает остаток буфера (начатый пакет дописывается)."""
+        if self._task is not None:
+            self._stopping.set()
+            self._wakeup.set()
+            await self._task
+            self._task = None
+        await self.flush()
+
+
+# Общий буфер сообщений процесса
+message_sink = MessageSink()
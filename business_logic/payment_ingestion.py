@@ -0,0 +1,409 @@
+import argparse
+import asyncio
+import itertools
+import json
+import logging
+import time
+from collections import Counter, defaultdict
+from datetime import datetime
+from typing import Dict, Iterator, List, NamedTuple, Optional, Tuple
+
+from sqlalchemy.exc import OperationalError
+
+import config
+from business_logic.balance_management import AsyncBalanceManager
+from business_logic.cache import TTLCache
+from business_logic.subscription_management import AsyncSubscriptionManager, SubscriptionManager
+from data_access.database import dialect_insert, get_async_session
+from data_access.models import PaymentEvent
+from monitoring.metrics import registry
+
+logger = logging.getLogger(__name__)
+
+"""
+Прием уведомлений о платежах ЮKassa.
+
+Уведомление о завершенном платеже попадает в буфер, а фоновая задача применяет буфер пакетами
+по PAYMENT_INGEST_BATCH_SIZE: каждый пакет — одна транзакция БД. Сначала платежи пакета
+записываются в payment_events (INSERT ... ON CONFLICT ... RETURNING), и дальше применяются
+только вставленные строки и ранее не примененные (failed). Поэтому повтор уведомления — от шлюза, после
+перезапуска или из файла — не зачисляет платеж второй раз, в том числе если уведомления
+одного платежа обрабатывают разные процессы. Недавние payment_id помнятся в памяти, чтобы
+отбрасывать повторы без обращения к БД.
+
+Если пакет не применяется, его платежи применяются по одному: так платеж, который нельзя
+применить (например, неизвестный пользователь или нулевая сумма), не задерживает остальные.
+Такой платеж остается в payment_events со статусом failed и текстом ошибки; повтор его
+уведомления (от шлюза или из файла) снова пытается его применить. Ошибки соединения с БД
+не относятся к конкретному платежу — пакет возвращается в буфер целиком.
+
+Шлюз повторяет уведомление, пока не получит ответ 200, поэтому отвечать ему можно только
+после записи платежа в БД: submit(data, wait=True) возвращается после фиксации пакета с
+этим платежом, а если платеж отложен со статусом failed — выбрасывает PaymentFailedError.
+Прием уведомлений отвечает на это ошибкой, и повтор от шлюза снова применяет платеж.
+
+Платеж зачисляется на баланс (transactions и user_balances). Если в metadata платежа указан
+тариф, оплаченная сумма сразу списывается за подписку и подписка оформляется или продлевается.
+
+Источник уведомлений должен быть доверенным (проверка IP-адресов шлюза выполняется до приема).
+
+Запуск из командной строки применяет записанные уведомления из JSONL-файла:
+python -m business_logic.payment_ingestion notifications.jsonl
+"""
+
+# Событие ЮKassa о завершенном платеже; остальные события не меняют баланс
+SUCCEEDED_EVENT = 'payment.succeeded'
+
+# Статусы записей payment_events
+APPLIED = 'applied'
+FAILED = 'failed'      # Не удалось применить; повтор уведомления применяет платеж заново
+
+
+class PaymentFailedError(Exception):
+    """Платеж записан в payment_events со статусом failed: применить его не удалось."""
+
+
+class PaymentNotification(NamedTuple):
+    payment_id: str
+    user_id: int
+    amount: float
+    plan: Optional[str]     # Оплаченная подписка; None — пополнение баланса
+
+    @classmethod
+    def from_json(cls, data: dict) -> Optional['PaymentNotification']:
+        """Уведомление в формате ЮKassa; None — событие не о завершенном платеже."""
+        if data.get('event') != SUCCEEDED_EVENT:
+            return None
+        payment = data['object']
+        metadata = payment.get('metadata') or {}
+        return cls(payment['id'], int(metadata['user_id']), float(payment['amount']['value']),
+                   metadata.get('plan'))
+
+
+class PaymentIngestor:
+    def __init__(self, batch_size: int = None, flush_interval: float = None, max_buffer: int = None,
+                 session_factory=get_async_session):
+        """
+        Args:
+            batch_size (int): Уведомлений в одной транзакции БД.
+            flush_interval (float): Максимальное время ожидания пакета в секундах.
+            max_buffer (int): Максимум непримененных уведомлений в памяти.
+            session_factory: Фабрика асинхронных сессий.
+        """
+        self.batch_size = batch_size or config.PAYMENT_INGEST_BATCH_SIZE
+        self.flush_interval = flush_interval or config.PAYMENT_INGEST_FLUSH_INTERVAL
+        self.max_buffer = max_buffer or config.PAYMENT_INGEST_MAX_BUFFER
+        self._session_factory = session_factory
+        self._buffer: Dict[str, PaymentNotification] = {}
+        self._inflight = set()  # payment_id пакета, который применяется сейчас
+        self._waiters: Dict[str, asyncio.Future] = {}  # Ожидающие фиксации платежа в БД
+        self._seen = TTLCache('payment_seen', maxsize=config.PAYMENT_SEEN_CACHE_SIZE,
+                              ttl=config.PAYMENT_SEEN_CACHE_TTL)
+        self._flush_lock = asyncio.Lock()
+        self._wakeup = asyncio.Event()
+        self._space = asyncio.Event()
+        self._stopping = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+        self.results = {result: registry.counter('payment_notifications_total', result=result)
+                        for result in ('accepted', 'duplicate', 'ignored', 'invalid', 'applied', 'replayed',
+                                       'failed')}
+        self.buffered = registry.gauge('payment_ingest_buffered')
+        self.batch_sizes = registry.histogram('payment_ingest_batch_size', (1, 5, 10, 50, 100, 200, 500, 1000))
+        self.batch_seconds = registry.histogram('payment_ingest_batch_seconds')
+        self.failures = registry.counter('payment_ingest_failures_total')
+
+    def start(self):
+        """Запускает фоновое применение."""
+        if self._task is None or self._task.done():
+            self._stopping.clear()
+            self._task = asyncio.get_running_loop().create_task(self._run())
+
+    def _is_duplicate(self, payment_id: str) -> bool:
+        return payment_id in self._buffer or payment_id in self._inflight or self._seen.get(payment_id) is not None
+
+    async def _durable(self, payment_id: str):
+        # Ждет фиксации пакета с платежом; отмена ожидающего не отменяет ожидание остальных
+        future = self._waiters.get(payment_id)
+        if future is None:
+            future = self._waiters[payment_id] = asyncio.get_running_loop().create_future()
+        if await asyncio.shield(future) == FAILED:
+            raise PaymentFailedError(f"Платеж {payment_id} не применен")
+
+    def _release(self, batch: List[PaymentNotification], failures: List[str]):
+        for payment in batch:
+            future = self._waiters.pop(payment.payment_id, None)
+            if future is not None and not future.done():
+                future.set_result(FAILED if payment.payment_id in failures else APPLIED)
+
+    async def submit(self, data: dict, wait: bool = False) -> bool:
+        """
+        Принимает уведомление о платеже.
+
+        Args:
+            data (dict): Тело уведомления ЮKassa.
+            wait (bool): Дождаться записи платежа в БД (в том числе повтора, который еще применяется).
+
+        Returns:
+            bool: True, если уведомление поставлено на применение; False — повтор или другое событие.
+
+        Raises:
+            PaymentFailedError: Если wait=True, а платеж применить не удалось (он записан со статусом failed).
+        """
+        try:
+            notification = PaymentNotification.from_json(data)
+        except (KeyError, TypeError, ValueError):
+            logger.warning("Уведомление о платеже без обязательных полей: %s", data)
+            self.results['invalid'].inc()
+            return False
+        if notification is None:
+            self.results['ignored'].inc()
+            return False
+
+        self.start()
+        # Буфер заполнен — ждем, пока фоновая задача применит пакет
+        while len(self._buffer) >= self.max_buffer:
+            self._space.clear()
+            self._wakeup.set()
+            await self._space.wait()
+
+        payment_id = notification.payment_id
+        if self._is_duplicate(payment_id):
+            self.results['duplicate'].inc()
+            if wait and (payment_id in self._buffer or payment_id in self._inflight):
+                await self._durable(payment_id)
+            return False
+        self._buffer[payment_id] = notification
+        self.results['accepted'].inc()
+        self.buffered.set(len(self._buffer))
+        if len(self._buffer) >= self.batch_size:
+            self._wakeup.set()
+        if wait:
+            await self._durable(payment_id)
+        return True
+
+    async def _apply(self, batch: List[PaymentNotification]) -> List[PaymentNotification]:
+        # Возвращает платежи пакета, примененные впервые
+        async with self._session_factory() as session:
+            now = datetime.utcnow()
+            insert = dialect_insert(session, PaymentEvent).values([
+                {'payment_id': payment.payment_id, 'user_id': payment.user_id, 'amount': payment.amount,
+                 'plan': payment.plan, 'processed_at': now, 'status': APPLIED} for payment in batch])
+            # Уже примененные платежи пропускаются, а не примененные ранее (failed) применяются заново
+            fresh = set((await session.execute(
+                insert.on_conflict_do_update(
+                    index_elements=[PaymentEvent.payment_id],
+                    set_={'user_id': insert.excluded.user_id, 'amount': insert.excluded.amount,
+                          'plan': insert.excluded.plan, 'processed_at': insert.excluded.processed_at,
+                          'status': APPLIED, 'error': None},
+                    where=PaymentEvent.status == FAILED)
+                .returning(PaymentEvent.payment_id))).scalars())
+            payments = [payment for payment in batch if payment.payment_id in fresh]
+
+            by_user = defaultdict(list)
+            for payment in payments:
+                by_user[payment.user_id].append(payment)
+
+            balances = AsyncBalanceManager(session)
+            subscriptions = AsyncSubscriptionManager(session)
+            # Счета блокируются в порядке user_id — параллельные пакеты не попадут во взаимную блокировку
+            for user_id in sorted(by_user):
+                for payment in by_user[user_id]:
+                    await balances.add_funds(user_id, payment.amount, f"Платеж {payment.payment_id}")
+                    if payment.plan is not None:
+                        await self._activate_plan(balances, subscriptions, payment)
+            await session.commit()
+        return payments
+
+    async def _apply_each(self, batch: List[PaymentNotification]) -> Tuple[List[PaymentNotification], List[str]]:
+        # Применяет платежи по одному; возвращает примененные впервые и payment_id не примененных
+        payments, failed = [], []
+        for payment in batch:
+            try:
+                payments.extend(await self._apply([payment]))
+            except OperationalError:
+                # БД недоступна — платеж ни при чем, пакет будет повторен целиком
+                raise
+            except Exception as error:
+                logger.exception("Платеж %s не применен и отложен", payment.payment_id)
+                await self._dead_letter(payment, error)
+                failed.append(payment.payment_id)
+        return payments, failed
+
+    async def _dead_letter(self, payment: PaymentNotification, error: Exception):
+        # Отдельная транзакция: запись о платеже, который не удалось применить
+        async with self._session_factory() as session:
+            insert = dialect_insert(session, PaymentEvent).values(
+                payment_id=payment.payment_id, user_id=payment.user_id, amount=payment.amount, plan=payment.plan,
+                processed_at=datetime.utcnow(), status=FAILED, error=f"{type(error).__name__}: {error}")
+            # Платеж, который тем временем применил другой процесс, не помечается как failed
+            await session.execute(insert.on_conflict_do_update(
+                index_elements=[PaymentEvent.payment_id],
+                set_={'processed_at': insert.excluded.processed_at, 'error': insert.excluded.error},
+                where=PaymentEvent.status == FAILED))
+            await session.commit()
+
+    @staticmethod
+    async def _activate_plan(balances: AsyncBalanceManager, subscriptions: AsyncSubscriptionManager,
+                             payment: PaymentNotification):
+        conditions = SubscriptionManager.get_conditions(subscription_type=payment.plan)
+        if not conditions:
+            # Деньги не теряются: платеж остается на балансе
+            logger.warning("Платеж %s за неизвестный тариф '%s' зачислен на баланс",
+                           payment.payment_id, payment.plan)
+            return
+
+        await balances.deduct_funds(payment.user_id, payment.amount, f"Подписка '{payment.plan}'")
+        current = {subscription['plan'] for subscription in await subscriptions.get_subscriptions(payment.user_id)}
+        if payment.plan in current:
+            await subscriptions.renew_subscription(payment.user_id, payment.plan, conditions['duration'])
+            return
+        if current:
+            # Смена тарифа: прежняя подписка заменяется новой
+            await subscriptions.remove_subscription(payment.user_id)
+        await subscriptions.add_subscription(payment.user_id, payment.plan, conditions['duration'])
+
+    async def flush(self) -> int:
+        """
+        Применяет все накопленные уведомления пакетами.
+
+        Returns:
+            int: Количество платежей, примененных впервые.
+        """
+        async with self._flush_lock:
+            started = time.perf_counter()
+            applied = replayed = failed = 0
+            while self._buffer:
+                batch = list(itertools.islice(self._buffer.values(), self.batch_size))
+                for payment in batch:
+                    del self._buffer[payment.payment_id]
+                    self._inflight.add(payment.payment_id)
+
+                batch_started = time.perf_counter()
+                try:
+                    try:
+                        payments, failures = await self._apply(batch), []
+                    except OperationalError:
+                        raise
+                    except Exception:
+                        logger.warning("Пакет из %d платежей не применен, применяем по одному", len(batch),
+                                       exc_info=True)
+                        payments, failures = await self._apply_each(batch)
+                except BaseException:
+                    # Возвращаем пакет в буфер (в том числе при отмене) — применим при следующей попытке
+                    self._buffer.update((payment.payment_id, payment) for payment in batch)
+                    self.failures.inc()
+                    raise
+                finally:
+                    self._inflight.difference_update(payment.payment_id for payment in batch)
+                    self.buffered.set(len(self._buffer))
+
+                self._release(batch, failures)
+                for payment in batch:
+                    # Повтор уведомления о не примененном платеже не отбрасывается — он применит платеж заново
+                    if payment.payment_id not in failures:
+                        self._seen.set(payment.payment_id, True)
+                applied += len(payments)
+                failed += len(failures)
+                replayed += len(batch) - len(payments) - len(failures)
+                self.batch_sizes.observe(len(batch))
+                self.batch_seconds.observe(time.perf_counter() - batch_started)
+                self._space.set()
+
+            self.results['applied'].inc(applied)
+            self.results['replayed'].inc(replayed)
+            self.results['failed'].inc(failed)
+            if applied or replayed or failed:
+                elapsed = time.perf_counter() - started
+                logger.info("Применено платежей: %d за %.2f с (%.1f/с), уже примененных: %d, не примененных: %d",
+                            applied, elapsed, applied / elapsed if elapsed else 0.0, replayed, failed)
+            return applied
+
+    async def _run(self):
+        while not self._stopping.is_set():
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            try:
+                await self.flush()
+            except Exception:
+                logger.exception("Не удалось применить пакет платежей, повтор через %.1f с", self.flush_interval)
+                try:
+                    await asyncio.wait_for(self._stopping.wait(), timeout=self.flush_interval)
+                except asyncio.TimeoutError:
+                    pass
+
+    async def stop(self):
+        """Дожидается применения текущего пакета, останавливает прием в фоне и применяет остаток буфера."""
+        if self._task is not None:
+            self._stopping.set()
+            self._wakeup.set()
+            await self._task
+            self._task = None
+        await self.flush()
+
+
+# Общий прием платежей процесса
+payment_ingestor = PaymentIngestor()
+
+
+def read_notifications(path: str) -> Iterator[dict]:
+    """Читает уведомления из JSONL-файла (одно уведомление на строку)."""
+    with open(path, encoding='utf-8') as stream:
+        for line in stream:
+            if line.strip():
+                yield json.loads(line)
+
+
+async def replay(notifications: List[dict], batch_size: int = None) -> Counter:
+    """
+    Применяет записанные уведомления так же, как при приеме от шлюза.
+
+    Args:
+        notifications (List[dict]): Уведомления в формате ЮKassa.
+        batch_size (int): Уведомлений в одной транзакции БД.
+
+    Returns:
+        Counter: Количество уведомлений по результату приема.
+    """
+    ingestor = PaymentIngestor(batch_size=batch_size)
+    statuses = Counter()
+    try:
+        for data in notifications:
+            statuses['accepted' if await ingestor.submit(data) else 'rejected'] += 1
+    finally:
+        await ingestor.stop()
+    return statuses
+
+
+def main():
+    from data_access.database import async_engine, init_db
+
+    parser = argparse.ArgumentParser(description="Применение записанных уведомлений о платежах")
+    parser.add_argument('path', help="JSONL-файл с уведомлениями ЮKassa")
+    parser.add_argument('--batch-size', type=int, default=config.PAYMENT_INGEST_BATCH_SIZE,
+                        help="Уведомлений в одной транзакции БД")
+    parser.add_argument('--repeat', type=int, default=1, help="Сколько раз повторить файл")
+    args = parser.parse_args()
+
+    init_db()
+    notifications = list(read_notifications(args.path)) * args.repeat
+
+    async def run() -> Counter:
+        try:
+            return await replay(notifications, args.batch_size)
+        finally:
+            await async_engine.dispose()
+
+    started = time.perf_counter()
+    statuses = asyncio.run(run())
+    elapsed = time.perf_counter() - started
+    logger.info("Обработано %d уведомлений за %.2f с (%.1f/с), прием: %s, метрики: %s",
+                len(notifications), elapsed, len(notifications) / elapsed if elapsed else 0.0,
+                dict(statuses), registry.snapshot('payment_'))
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO)
+    main()
@@ -0,0 +1,304 @@
+import asyncio
+import logging
+import time
+from collections import Counter
+from datetime import datetime
+from typing import Dict, NamedTuple, Optional
+
+from sqlalchemy import or_, select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+import config
+from business_logic.cache import TTLCache
+from business_logic.events import SUBSCRIPTION_EXPIRED, event_bus
+from data_access.database import dialect_insert, get_async_session
+from data_access.models import QuotaUsage, Subscription
+from monitoring.metrics import registry
+
+logger = logging.getLogger(__name__)
+
+"""
+Квоты запросов к моделям.
+
+Лимит max_requests берется из Subscription.conditions и действует на всю подписку; частота
+запросов дополнительно ограничивается token bucket для всех пользователей, включая бесплатных.
+Квота пользователя загружается из БД один раз (и повторно через QUOTA_STATE_TTL), после чего
+проверка выполняется в памяти без обращений к БД; после end_date подписки квота загружается
+заново, даже если событие SUBSCRIPTION_EXPIRED пришло в другой процесс. В памяти держится не больше
+QUOTA_STATE_CACHE_SIZE квот; квоты неактивных пользователей вытесняются.
+
+Израсходованные запросы копятся по подпискам и раз в QUOTA_FLUSH_INTERVAL записываются в
+quota_usage одним INSERT ... ON CONFLICT DO UPDATE (used = used + n). Если процессов несколько,
+счетчики сводятся через общий бэкенд (Redis INCRBY): после записи каждый процесс узнает
+общее число запросов по подписке. Превышение лимита между процессами ограничено тем,
+что успевает накопиться за один интервал.
+"""
+
+
+class QuotaDecision(NamedTuple):
+    allowed: bool
+    reason: Optional[str] = None        # 'rate' — слишком часто, 'quota' — исчерпан лимит подписки
+    remaining: Optional[int] = None     # Осталось запросов по подписке (None — без ограничения)
+    retry_after: float = 0.0            # Через сколько секунд появится токен (для reason='rate')
+
+
+class _UserQuota:
+    __slots__ = ('subscription_id', 'limit', 'expires_at', 'synced', 'tokens', 'refilled_at', 'loaded_at')
+
+    def __init__(self, subscription_id: Optional[int], limit: Optional[int], synced: int,
+                 expires_at: Optional[datetime] = None):
+        self.subscription_id = subscription_id
+        self.limit = limit
+        self.expires_at = expires_at    # Конец подписки (UTC); после него квота перечитывается
+        self.synced = synced            # Общее число запросов по подписке на момент последней сверки
+        self.tokens = float(config.QUOTA_BUCKET_CAPACITY)
+        self.refilled_at = time.monotonic()
+        self.loaded_at = time.monotonic()
+
+
+class LocalCounterBackend:
+    """Один процесс (или шардирование по пользователям): общий счетчик — это запись в БД."""
+
+    async def sync(self, deltas: Dict[int, int], known: Dict[int, int]) -> Dict[int, int]:
+        return {subscription_id: known[subscription_id] + delta for subscription_id, delta in deltas.items()}
+
+    async def load(self, subscription_id: int) -> Optional[int]:
+        return None
+
+
+class RedisCounterBackend:
+    """Общие счетчики подписок в Redis: ключи "<prefix>:quota:<subscription_id>"."""
+
+    def __init__(self, url: str = None, prefix: str = None):
+        # Клиент Redis нужен только этому бэкенду, поэтому импортируется здесь
+        from redis import asyncio as redis_asyncio
+
+        self._client = redis_asyncio.from_url(url or config.REDIS_URL, decode_responses=True)
+        self.prefix = prefix or config.STATE_KEY_PREFIX
+
+    def _key(self, subscription_id: int) -> str:
+        return f"{self.prefix}:quota:{subscription_id}"
+
+    async def sync(self, deltas: Dict[int, int], known: Dict[int, int]) -> Dict[int, int]:
+        async with self._client.pipeline(transaction=False) as pipe:
+            for subscription_id, delta in deltas.items():
+                # Если счетчика нет (Redis перезапущен), он начинается с известного процессу значения
+                pipe.set(self._key(subscription_id), known[subscription_id], nx=True)
+                pipe.incrby(self._key(subscription_id), delta)
+            results = await pipe.execute()
+        return dict(zip(deltas, results[1::2]))
+
+    async def load(self, subscription_id: int) -> Optional[int]:
+        value = await self._client.get(self._key(subscription_id))
+        return int(value) if value is not None else None
+
+
+# Бэкенды по значению QUOTA_BACKEND
+COUNTER_BACKENDS = {
+    'local': LocalCounterBackend,
+    'redis': RedisCounterBackend,
+}
+
+
+class QuotaEngine:
+    def __init__(self, backend=None, flush_interval: float = None, state_ttl: float = None,
+                 session_factory=get_async_session):
+        """
+        Args:
+            backend: Бэкенд общих счетчиков (по умолчанию по QUOTA_BACKEND).
+            flush_interval (float): Период записи израсходованных запросов в секундах.
+            state_ttl (float): Время жизни загруженной квоты в секундах.
+            session_factory: Фабрика асинхронных сессий для фоновой записи.
+        """
+        self._backend = backend
+        self.flush_interval = flush_interval or config.QUOTA_FLUSH_INTERVAL
+        self.state_ttl = config.QUOTA_STATE_TTL if state_ttl is None else state_ttl
+        self._session_factory = session_factory
+        # user_id -> _UserQuota; при каждой загрузке срок записи продлевается
+        self._states = TTLCache('quota_states', maxsize=config.QUOTA_STATE_CACHE_SIZE,
+                                ttl=max(config.QUOTA_STATE_IDLE_TTL, self.state_ttl))
+        self._pending = Counter()   # subscription_id -> запросов, еще не записанных
+        self._inflight = Counter()  # subscription_id -> запросов, записываемых сейчас
+        self._flush_lock = asyncio.Lock()
+        self._stopping = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+        self.denied = {reason: registry.counter('quota_denied_total', reason=reason) for reason in ('rate', 'quota')}
+
+    @property
+    def backend(self):
+        if self._backend is None:
+            self._backend = COUNTER_BACKENDS[config.QUOTA_BACKEND]()
+        return self._backend
+
+    def _used(self, state: _UserQuota) -> int:
+        return state.synced + self._pending[state.subscription_id] + self._inflight[state.subscription_id]
+
+    async def _load(self, session: AsyncSession, user_id: int) -> _UserQuota:
+        row = (await session.execute(
+            select(Subscription.subscription_id, Subscription.conditions, Subscription.end_date, QuotaUsage.used)
+            .outerjoin(QuotaUsage, QuotaUsage.subscription_id == Subscription.subscription_id)
+            .where(Subscription.user_id == user_id, Subscription.is_active.is_(True),
+                   or_(Subscription.end_date.is_(None), Subscription.end_date > datetime.utcnow()))
+            .order_by(Subscription.end_date.desc())
+            .limit(1))).first()
+        if row is None:
+            # Без подписки — только ограничение частоты
+            return _UserQuota(None, None, 0)
+
+        synced = row.used or 0
+        shared = await self.backend.load(row.subscription_id)
+        if shared is not None:
+            synced = max(synced, shared)
+        return _UserQuota(row.subscription_id, (row.conditions or {}).get('max_requests'), synced, row.end_date)
+
+    async def _state(self, session: AsyncSession, user_id: int) -> _UserQuota:
+        state = self._states.get(user_id)
+        expired = state is not None and state.expires_at is not None and state.expires_at <= datetime.utcnow()
+        if state is not None and not expired and time.monotonic() - state.loaded_at < self.state_ttl:
+            return state
+        if state is not None and (self._pending[state.subscription_id] or self._inflight[state.subscription_id]):
+            # Незаписанные запросы учтены только здесь — перечитаем после записи
+            state.loaded_at = time.monotonic()
+            self._states.set(user_id, state)
+            return state
+
+        fresh = await self._load(session, user_id)
+        if state is not None:
+            # Запас токенов частоты переносим — перезагрузка не должна его сбрасывать
+            fresh.tokens, fresh.refilled_at = state.tokens, state.refilled_at
+        self._states.set(user_id, fresh)
+        return fresh
+
+    async def consume(self, session: AsyncSession, user_id: int) -> QuotaDecision:
+        """
+        Проверяет квоту и, если запрос разрешен, учитывает его.
+
+        Обращается к БД только при первой проверке пользователя и по истечении QUOTA_STATE_TTL.
+
+        Args:
+            session (AsyncSession): Сессия текущего обновления (для загрузки квоты).
+            user_id (int): Идентификатор пользователя.
+
+        Returns:
+            QuotaDecision: Разрешен ли запрос и почему нет.
+        """
+        state = await self._state(session, user_id)
+
+        now = time.monotonic()
+        state.tokens = min(float(config.QUOTA_BUCKET_CAPACITY),
+                           state.tokens + (now - state.refilled_at) * config.QUOTA_BUCKET_REFILL)
+        state.refilled_at = now
+        if state.tokens < 1:
+            self.denied['rate'].inc()
+            return QuotaDecision(False, 'rate', retry_after=(1 - state.tokens) / config.QUOTA_BUCKET_REFILL)
+
+        remaining = None
+        if state.limit is not None:
+            remaining = state.limit - self._used(state)
+            if remaining <= 0:
+                self.denied['quota'].inc()
+                return QuotaDecision(False, 'quota', remaining=0)
+            remaining -= 1
+
+        state.tokens -= 1
+        if state.subscription_id is not None:
+            self._pending[state.subscription_id] += 1
+        return QuotaDecision(True, remaining=remaining)
+
+    def remaining(self, user_id: int) -> Optional[int]:
+        """
+        Остаток запросов по подписке из памяти, без обращения к БД.
+
+        Returns:
+            Optional[int]: Остаток или None, если лимита нет или квота пользователя еще не загружена.
+        """
+        state = self._states.get(user_id)
+        if state is None or state.limit is None:
+            return None
+        return max(0, state.limit - self._used(state))
+
+    def forget(self, user_id: int):
+        """Сбрасывает квоту пользователя в памяти (например, после смены подписки)."""
+        self._states.invalidate(user_id)
+
+    # --- Запись ---
+
+    def start(self):
+        """Запускает периодическую запись."""
+        if self._task is None or self._task.done():
+            self._stopping.clear()
+            self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def flush(self):
+        """Записывает израсходованные запросы в БД и сверяет счетчики с общим бэкендом."""
+        async with self._flush_lock:
+            if not self._pending:
+                return
+            deltas = dict(self._pending)
+            self._pending.clear()
+            self._inflight.update(deltas)
+            known = {subscription_id: 0 for subscription_id in deltas}
+            for state in self._states.values():
+                if state.subscription_id in known:
+                    known[state.subscription_id] = state.synced
+
+            try:
+                async with self._session_factory() as session:
+                    insert = dialect_insert(session, QuotaUsage)
+                    await session.execute(
+                        insert.on_conflict_do_update(
+                            index_elements=[QuotaUsage.subscription_id],
+                            set_={'used': QuotaUsage.used + insert.excluded.used,
+                                  'updated_at': insert.excluded.updated_at}),
+                        [{'subscription_id': subscription_id, 'used': delta, 'updated_at': datetime.utcnow()}
+                         for subscription_id, delta in deltas.items()])
+                    await session.commit()
+            except BaseException:
+                # Не записали (в том числе из-за отмены) — запросы снова ждут записи
+                self._pending.update(deltas)
+                self._release_inflight(deltas)
+                raise
+
+            registry.counter('quota_flushed_total').inc(sum(deltas.values()))
+            totals = {subscription_id: known[subscription_id] + delta for subscription_id, delta in deltas.items()}
+            try:
+                totals = await self.backend.sync(deltas, known)
+            except Exception:
+                logger.exception("Не удалось сверить счетчики квот с общим бэкендом")
+            finally:
+                # Запись уже зафиксирована: даже при отмене сверки запросы переходят из inflight в synced
+                for state in self._states.values():
+                    if state.subscription_id in totals:
+                        state.synced = totals[state.subscription_id]
+                self._release_inflight(deltas)
+
+    def _release_inflight(self, deltas: Dict[int, int]):
+        for subscription_id, delta in deltas.items():
+            self._inflight[subscription_id] -= delta
+            if self._inflight[subscription_id] <= 0:
+                del self._inflight[subscription_id]
+
+    async def _run(self):
+        while not self._stopping.is_set():
+            try:
+                await asyncio.wait_for(self._stopping.wait(), timeout=self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            try:
+                await self.flush()
+            except Exception:
+                logger.exception("Не удалось записать израсходованные квоты")
+
+    async def stop(self):
+        """Останавливает периодическую запись после текущей и записывает остаток."""
+        if self._task is not None:
+            self._stopping.set()
+            await self._task
+            self._task = None
+        await self.flush()
+
+
+# Общий учет квот процесса
+quota_engine = QuotaEngine()
+# Истекшая подписка больше не дает лимита — квота будет загружена заново
+event_bus.subscribe(SUBSCRIPTION_EXPIRED, lambda user_id, **_: quota_engine.forget(user_id))
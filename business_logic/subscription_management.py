@@ -1,11 +1,26 @@
 # Импортируем класс Session из модуля sqlalchemy.orm
 from sqlalchemy.orm import Session
 
+# Импортируем построитель запросов и асинхронную сессию
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+
 # Импортируем datetime и timedelta из модуля datetime
 from datetime import datetime, timedelta
+from functools import partial
+from typing import Optional
 
 # Импортируем модели Subscription и User из модуля models
+from data_access.database import on_commit
 from data_access.models import Subscription, User
+from business_logic.quota import quota_engine
+from business_logic.entitlements import entitlements
+
+
+def subscription_changed(user_id: int):
+    """Сбрасывает данные о подписке пользователя, закэшированные в памяти процесса."""
+    entitlements.invalidate(user_id)
+    quota_engine.forget(user_id)
 
 
 class SubscriptionManager:
@@ -23,7 +38,7 @@ class SubscriptionManager:
         self.db = db  # Сохраняем сессию базы данных для использования в методах
 
     @staticmethod
-    def get_conditions(self, subscription_type):
+    def get_conditions(subscription_type):
         # Определение условий для каждой подписки
         conditions = {
             "basic": {
@@ -65,10 +80,10 @@ class SubscriptionManager:
             return f"Подписка '{plan}' уже существует для пользователя с ID {user_id}."
 
         # Получаем условия для подписки
-        conditions = self.get_conditions(self, subscription_type=plan)
+        conditions = self.get_conditions(subscription_type=plan)
 
         # Устанавливаем дату начала и окончания подписки
-        start_date = datetime.now()
+        start_date = datetime.utcnow()
         end_date = start_date + timedelta(days=duration_days)
 
         # Создаем новую подписку с условиями
@@ -83,6 +98,7 @@ class SubscriptionManager:
         # Добавляем новую подписку в сессию и сохраняем изменения в базе данных
         self.db.add(new_subscription)
         self.db.commit()
+        subscription_changed(user_id)
         return f"Подписка '{plan}' добавлена пользователю с ID {user_id}."
 
     def remove_subscription(self, user_id: int) -> str:
@@ -102,6 +118,7 @@ class SubscriptionManager:
             # Удаляем подписку из базы данных
             self.db.delete(subscription)
             self.db.commit()
+            subscription_changed(user_id)
             return f"Подписка '{subscription}' удалена для пользователя с ID {subscription}."
 
         return f"Подписка '{subscription}' не найдена у пользователя с ID {subscription}."
@@ -123,7 +140,7 @@ class SubscriptionManager:
 
         # Формируем и возвращаем список подписок с необходимыми данными
         return [{
-            "plan": sub.plan,
+            "plan": sub.subscription_type,
             "start_date": sub.start_date,
             "end_date": sub.end_date
         } for sub in subscriptions]
@@ -139,10 +156,10 @@ class SubscriptionManager:
         Returns:
             bool: True, если подписка активна, иначе False.
         """
-        # Проверяем наличие активной подписки
+        # Проверяем наличие активной подписки; истекшие снимает фоновый обход (subscription_sweeper)
         subscription = self.db.query(Subscription).filter(
             Subscription.user_id == user_id,
-            Subscription.end_date > datetime.now()
+            Subscription.is_active.is_(True)
         ).first()
 
         return subscription is not None  # Возвращаем True, если подписка найдена
@@ -162,20 +179,173 @@ class SubscriptionManager:
         # Находим подписку по user_id и plan
         subscription = self.db.query(Subscription).filter(
             Subscription.user_id == user_id,
-            Subscription.plan == plan
+            Subscription.subscription_type == plan
         ).first()
 
         if subscription:
             # Если подписка активна, продлеваем ее
-            if subscription.end_date > datetime.now():
+            if subscription.end_date > datetime.utcnow():
                 subscription.end_date += timedelta(days=duration_days)
             else:
                 # Если подписка неактивна, обновляем даты
-                subscription.start_date = datetime.now()
+                subscription.start_date = datetime.utcnow()
                 subscription.end_date = subscription.start_date + timedelta(days=duration_days)
+            subscription.is_active = True
 
             # Сохраняем изменения в базе данных
             self.db.commit()
+            subscription_changed(user_id)
+            return f"Подписка '{plan}' продлена для пользователя с ID {user_id}."
+
+        return f"Подписка '{plan}' не найдена у пользователя с ID {user_id}."
+
+
+class AsyncSubscriptionManager:
+    """
+    Асинхронный менеджер подписок, повторяющий операции SubscriptionManager через AsyncSession.
+    Изменения только отправляются в БД (flush); транзакцию фиксирует вызывающий код, и только
+    после фиксации сбрасываются права и квоты пользователя в памяти.
+    """
+
+    def __init__(self, db: AsyncSession):
+        """
+        Инициализация менеджера подписок с использованием асинхронной сессии.
+
+        Args:
+            db (AsyncSession): Асинхронная сессия базы данных SQLAlchemy.
+        """
+        self.db = db
+
+    async def _get_subscription(self, user_id: int, plan: str = None):
+        # Первая подписка пользователя (при необходимости — определенного типа)
+        query = select(Subscription).where(Subscription.user_id == user_id)
+        if plan is not None:
+            query = query.where(Subscription.subscription_type == plan)
+        result = await self.db.execute(query)
+        return result.scalars().first()
+
+    async def add_subscription(self, user_id: int, plan: str, duration_days: int) -> str:
+        """
+        Добавляет новую подписку пользователю в базу данных.
+
+        Args:
+            user_id (int): Уникальный идентификатор пользователя.
+            plan (str): Тип подписки, которую нужно добавить.
+            duration_days (int): Продолжительность подписки в днях.
+
+        Returns:
+            str: Результат операции.
+        """
+        if await self._get_subscription(user_id):
+            return f"Подписка '{plan}' уже существует для пользователя с ID {user_id}."
+
+        conditions = SubscriptionManager.get_conditions(subscription_type=plan)
+
+        self.db.add(Subscription(
+            user_id=user_id,
+            subscription_type=plan,
+            start_date=datetime.utcnow(),
+            end_date=datetime.utcnow() + timedelta(days=conditions["duration"]),
+            conditions=conditions
+        ))
+        await self.db.flush()
+        on_commit(self.db, partial(subscription_changed, user_id))
+        return f"Подписка '{plan}' добавлена пользователю с ID {user_id}."
+
+    async def remove_subscription(self, user_id: int) -> str:
+        """
+        Удаляет подписку у пользователя из базы данных.
+
+        Args:
+            user_id (int): Уникальный идентификатор пользователя.
+
+        Returns:
+            str: Результат операции.
+        """
+        subscription = await self._get_subscription(user_id)
+
+        if subscription:
+            await self.db.delete(subscription)
+            await self.db.flush()
+            on_commit(self.db, partial(subscription_changed, user_id))
+            return f"Подписка '{subscription.subscription_type}' удалена для пользователя с ID {user_id}."
+
+        return f"Подписка не найдена у пользователя с ID {user_id}."
+
+    async def get_subscriptions(self, user_id: int) -> list:
+        """
+        Возвращает список всех подписок пользователя.
+
+        Args:
+            user_id (int): Уникальный идентификатор пользователя.
+
+        Returns:
+            list: Список подписок пользователя.
+        """
+        result = await self.db.execute(select(Subscription).where(Subscription.user_id == user_id))
+        return [{
+            "plan": sub.subscription_type,
+            "start_date": sub.start_date,
+            "end_date": sub.end_date
+        } for sub in result.scalars()]
+
+    async def has_active_subscription(self, user_id: int, plan: str) -> bool:
+        """
+        Проверяет, есть ли у пользователя активная подписка.
+
+        Args:
+            user_id (int): Уникальный идентификатор пользователя.
+            plan (str): Тип подписки для проверки.
+
+        Returns:
+            bool: True, если подписка активна, иначе False.
+        """
+        # Истекшие подписки снимает фоновый обход (subscription_sweeper), дата здесь не сравнивается
+        result = await self.db.execute(select(Subscription.subscription_id).where(
+            Subscription.user_id == user_id,
+            Subscription.is_active.is_(True)
+        ).limit(1))
+        return result.first() is not None
+
+    async def get_active_plan(self, user_id: int) -> Optional[str]:
+        """
+        Возвращает тип действующей подписки пользователя.
+
+        Args:
+            user_id (int): Уникальный идентификатор пользователя.
+
+        Returns:
+            Optional[str]: Тип подписки или None, если действующей подписки нет.
+        """
+        return await self.db.scalar(select(Subscription.subscription_type).where(
+            Subscription.user_id == user_id,
+            Subscription.is_active.is_(True)
+        ).order_by(Subscription.end_date.desc()).limit(1))
+
+    async def renew_subscription(self, user_id: int, plan: str, duration_days: int) -> str:
+        """
+        Продлевает подписку пользователя.
+
+        Args:
+            user_id (int): Уникальный идентификатор пользователя.
+            plan (str): Тип подписки, которую нужно продлить.
+            duration_days (int): Продолжительность продления в днях.
+
+        Returns:
+            str: Результат операции.
+        """
+        subscription = await self._get_subscription(user_id, plan)
+
+        if subscription:
+            if subscription.end_date > datetime.utcnow():
+                subscription.end_date += timedelta(days=duration_days)
+            else:
+                subscription.start_date = datetime.utcnow()
+                subscription.end_date = subscription.start_date + timedelta(days=duration_days)
+            subscription.is_active = True
+
+            await self.db.flush()
+            on_commit(self.db, partial(subscription_changed, user_id))
             return f"Подписка '{plan}' продлена для пользователя с ID {user_id}."
 
         return f"Подписка '{plan}' не найдена у пользователя с ID {user_id}."
@@ -0,0 +1,118 @@
+import asyncio
+import logging
+from datetime import datetime
+from typing import Optional
+
+from sqlalchemy import select, update
+
+import config
+from business_logic.events import SUBSCRIPTION_EXPIRED, event_bus
+from data_access.database import get_async_session
+from data_access.models import Subscription
+from monitoring.metrics import registry
+
+logger = logging.getLogger(__name__)
+
+"""
+Фоновое снятие истекших подписок.
+
+Раз в SUBSCRIPTION_SWEEP_INTERVAL истекшие подписки помечаются is_active = false пакетами по
+SUBSCRIPTION_SWEEP_BATCH строк — одним UPDATE ... RETURNING на пакет, по индексу
+(is_active, end_date). Для каждой снятой подписки публикуется событие SUBSCRIPTION_EXPIRED.
+В PostgreSQL строки пакета выбираются с FOR UPDATE SKIP LOCKED, поэтому несколько процессов
+могут выполнять обход одновременно, не мешая друг другу.
+
+Сроки подписок хранятся в UTC (datetime.utcnow), и текущий момент для сравнения берется так же.
+
+event_bus работает внутри процесса: при BOT_MODE=supervisor событие получает только тот
+процесс, чей обход снял подписку. Поэтому кэши прав и квот на событие не полагаются: они сами
+сверяют end_date и не выдают права истекшей подписки в любом процессе; событие лишь раньше
+освобождает память.
+"""
+
+
+class SubscriptionSweeper:
+    def __init__(self, interval: float = None, batch_size: int = None, session_factory=get_async_session):
+        """
+        Args:
+            interval (float): Период обхода в секундах.
+            batch_size (int): Подписок в одном UPDATE.
+            session_factory: Фабрика асинхронных сессий.
+        """
+        self.interval = interval or config.SUBSCRIPTION_SWEEP_INTERVAL
+        self.batch_size = batch_size or config.SUBSCRIPTION_SWEEP_BATCH
+        self._session_factory = session_factory
+        self._stopping = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+        self.expired = registry.counter('subscriptions_expired_total')
+        self.duration = registry.histogram('subscription_sweep_seconds')
+
+    def _expire_statement(self, dialect: str, now: datetime):
+        batch = (select(Subscription.subscription_id)
+                 .where(Subscription.is_active.is_(True), Subscription.end_date <= now)
+                 .limit(self.batch_size))
+        if dialect == 'postgresql':
+            batch = batch.with_for_update(skip_locked=True)
+        return (update(Subscription)
+                .where(Subscription.subscription_id.in_(batch.scalar_subquery()))
+                .values(is_active=False)
+                .returning(Subscription.subscription_id, Subscription.user_id, Subscription.subscription_type)
+                .execution_options(synchronize_session=False))
+
+    async def sweep(self) -> int:
+        """
+        Снимает все истекшие к текущему моменту подписки.
+
+        Returns:
+            int: Количество снятых подписок.
+        """
+        started = asyncio.get_running_loop().time()
+        now = datetime.utcnow()
+        total = 0
+        while True:
+            async with self._session_factory() as session:
+                statement = self._expire_statement(session.get_bind().dialect.name, now)
+                rows = (await session.execute(statement)).all()
+                await session.commit()
+
+            for row in rows:
+                await event_bus.publish(SUBSCRIPTION_EXPIRED, subscription_id=row.subscription_id,
+                                        user_id=row.user_id, plan=row.subscription_type)
+            total += len(rows)
+            # При остановке остаток снимет следующий обход (в этом или другом процессе)
+            if len(rows) < self.batch_size or self._stopping.is_set():
+                break
+
+        self.expired.inc(total)
+        self.duration.observe(asyncio.get_running_loop().time() - started)
+        if total:
+            logger.info("Снято истекших подписок: %d", total)
+        return total
+
+    def start(self):
+        """Запускает периодический обход."""
+        if self._task is None or self._task.done():
+            self._stopping.clear()
+            self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def _run(self):
+        while not self._stopping.is_set():
+            try:
+                await self.sweep()
+            except Exception:
+                logger.exception("Ошибка обхода истекших подписок")
+            try:
+                await asyncio.wait_for(self._stopping.wait(), timeout=self.interval)
+            except asyncio.TimeoutError:
+                pass
+
+    async def stop(self):
+        """Останавливает обход после текущего пакета, чтобы события снятых подписок не потерялись."""
+        if self._task is not None:
+            self._stopping.set()
+            await self._task
+            self._task = None
+
+
+# Общий обход подписок процесса
+subscription_sweeper = SubscriptionSweeper()
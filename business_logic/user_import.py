@@ -0,0 +1,64 @@
+# Перенос пользователей из старого бота: чтение выгрузки CSV/JSONL и пакетная загрузка в БД
+import argparse
+import csv
+import json
+import logging
+from datetime import datetime
+from typing import Iterator, TextIO
+
+from data_access.database import get_session
+from business_logic.user_management import UserManager
+
+logger = logging.getLogger(__name__)
+
+
+def read_user_records(stream: TextIO, fmt: str) -> Iterator[dict]:
+    """
+    Потоково читает записи пользователей, не загружая файл в память целиком.
+
+    Args:
+        stream (TextIO): Открытый файл выгрузки.
+        fmt (str): 'csv' (с заголовком) или 'jsonl' (один JSON-объект на строку).
+
+    Returns:
+        Iterator[dict]: Записи с ключами telegram_id, user_name и необязательным created_at.
+    """
+    if fmt == 'csv':
+        rows = csv.DictReader(stream)
+    elif fmt == 'jsonl':
+        rows = (json.loads(line) for line in stream if line.strip())
+    else:
+        raise ValueError(f"Неизвестный формат выгрузки: {fmt}")
+
+    for row in rows:
+        if not row.get('telegram_id'):
+            logger.warning("Пропущена запись без telegram_id: %s", row)
+            continue
+        created_at = row.get('created_at')
+        yield {
+            'telegram_id': str(row['telegram_id']),
+            'user_name': row.get('user_name'),
+            'created_at': datetime.fromisoformat(created_at) if created_at else None,
+        }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Импорт пользователей из выгрузки старого бота")
+    parser.add_argument('path', help="Путь к файлу выгрузки")
+    parser.add_argument('--format', choices=('csv', 'jsonl'), help="Формат файла (по умолчанию — по расширению)")
+    parser.add_argument('--batch-size', type=int, default=1000, help="Строк в одном INSERT")
+    args = parser.parse_args()
+
+    fmt = args.format or ('jsonl' if args.path.endswith('.jsonl') else 'csv')
+    session = get_session()
+    try:
+        with open(args.path, encoding='utf-8', newline='') as stream:
+            imported = UserManager(session).import_users(read_user_records(stream, fmt), args.batch_size)
+    finally:
+        session.close()
+    logger.info("Добавлено пользователей: %d", imported)
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO)
+    main()
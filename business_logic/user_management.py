@@ -2,15 +2,62 @@
 # Создает сессии, которые используются для управления базой данных
 from sqlalchemy.orm import Session
 
+# select — построитель SELECT-запросов, AsyncSession — асинхронная сессия SQLAlchemy
+from sqlalchemy import literal, literal_column, select
+from sqlalchemy.ext.asyncio import AsyncSession
+
 # Импорт модели User из файла models
 from data_access.models import User
 
 # Optional — тип аннотации из стандартной библиотеки Python, указывает, что значение либо указанного типа, либо None
-from typing import Optional
+from typing import Optional, Iterable, Tuple
+from itertools import islice
+from functools import partial
 
 # datetime — класс из стандартной библиотеки Python, который используется для работы с датами и временем
 from datetime import datetime
 
+import config
+from business_logic.cache import TTLCache
+from data_access.database import dialect_insert, on_commit
+
+# Кэш telegram_id -> user_id. Соответствие практически не меняется, а нужно почти каждому
+# обработчику; register_user, update_username и delete_user сбрасывают его явно.
+identity_cache = TTLCache('user_identity', maxsize=config.USER_CACHE_SIZE, ttl=config.USER_CACHE_TTL)
+
+
+def upsert_user_statement(session, user_name: str, telegram_id: str, registered_at: datetime):
+    """
+    INSERT ... ON CONFLICT (telegram_id) DO UPDATE ... RETURNING для регистрации пользователя.
+
+    DO UPDATE (а не DO NOTHING) нужен, чтобы RETURNING вернул строку и для существующего
+    пользователя; заодно обновляется имя, если оно сменилось в Telegram.
+
+    Вторым столбцом возвращается признак вставки. В PostgreSQL это xmax = 0: у только что
+    вставленной строки xmax пуст, а DO UPDATE его заполняет. В остальных СУБД created_at строки
+    сравнивается в самом запросе со вставляемым значением — DO UPDATE его не меняет.
+    """
+    statement = dialect_insert(session, User).values(
+        user_name=user_name,
+        telegram_id=telegram_id,
+        created_at=registered_at
+    )
+    if session.get_bind().dialect.name == 'postgresql':
+        created = literal_column('xmax') == literal_column('0')
+    else:
+        created = User.created_at == literal(registered_at, User.created_at.type)
+    return statement.on_conflict_do_update(
+        index_elements=[User.telegram_id],
+        set_={'user_name': statement.excluded.user_name}
+    ).returning(User, created.label('created'))
+
+
+def batched(iterable: Iterable, size: int):
+    """Разбивает последовательность на списки длиной не больше size."""
+    iterator = iter(iterable)
+    while batch := list(islice(iterator, size)):
+        yield batch
+
 
 class UserManager:
     """
@@ -26,35 +73,58 @@ class UserManager:
         """
         self.db = db  # Сохраняем сессию базы данных для использования в методах
 
-    def register_user(self, user_name: str, telegram_id: str) -> User:
+    def register_user(self, user_name: str, telegram_id: str) -> Tuple[User, bool]:
         """
-        Регистрация нового пользователя в базе данных.
+        Регистрация пользователя одним запросом INSERT ... ON CONFLICT.
+
+        Если пользователь с таким telegram_id уже есть, обновляется его имя и возвращается
+        существующая запись, поэтому одновременные нажатия /start не конфликтуют.
 
         Args:
             user_name (str): Имя пользователя.
             telegram_id (str): Идентификатор Telegram пользователя.
 
         Returns:
-            User: Объект зарегистрированного пользователя.
+            Tuple[User, bool]: Объект пользователя и признак того, что он только что создан.
         """
-        # Проверяем, существует ли уже пользователь с данным telegram_id
-        existing_user = self.db.query(User).filter(User.telegram_id == telegram_id).first()
+        registered_at = datetime.now()
+        user, created = self.db.execute(
+            upsert_user_statement(self.db, user_name, telegram_id, registered_at),
+            execution_options={'populate_existing': True}
+        ).one()
+        self.db.commit()
+        identity_cache.invalidate(telegram_id)
 
-        if existing_user:
-            raise ValueError("Пользователь с таким telegram_id уже существует")
+        return user, bool(created)
 
-        # Создаем нового пользователя
-        new_user = User(
-            user_name=user_name,  # Устанавливаем имя пользователя
-            telegram_id=telegram_id,  # Устанавливаем идентификатор Telegram
-            created_at=datetime.now()  # Устанавливаем текущую дату и время
-        )
+    def import_users(self, records: Iterable[dict], batch_size: int = 1000) -> int:
+        """
+        Массовая загрузка пользователей пакетами многострочных INSERT.
 
-        # Добавляем нового пользователя в сессию и сохраняем изменения в базе данных
-        self.db.add(new_user)
-        self.db.commit()
+        Уже существующие telegram_id пропускаются, каждый пакет фиксируется отдельно,
+        поэтому прерванную загрузку можно просто запустить повторно.
 
-        return new_user  # Возвращаем зарегистрированного пользователя
+        Args:
+            records (Iterable[dict]): Записи с ключами telegram_id, user_name и необязательным created_at.
+            batch_size (int): Количество строк в одном INSERT.
+
+        Returns:
+            int: Количество добавленных пользователей.
+        """
+        statement = dialect_insert(self.db, User.__table__).on_conflict_do_nothing(
+            index_elements=['telegram_id']).returning(User.user_id)
+        imported = 0
+
+        for batch in batched(records, batch_size):
+            rows = [{
+                'telegram_id': str(record['telegram_id']),
+                'user_name': record.get('user_name') or "Неизвестный пользователь",
+                'created_at': record.get('created_at') or datetime.now(),
+            } for record in batch]
+            imported += len(self.db.execute(statement, rows).all())
+            self.db.commit()
+
+        return imported
 
     def update_username(self, user_id: int, new_user_name: str) -> Optional[User]:
         """
@@ -78,6 +148,7 @@ class UserManager:
 
         # Сохраняем изменения в базе данных
         self.db.commit()
+        identity_cache.invalidate(user.telegram_id)
 
         return user  # Возвращаем обновленного пользователя
 
@@ -97,6 +168,26 @@ class UserManager:
         user = self.db.query(User).filter(User.telegram_id == telegram_id).first()
         return user  # Возвращаем найденного пользователя
 
+    def get_user_id_by_telegram_id(self, telegram_id: str) -> Optional[int]:
+        """
+        Получение user_id по telegram_id через кэш идентификаторов.
+
+        Args:
+            telegram_id (str): Идентификатор Telegram пользователя.
+
+        Returns:
+            Optional[int]: Идентификатор пользователя или None, если пользователь не найден.
+        """
+        user_id = identity_cache.get(telegram_id)
+        if user_id is None:
+            # Запрашиваем только идентификатор, без загрузки всего объекта
+            row = self.db.query(User.user_id).filter(User.telegram_id == telegram_id).first()
+            if row is None:
+                return None
+            user_id = row.user_id
+            identity_cache.set(telegram_id, user_id)
+        return user_id
+
     def get_user_by_id(self, user_id: int) -> Optional[User]:
         """
         Получение пользователя по ID.
@@ -108,7 +199,7 @@ class UserManager:
             Optional[User ]: Объект пользователя или None, если пользователь не найден.
         """
         # Запрашиваем пользователя по user_id
-        user = self.db.query(User).filter(User.id == user_id).first()
+        user = self.db.query(User).filter(User.user_id == user_id).first()
         return user
 
     def delete_user(self, user_id: int) -> bool:
@@ -128,6 +219,131 @@ class UserManager:
             # Удаляем пользователя из базы данных
             self.db.delete(user)
             self.db.commit()
+            identity_cache.invalidate(user.telegram_id)
             return True  # Возвращаем True, если удаление прошло успешно
 
         return False  # Возвращаем False, если пользователь не найден
+
+
+class AsyncUserManager:
+    """
+    Асинхронный менеджер пользователей.
+
+    Повторяет операции UserManager, но работает через AsyncSession,
+    поэтому запросы к базе данных не блокируют цикл событий бота.
+    Изменения только отправляются в БД (flush); транзакцию фиксирует вызывающий код,
+    кэш идентификаторов сбрасывается после фиксации.
+    """
+
+    def __init__(self, db: AsyncSession):
+        """
+        Инициализация менеджера пользователей с использованием асинхронной сессии.
+
+        Args:
+            db (AsyncSession): Асинхронная сессия базы данных SQLAlchemy.
+        """
+        self.db = db
+
+    async def register_user(self, user_name: str, telegram_id: str) -> Tuple[User, bool]:
+        """
+        Регистрация пользователя одним запросом INSERT ... ON CONFLICT.
+
+        Args:
+            user_name (str): Имя пользователя.
+            telegram_id (str): Идентификатор Telegram пользователя.
+
+        Returns:
+            Tuple[User, bool]: Объект пользователя и признак того, что он только что создан.
+        """
+        registered_at = datetime.now()
+        user, created = (await self.db.execute(
+            upsert_user_statement(self.db, user_name, telegram_id, registered_at),
+            execution_options={'populate_existing': True}
+        )).one()
+        on_commit(self.db, partial(identity_cache.invalidate, telegram_id))
+
+        return user, bool(created)
+
+    async def update_username(self, user_id: int, new_user_name: str) -> Optional[User]:
+        """
+        Обновление имени пользователя в базе данных.
+
+        Args:
+            user_id (int): Идентификатор пользователя.
+            new_user_name (str): Новое имя пользователя.
+
+        Returns:
+            Optional[User ]: Обновленный объект пользователя.
+        """
+        user = await self.get_user_by_id(user_id)
+
+        if not user:
+            raise ValueError("Пользователь не найден")
+
+        user.user_name = new_user_name
+        await self.db.flush()
+        on_commit(self.db, partial(identity_cache.invalidate, user.telegram_id))
+
+        return user
+
+    async def get_user_by_telegram_id(self, telegram_id: str) -> Optional[User]:
+        """
+        Получение пользователя по telegram_id.
+
+        Args:
+            telegram_id (str): Идентификатор Telegram пользователя.
+
+        Returns:
+            Optional[User ]: Объект пользователя или None, если пользователь не найден.
+        """
+        result = await self.db.execute(select(User).where(User.telegram_id == telegram_id))
+        return result.scalars().first()
+
+    async def get_user_id_by_telegram_id(self, telegram_id: str) -> Optional[int]:
+        """
+        Получение user_id по telegram_id через кэш идентификаторов.
+
+        Args:
+            telegram_id (str): Идентификатор Telegram пользователя.
+
+        Returns:
+            Optional[int]: Идентификатор пользователя или None, если пользователь не найден.
+        """
+        user_id = identity_cache.get(telegram_id)
+        if user_id is None:
+            user_id = await self.db.scalar(select(User.user_id).where(User.telegram_id == telegram_id))
+            if user_id is not None:
+                identity_cache.set(telegram_id, user_id)
+        return user_id
+
+    async def get_user_by_id(self, user_id: int) -> Optional[User]:
+        """
+        Получение пользователя по ID.
+
+        Args:
+            user_id (int): Идентификатор пользователя.
+
+        Returns:
+            Optional[User ]: Объект пользователя или None, если пользователь не найден.
+        """
+        return await self.db.get(User, user_id)
+
+    async def delete_user(self, user_id: int) -> bool:
+        """
+        Удаление пользователя из базы данных.
+
+        Args:
+            user_id (int): Идентификатор пользователя.
+
+        Returns:
+            bool: True, если пользователь был успешно удален, иначе False.
+        """
+        user = await self.get_user_by_id(user_id)
+
+        if user:
+            await self.db.delete(user)
+            await self.db.flush()
+            on_commit(self.db, partial(identity_cache.invalidate, user.telegram_id))
+            return True
+
+        return False
@@ -0,0 +1,203 @@
+import logging
+from contextlib import contextmanager
+from datetime import datetime
+from typing import Callable, List, NamedTuple, Sequence
+
+from sqlalchemy import Column, DateTime, Integer, MetaData, String, Table, inspect, select, text
+
+logger = logging.getLogger(__name__)
+
+"""
+Версионные миграции схемы.
+
+create_all создает только отсутствующие таблицы и не меняет существующие, поэтому новые
+столбцы и индексы для уже развернутой базы добавляются миграциями. Примененные версии
+записываются в таблицу schema_migrations; каждая миграция идемпотентна, так что на свежей
+базе (где create_all уже создал все по моделям) она ничего не делает.
+
+Миграции с concurrent=True выполняются вне транзакции: в PostgreSQL так создаются индексы
+через CREATE INDEX CONCURRENTLY, не блокируя запись в таблицу.
+"""
+
+migrations_metadata = MetaData()
+
+schema_migrations = Table(
+    'schema_migrations', migrations_metadata,
+    Column('version', Integer, primary_key=True),
+    Column('name', String, nullable=False),
+    Column('applied_at', DateTime, nullable=False),
+)
+
+
+class Migration(NamedTuple):
+    version: int
+    name: str
+    apply: Callable
+    concurrent: bool
+
+
+MIGRATIONS: List[Migration] = []
+
+
+def migration(version: int, name: str, concurrent: bool = False):
+    """Регистрирует функцию apply(connection) как миграцию с указанной версией."""
+
+    def register(apply: Callable) -> Callable:
+        MIGRATIONS.append(Migration(version, name, apply, concurrent))
+        return apply
+
+    return register
+
+
+def add_column(connection, table: str, column: str, ddl_type: str):
+    """Добавляет столбец, если его еще нет."""
+    existing = {col['name'] for col in inspect(connection).get_columns(table)}
+    if column not in existing:
+        connection.execute(text(f'ALTER TABLE {table} ADD COLUMN {column} {ddl_type}'))
+
+
+def create_index(connection, name: str, table: str, columns: Sequence[str]):
+    """
+    Создает индекс, если его еще нет. В PostgreSQL — CONCURRENTLY (соединение должно быть в AUTOCOMMIT).
+    """
+    column_list = ', '.join(columns)
+    if connection.dialect.name == 'postgresql':
+        # Прерванный CREATE INDEX CONCURRENTLY оставляет невалидный индекс, который
+        # IF NOT EXISTS счел бы созданным, — такой индекс удаляем и строим заново
+        invalid = connection.execute(text(
+            'SELECT 1 FROM pg_index i JOIN pg_class c ON c.oid = i.indexrelid '
+            'WHERE c.relname = :name AND NOT i.indisvalid'), {'name': name}).first()
+        if invalid:
+            connection.execute(text(f'DROP INDEX CONCURRENTLY IF EXISTS {name}'))
+        connection.execute(text(f'CREATE INDEX CONCURRENTLY IF NOT EXISTS {name} ON {table} ({column_list})'))
+    else:
+        connection.execute(text(f'CREATE INDEX IF NOT EXISTS {name} ON {table} ({column_list})'))
+
+
+def drop_index(connection, name: str):
+    """Удаляет индекс, если он есть. В PostgreSQL — CONCURRENTLY (соединение должно быть в AUTOCOMMIT)."""
+    if connection.dialect.name == 'postgresql':
+        connection.execute(text(f'DROP INDEX CONCURRENTLY IF EXISTS {name}'))
+    else:
+        connection.execute(text(f'DROP INDEX IF EXISTS {name}'))
+
+
+@migration(1, 'dialog history window')
+def _dialog_history_window(connection):
+    add_column(connection, 'dialogs', 'dialog_vol', 'INTEGER')
+    add_column(connection, 'dialogs', 'token_budget', 'INTEGER')
+
+
+@migration(2, 'hot query indexes', concurrent=True)
+def _hot_query_indexes(connection):
+    create_index(connection, 'ix_gpt_messages_dialog_id_message_time', 'gpt_messages', ['dialog_id', 'message_time'])
+    create_index(connection, 'ix_dialogs_user_id', 'dialogs', ['user_id'])
+    create_index(connection, 'ix_subscriptions_user_id_end_date', 'subscriptions', ['user_id', 'end_date'])
+    create_index(connection, 'ix_transactions_user_id_transaction_date', 'transactions',
+                 ['user_id', 'transaction_date'])
+
+
+@migration(3, 'dialog list keyset index', concurrent=True)
+def _dialog_list_keyset_index(connection):
+    # Составной индекс обслуживает и поиск по user_id, поэтому одиночный больше не нужен
+    create_index(connection, 'ix_dialogs_user_id_dialog_id', 'dialogs', ['user_id', 'dialog_id'])
+    drop_index(connection, 'ix_dialogs_user_id')
+
+
+@migration(4, 'subscription expiry index', concurrent=True)
+def _subscription_expiry_index(connection):
+    # is_active раньше не поддерживался — строки без значения считаем активными, обход снимет истекшие
+    connection.execute(text('UPDATE subscriptions SET is_active = :active WHERE is_active IS NULL'), {'active': True})
+    create_index(connection, 'ix_subscriptions_is_active_end_date', 'subscriptions', ['is_active', 'end_date'])
+
+
+@migration(5, 'balance checkpoints', concurrent=True)
+def _balance_checkpoints(connection):
+    add_column(connection, 'user_balances', 'op_count', 'INTEGER NOT NULL DEFAULT 0')
+    add_column(connection, 'balance_history', 'last_transaction_id', 'INTEGER')
+    create_index(connection, 'ix_balance_history_user_id_created_at', 'balance_history', ['user_id', 'created_at'])
+    # Ключ постраничной выдачи включает transaction_id; индекс по (user_id, transaction_date) им покрывается
+    create_index(connection, 'ix_transactions_user_id_date_id', 'transactions',
+                 ['user_id', 'transaction_date', 'transaction_id'])
+    drop_index(connection, 'ix_transactions_user_id_transaction_date')
+
+
+@migration(6, 'opening balance checkpoints')
+def _opening_balance_checkpoints(connection):
+    # Счета, открытые до контрольных точек: без точки баланс на момент времени считался бы от нуля.
+    # Открывающая точка фиксирует текущий остаток после последней транзакции счета
+    connection.execute(text(
+        'INSERT INTO balance_history (user_id, balance_sum, transaction_type, created_at, last_transaction_id) '
+        'SELECT b.user_id, b.balance_now, :checkpoint, '
+        '       COALESCE(MAX(t.transaction_date), b.up_date, :now), COALESCE(MAX(t.transaction_id), 0) '
+        'FROM user_balances b LEFT JOIN transactions t ON t.user_id = b.user_id '
+        'WHERE b.balance_id = :balance_id AND NOT EXISTS ('
+        '  SELECT 1 FROM balance_history h WHERE h.user_id = b.user_id AND h.transaction_type = :checkpoint) '
+        'GROUP BY b.user_id, b.balance_now, b.up_date'),
+        # Значения совпадают с CHECKPOINT и MAIN_BALANCE_ID из business_logic.balance_management
+        {'checkpoint': 'checkpoint', 'balance_id': 1, 'now': datetime.now()})
+
+
+@migration(7, 'payment dead letters')
+def _payment_dead_letters(connection):
+    add_column(connection, 'payment_events', 'status', "VARCHAR NOT NULL DEFAULT 'applied'")
+    add_column(connection, 'payment_events', 'error', 'TEXT')
+
+
+# Ключ рекомендательной блокировки PostgreSQL, под которой применяются миграции
+MIGRATION_LOCK_ID = 724_113_905
+
+
+@contextmanager
+def migration_lock(engine):
+    """
+    Не дает нескольким процессам применять миграции одновременно.
+
+    В PostgreSQL — сессионная рекомендательная блокировка на отдельном соединении, которое
+    держится до конца применения. В SQLite процессы и так сериализуются блокировкой файла.
+    """
+    if engine.dialect.name != 'postgresql':
+        yield
+        return
+    with engine.connect().execution_options(isolation_level='AUTOCOMMIT') as connection:
+        connection.execute(text('SELECT pg_advisory_lock(:key)'), {'key': MIGRATION_LOCK_ID})
+        try:
+            yield
+        finally:
+            connection.execute(text('SELECT pg_advisory_unlock(:key)'), {'key': MIGRATION_LOCK_ID})
+
+
+def run_migrations(engine):
+    """
+    Применяет все еще не примененные миграции по возрастанию версии.
+
+    Args:
+        engine: Синхронный движок SQLAlchemy.
+    """
+    migrations_metadata.create_all(engine)
+
+    with migration_lock(engine):
+        # Читаем под блокировкой: пока ждали, миграции мог применить другой процесс
+        with engine.connect() as connection:
+            applied = set(connection.scalars(select(schema_migrations.c.version)))
+
+        for item in sorted(MIGRATIONS, key=lambda m: m.version):
+            if item.version in applied:
+                continue
+
+            logger.info("Применяется миграция %d: %s", item.version, item.name)
+            if item.concurrent:
+                with engine.connect().execution_options(isolation_level='AUTOCOMMIT') as connection:
+                    item.apply(connection)
+                with engine.begin() as connection:
+                    _mark_applied(connection, item)
+            else:
+                # Изменение схемы и отметка о нем — в одной транзакции
+                with engine.begin() as connection:
+                    item.apply(connection)
+                    _mark_applied(connection, item)
+
+
+def _mark_applied(connection, item: Migration):
+    connection.execute(schema_migrations.insert().values(
+        version=item.version, name=item.name, applied_at=datetime.utcnow()))
@@ -4,7 +4,7 @@
   Integer, String, DateTime, Boolean, Float - типы данных для столбцов
   ForeignKey - используется для создания внешнего ключа, связывающего таблицы
 """
-from sqlalchemy import Column, Integer, String, DateTime, ForeignKey, Boolean, Float, JSON
+from sqlalchemy import Column, Integer, BigInteger, String, Text, DateTime, ForeignKey, Boolean, Float, JSON, Index
 
 # Импорт функции relationship для установления отношений между таблицами
 from sqlalchemy.orm import relationship
@@ -41,6 +41,12 @@ class User(Base):
 
 class Subscription(Base):
     __tablename__ = 'subscriptions'
+    __table_args__ = (
+        # Проверка активной подписки пользователя
+        Index('ix_subscriptions_user_id_end_date', 'user_id', 'end_date'),
+        # Поиск истекших, но еще активных подписок (business_logic/subscription_sweeper.py)
+        Index('ix_subscriptions_is_active_end_date', 'is_active', 'end_date'),
+    )
 
     subscription_id = Column(Integer, primary_key=True)
     user_id = Column(Integer, ForeignKey('users.user_id'), nullable=False)
@@ -55,6 +61,10 @@ class Subscription(Base):
 
 class Transaction(Base):
     __tablename__ = 'transactions'
+    __table_args__ = (
+        # История транзакций пользователя постранично по ключу (transaction_date, transaction_id)
+        Index('ix_transactions_user_id_date_id', 'user_id', 'transaction_date', 'transaction_id'),
+    )
 
     transaction_id = Column(Integer, primary_key=True)
     user_id = Column(Integer, ForeignKey('users.user_id'), nullable=False)
@@ -68,12 +78,18 @@ class Transaction(Base):
 
 class BalanceHistory(Base):
     __tablename__ = 'balance_history'
+    __table_args__ = (
+        # Последняя контрольная точка баланса пользователя на момент времени
+        Index('ix_balance_history_user_id_created_at', 'user_id', 'created_at'),
+    )
 
     history_id = Column(Integer, primary_key=True)
     user_id = Column(Integer, ForeignKey('users.user_id'), nullable=False)
     balance_sum = Column(Float, nullable=False)
     transaction_type = Column(String, nullable=False)
     created_at = Column(DateTime, default=datetime.utcnow)
+    # Для контрольной точки: последняя транзакция, учтенная в balance_sum
+    last_transaction_id = Column(Integer, nullable=True)
 
     user = relationship('User', back_populates='balance_history')
 
@@ -85,12 +101,18 @@ class UserBalance(Base):
     balance_id = Column(Integer, primary_key=True)
     up_date = Column(DateTime, default=datetime.utcnow)
     balance_now = Column(Float, nullable=False)
+    # Число операций по счету: каждая BALANCE_CHECKPOINT_INTERVAL-я пишет контрольную точку
+    op_count = Column(Integer, nullable=False, default=0)
 
     user = relationship('User', back_populates='user_balances')
 
 
 class Dialog(Base):
     __tablename__ = 'dialogs'
+    __table_args__ = (
+        # Список диалогов пользователя, постранично по dialog_id
+        Index('ix_dialogs_user_id_dialog_id', 'user_id', 'dialog_id'),
+    )
 
     dialog_id = Column(Integer, primary_key=True)
     user_id = Column(Integer, ForeignKey('users.user_id'), nullable=False)
@@ -98,6 +120,9 @@ class Dialog(Base):
     bot_type = Column(String, nullable=False)
     role_type = Column(String, nullable=False)
     updated_at = Column(DateTime, default=datetime.utcnow)
+    # Окно истории для запросов к модели; None — значения по умолчанию из config
+    dialog_vol = Column(Integer, nullable=True)
+    token_budget = Column(Integer, nullable=True)
 
     user = relationship('User', back_populates='dialogs')
     gpt_messages = relationship('GPTMessage', back_populates='dialog')
@@ -120,6 +145,10 @@ class DALLEMessage(Base):
 
 class GPTMessage(Base):
     __tablename__ = 'gpt_messages'
+    __table_args__ = (
+        # Последние сообщения диалога (окно истории)
+        Index('ix_gpt_messages_dialog_id_message_time', 'dialog_id', 'message_time'),
+    )
 
     message_id = Column(Integer, primary_key=True)
     dialog_id = Column(Integer, ForeignKey('dialogs.dialog_id'), nullable=False)
@@ -129,3 +158,36 @@ class GPTMessage(Base):
 
     dialog = relationship('Dialog', back_populates='gpt_messages')
     user = relationship('User', back_populates='gpt_messages')
+
+
+class QuotaUsage(Base):
+    """Израсходованные запросы по подписке; пополняется пакетами из business_logic/quota.py."""
+    __tablename__ = 'quota_usage'
+
+    # Без внешнего ключа: запись может прийти уже после удаления подписки
+    subscription_id = Column(Integer, primary_key=True)
+    used = Column(Integer, nullable=False, default=0)
+    updated_at = Column(DateTime, default=datetime.utcnow)
+
+
+class BotState(Base):
+    """Состояние бота вне процесса: user_data и chat_data в виде JSON (bot/persistence.py)."""
+    __tablename__ = 'bot_state'
+
+    kind = Column(String, primary_key=True)         # 'user' или 'chat'
+    key = Column(BigInteger, primary_key=True)      # Telegram user_id или chat_id
+    data = Column(Text, nullable=False)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+
+class PaymentEvent(Base):
+    """Примененные уведомления о платежах; первичный ключ исключает повторное применение."""
+    __tablename__ = 'payment_events'
+
+    payment_id = Column(String, primary_key=True)   # Идентификатор платежа в шлюзе
+    user_id = Column(Integer, nullable=False)
+    amount = Column(Float, nullable=False)
+    plan = Column(String, nullable=True)            # Оплаченная подписка; None — пополнение баланса
+    processed_at = Column(DateTime, default=datetime.utcnow)
+    status = Column(String, nullable=False, default='applied')  # applied или failed (не удалось применить)
+    error = Column(Text, nullable=True)             # Причина, по которой платеж не применен
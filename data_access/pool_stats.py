@@ -0,0 +1,102 @@
+import time
+
+from sqlalchemy import event, exc
+from sqlalchemy.pool import QueuePool, AsyncAdaptedQueuePool
+
+from monitoring.metrics import registry
+
+"""
+Статистика пула соединений.
+
+Собирается из событий пула (connect/checkout/checkin) и из самого пула: время ожидания
+свободного соединения измеряется внутри выдачи соединения, потому что отдельного события
+"начали ждать" у пула нет. По этим данным размер пула подбирается по факту, а не наугад.
+"""
+
+# Корзины времени ожидания соединения: от почти мгновенной выдачи до таймаута
+WAIT_BUCKETS = (0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0, 5.0, 10.0, 30.0)
+
+
+class PoolStats:
+    def __init__(self, name: str):
+        """
+        Args:
+            name (str): Имя пула в метриках, например 'sync' или 'async'.
+        """
+        self.name = name
+        self.pool = None
+        self.checked_out = registry.gauge('db_pool_checked_out', pool=name)
+        self.checkout_wait = registry.histogram('db_pool_checkout_wait_seconds', WAIT_BUCKETS, pool=name)
+        self.checkout_timeouts = registry.counter('db_pool_checkout_timeouts_total', pool=name)
+        self.connections_opened = registry.counter('db_pool_connections_opened_total', pool=name)
+        self.overflow_events = registry.counter('db_pool_overflow_events_total', pool=name)
+
+    def attach(self, pool):
+        """Подписывается на события пула."""
+        self.pool = pool
+
+        @event.listens_for(pool, 'connect')
+        def on_connect(dbapi_connection, connection_record):
+            self.connections_opened.inc()
+            # overflow() > 0 — соединение открыто сверх pool_size
+            if isinstance(self.pool, QueuePool) and self.pool.overflow() > 0:
+                self.overflow_events.inc()
+
+        @event.listens_for(pool, 'checkout')
+        def on_checkout(dbapi_connection, connection_record, connection_proxy):
+            self.checked_out.inc()
+
+        @event.listens_for(pool, 'checkin')
+        def on_checkin(dbapi_connection, connection_record):
+            self.checked_out.dec()
+
+        if isinstance(pool, _InstrumentedPoolMixin):
+            pool.stats = self
+
+    def snapshot(self) -> dict:
+        """Текущее состояние пула и накопленные метрики."""
+        pool = self.pool
+        result = {
+            'checked_out': self.checked_out.snapshot(),
+            'checkout_wait_seconds': self.checkout_wait.snapshot(),
+            'checkout_timeouts': self.checkout_timeouts.snapshot(),
+            'connections_opened': self.connections_opened.snapshot(),
+            'overflow_events': self.overflow_events.snapshot(),
+        }
+        if isinstance(pool, QueuePool):
+            result.update(size=pool.size(), overflow=pool.overflow(), idle=pool.checkedin())
+        return result
+
+
+class _InstrumentedPoolMixin:
+    # Заполняется в PoolStats.attach
+    stats: PoolStats = None
+
+    def _do_get(self):
+        started = time.perf_counter()
+        try:
+            return super()._do_get()
+        except exc.TimeoutError:
+            if self.stats is not None:
+                self.stats.checkout_timeouts.inc()
+            raise
+        finally:
+            if self.stats is not None:
+                self.stats.checkout_wait.observe(time.perf_counter() - started)
+
+    def recreate(self):
+        # engine.dispose() пересоздает пул: подписки на события переносит SQLAlchemy,
+        # а ссылку на статистику — мы
+        pool = super().recreate()
+        pool.stats = self.stats
+        if self.stats is not None:
+            self.stats.pool = pool
+        return pool
+
+
+class InstrumentedQueuePool(_InstrumentedPoolMixin, QueuePool):
+    """QueuePool, измеряющий время ожидания соединения."""
+
+
+class InstrumentedAsyncQueuePool(_InstrumentedPoolMixin, AsyncAdaptedQueuePool):
+    """AsyncAdaptedQueuePool, измеряющий время ожидания соединения."""
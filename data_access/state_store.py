@@ -0,0 +1,90 @@
+from datetime import datetime
+from typing import Optional
+
+from sqlalchemy import delete, select
+
+import config
+from data_access.database import dialect_insert, get_async_session
+from data_access.models import BotState
+
+"""
+Хранилища состояния бота (user_data, chat_data) вне процесса.
+
+Хранилище работает с уже сериализованными JSON-строками по паре (kind, key), где kind —
+'user' или 'chat', а key — идентификатор Telegram. Сериализацией, ленивой загрузкой и
+объединением записей занимается bot/persistence.py.
+"""
+
+
+class SQLStateStore:
+    """Состояние в таблице bot_state основной базы данных."""
+
+    def __init__(self, session_factory=get_async_session):
+        """
+        Args:
+            session_factory: Фабрика асинхронных сессий.
+        """
+        self._session_factory = session_factory
+
+    async def load(self, kind: str, key: int) -> Optional[str]:
+        async with self._session_factory() as session:
+            return await session.scalar(select(BotState.data).where(BotState.kind == kind, BotState.key == key))
+
+    async def save(self, kind: str, key: int, data: str):
+        async with self._session_factory() as session:
+            insert = dialect_insert(session, BotState)
+            statement = insert.values(kind=kind, key=key, data=data, updated_at=datetime.utcnow())
+            await session.execute(statement.on_conflict_do_update(
+                index_elements=[BotState.kind, BotState.key],
+                set_={'data': statement.excluded.data, 'updated_at': statement.excluded.updated_at}))
+            await session.commit()
+
+    async def delete(self, kind: str, key: int):
+        async with self._session_factory() as session:
+            await session.execute(delete(BotState).where(BotState.kind == kind, BotState.key == key))
+            await session.commit()
+
+    async def close(self):
+        pass
+
+
+class RedisStateStore:
+    """
+    Состояние в Redis (или любом сервере с протоколом Redis) — ключи "<prefix>:<kind>:<key>".
+
+    Для локальной проверки подходит поддельный сервер: python -m external_integrations.fake_servers redis
+    """
+
+    def __init__(self, url: str = None, prefix: str = None):
+        """
+        Args:
+            url (str): Адрес сервера, например redis://127.0.0.1:6379/0 (по умолчанию из config).
+            prefix (str): Префикс ключей (по умолчанию из config).
+        """
+        # Клиент Redis нужен только этому хранилищу, поэтому импортируется здесь
+        from redis import asyncio as redis_asyncio
+
+        self._client = redis_asyncio.from_url(url or config.REDIS_URL, decode_responses=True)
+        self.prefix = prefix or config.STATE_KEY_PREFIX
+
+    def _key(self, kind: str, key: int) -> str:
+        return f"{self.prefix}:{kind}:{key}"
+
+    async def load(self, kind: str, key: int) -> Optional[str]:
+        return await self._client.get(self._key(kind, key))
+
+    async def save(self, kind: str, key: int, data: str):
+        await self._client.set(self._key(kind, key), data)
+
+    async def delete(self, kind: str, key: int):
+        await self._client.delete(self._key(kind, key))
+
+    async def close(self):
+        await self._client.aclose()
+
+
+# Хранилища по значению STATE_BACKEND
+STATE_STORES = {
+    'sql': SQLStateStore,
+    'redis': RedisStateStore,
+}
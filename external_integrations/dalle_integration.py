@@ -1,24 +1,30 @@
-# Импорт библиотеки OpenAI для взаимодействия с OpenAI API
-import openai
+# Асинхронный клиент OpenAI API поверх общего пула HTTP-соединений
+import config
+from external_integrations.openai_client import get_openai_client
+from external_integrations.single_flight import SingleFlight
 
+# Одинаковые запросы на генерацию (один prompt и размер), пришедшие одновременно,
+# выполняются одним обращением к API; результат переиспользуется IMAGE_REUSE_WINDOW секунд
+image_flight = SingleFlight('image_generation', reuse_window=config.IMAGE_REUSE_WINDOW)
 
-def generate_image_from_prompt(prompt):
+
+def image_key(prompt: str, size: str) -> tuple:
+    """Ключ объединения запросов на генерацию изображения."""
+    return ' '.join(prompt.split()), size
+
+
+async def generate_image_from_prompt(prompt, size="1024x1024"):
     """
     Генерирует изображение на основе текстового описания с помощью DALL-E API.
 
     :param prompt: Строка с текстовым описанием
+    :param size: Размер изображения
     :return: URL сгенерированного изображения
     """
 
-    # Отправляем запрос на создание изображения. Функция возвращает объект ответа.
-    # - prompt=prompt: Текстовое описание, на основе которого будет сгенерировано изображение.
-    # - n=1: Количество изображений, которые нужно сгенерировать.
-    # - size="1024x1024": Размер изображения.
-    response = openai.Image.create(
-        prompt=prompt,
-        n=1,
-        size="1024x1024"
+    # Отправляем запрос на создание одного изображения (или ждем такой же уже отправленный)
+    # и возвращаем его URL.
+    return await image_flight.do(
+        image_key(prompt, size),
+        lambda: get_openai_client().create_image(prompt=prompt, size=size)
     )
-
-    # Извлекаем URL сгенерированного изображения из ответа и возвращаем его.
-    return response['data'][0]['url']
@@ -0,0 +1,314 @@
+# Локальные поддельные серверы внешних API для проверки интеграций и нагрузочных прогонов без сети
+import argparse
+import asyncio
+import hashlib
+import json
+import logging
+import random
+import time
+import uuid
+from datetime import datetime
+from typing import AsyncIterator, Callable, Dict, List, Optional
+
+from external_integrations.http_server import HTTPServer, Request, Response, TCPServer
+
+logger = logging.getLogger(__name__)
+
+
+class FakeHTTPServer(HTTPServer):
+    """HTTP-сервер поддельного API, который запоминает принятые запросы."""
+
+    def __init__(self, host: str = '127.0.0.1', port: int = 0):
+        super().__init__(host, port)
+        self.requests = []  # Принятые запросы — для проверок в сценариях
+
+    async def handle(self, request: Request) -> Response:
+        self.requests.append(request)
+        return await super().handle(request)
+
+
+class FakeOpenAIServer(FakeHTTPServer):
+    """
+    Поддельный OpenAI API: /v1/chat/completions (обычный и потоковый) и /v1/images/generations.
+
+    Ответ модели — эхо последнего сообщения; URL изображения детерминированно выводится из prompt.
+    """
+
+    def __init__(self, host: str = '127.0.0.1', port: int = 0, latency: float = 0.0, token_delay: float = 0.0):
+        """
+        Args:
+            latency (float): Задержка перед ответом в секундах (имитация генерации).
+            token_delay (float): Пауза между фрагментами потокового ответа в секундах.
+        """
+        super().__init__(host, port)
+        self.latency = latency
+        self.token_delay = token_delay
+        self.routes[('POST', '/v1/chat/completions')] = self.chat_completions
+        self.routes[('POST', '/v1/images/generations')] = self.image_generations
+
+    @property
+    def base_url(self) -> str:
+        """Значение для OPENAI_BASE_URL."""
+        return f"{self.url}/v1"
+
+    async def chat_completions(self, request: Request) -> Response:
+        payload = request.json()
+        text = f"echo: {payload['messages'][-1]['content']}"
+        await asyncio.sleep(self.latency)
+
+        if payload.get('stream'):
+            return Response(200, self._stream(text))
+        return Response(200, {
+            'object': 'chat.completion',
+            'model': payload['model'],
+            'choices': [{'index': 0, 'message': {'role': 'assistant', 'content': text}, 'finish_reason': 'stop'}],
+        })
+
+    async def _stream(self, text: str) -> AsyncIterator[bytes]:
+        for word in text.split(' '):
+            chunk = {'choices': [{'index': 0, 'delta': {'content': word + ' '}}]}
+            yield f"data: {json.dumps(chunk)}\n\n".encode()
+            await asyncio.sleep(self.token_delay)
+        yield b"data: [DONE]\n\n"
+
+    async def image_generations(self, request: Request) -> Response:
+        payload = request.json()
+        await asyncio.sleep(self.latency)
+        digest = hashlib.sha1(f"{payload['prompt']}|{payload.get('size')}".encode()).hexdigest()
+        return Response(200, {'data': [{'url': f"{self.url}/images/{digest}.png"}]})
+
+
+class FakeYooKassaServer(FakeHTTPServer):
+    """
+    Поддельный платежный шлюз ЮKassa: POST /v3/payments и GET /v3/payments/<id>.
+
+    Как и настоящий шлюз, требует Basic-авторизацию и заголовок Idempotence-Key; повторный
+    запрос с тем же ключом возвращает тот же платеж. Ошибки 500 с вероятностью error_rate
+    возникают уже после создания платежа — как потерянный ответ, который клиент должен
+    повторить с тем же ключом.
+    """
+
+    def __init__(self, host: str = '127.0.0.1', port: int = 0, latency: float = 0.0, error_rate: float = 0.0):
+        """
+        Args:
+            latency (float): Задержка перед ответом в секундах.
+            error_rate (float): Доля запросов, на которые шлюз отвечает 500.
+        """
+        super().__init__(host, port)
+        self.latency = latency
+        self.error_rate = error_rate
+        self.payments: Dict[str, dict] = {}
+        self.idempotence: Dict[str, str] = {}   # Ключ идемпотентности -> payment_id
+        self.routes[('POST', '/v3/payments')] = self.create_payment
+
+    @property
+    def base_url(self) -> str:
+        """Значение для YOO_KASSA_API_URL."""
+        return f"{self.url}/v3"
+
+    def route(self, request: Request) -> Optional[Callable]:
+        if request.method == 'GET' and request.path.startswith('/v3/payments/'):
+            return self.get_payment
+        return super().route(request)
+
+    async def _fail(self) -> bool:
+        await asyncio.sleep(self.latency)
+        return random.random() < self.error_rate
+
+    async def create_payment(self, request: Request) -> Response:
+        if not request.headers.get('authorization', '').startswith('Basic '):
+            return Response(401, {'type': 'error', 'code': 'invalid_credentials'})
+        key = request.headers.get('idempotence-key')
+        if not key:
+            return Response(400, {'type': 'error', 'code': 'invalid_request',
+                                  'description': 'Idempotence-Key header is required'})
+
+        payment_id = self.idempotence.get(key)
+        if payment_id is None:
+            payload = request.json()
+            payment_id = str(uuid.uuid4())
+            self.idempotence[key] = payment_id
+            self.payments[payment_id] = {
+                'id': payment_id,
+                'status': 'pending',
+                'paid': False,
+                'amount': payload['amount'],
+                'description': payload.get('description'),
+                'metadata': payload.get('metadata') or {},
+                'confirmation': {'type': 'redirect', 'confirmation_url': f"{self.url}/checkout/{payment_id}"},
+                'created_at': datetime.utcnow().isoformat() + 'Z',
+            }
+        if await self._fail():
+            return Response(500, {'type': 'error', 'code': 'internal_server_error'})
+        return Response(200, self.payments[payment_id])
+
+    async def get_payment(self, request: Request) -> Response:
+        payment = self.payments.get(request.path.rsplit('/', 1)[1])
+        if payment is None:
+            return Response(404, {'type': 'error', 'code': 'not_found'})
+        if await self._fail():
+            return Response(500, {'type': 'error', 'code': 'internal_server_error'})
+        return Response(200, payment)
+
+    def complete(self, payment_id: str, status: str = 'succeeded') -> dict:
+        """Завершает платеж (как если бы пользователь оплатил или отменил его)."""
+        payment = self.payments[payment_id]
+        payment['status'] = status
+        payment['paid'] = status == 'succeeded'
+        return payment
+
+    def notification(self, payment_id: str) -> dict:
+        """Уведомление о текущем состоянии платежа — в том виде, в каком шлюз отправляет его магазину."""
+        payment = self.payments[payment_id]
+        return {'type': 'notification', 'event': f"payment.{payment['status']}", 'object': payment}
+
+
+class RedisError(Exception):
+    """Ошибка команды — отправляется клиенту ответом -ERR."""
+
+
+class FakeRedisServer(TCPServer):
+    """
+    Поддельный Redis (протокол RESP2) с данными в памяти процесса.
+
+    Поддерживает строковые ключи: GET/SET/MGET/DEL/EXISTS/INCR/INCRBY/EXPIRE/TTL, а также
+    PING/SELECT/CLIENT/FLUSHDB, которые отправляют клиенты при подключении. Конвейеры
+    (pipeline) работают, потому что команды обрабатываются по порядку.
+    """
+
+    scheme = 'redis'
+
+    def __init__(self, host: str = '127.0.0.1', port: int = 0):
+        super().__init__(host, port)
+        self.data: Dict[bytes, bytes] = {}
+        self.expires: Dict[bytes, float] = {}
+        self.commands = []  # Выполненные команды — для проверок в сценариях
+
+    @property
+    def url(self) -> str:
+        return f"redis://{self.host}:{self.port}/0"
+
+    async def _handle_connection(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        try:
+            while True:
+                command = await _read_command(reader)
+                if command is None:
+                    break
+                self.commands.append(command)
+                try:
+                    reply = self.execute(command)
+                except RedisError as error:
+                    writer.write(f"-ERR {error}\r\n".encode())
+                else:
+                    writer.write(_encode_reply(reply))
+                await writer.drain()
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    def _get(self, key: bytes) -> Optional[bytes]:
+        expires_at = self.expires.get(key)
+        if expires_at is not None and expires_at <= time.monotonic():
+            self.data.pop(key, None)
+            del self.expires[key]
+        return self.data.get(key)
+
+    def execute(self, command: List[bytes]):
+        name, args = command[0].upper().decode(), command[1:]
+        if name == 'PING':
+            return b'PONG' if not args else args[0]
+        if name in ('SELECT', 'CLIENT'):
+            return 'OK'
+        if name == 'FLUSHDB':
+            self.data.clear()
+            self.expires.clear()
+            return 'OK'
+        if name == 'GET':
+            return self._get(args[0])
+        if name == 'MGET':
+            return [self._get(key) for key in args]
+        if name == 'SET':
+            key, value, options = args[0], args[1], [arg.upper() for arg in args[2:]]
+            self.data[key] = value
+            self.expires.pop(key, None)
+            if b'EX' in options:
+                self.expires[key] = time.monotonic() + int(args[2 + options.index(b'EX') + 1])
+            return 'OK'
+        if name == 'DEL':
+            removed = sum(1 for key in args if self._get(key) is not None)
+            for key in args:
+                self.data.pop(key, None)
+                self.expires.pop(key, None)
+            return removed
+        if name == 'EXISTS':
+            return sum(1 for key in args if self._get(key) is not None)
+        if name in ('INCR', 'INCRBY'):
+            amount = int(args[1]) if name == 'INCRBY' else 1
+            try:
+                value = int(self._get(args[0]) or 0) + amount
+            except ValueError:
+                raise RedisError("value is not an integer or out of range")
+            self.data[args[0]] = str(value).encode()
+            return value
+        if name == 'EXPIRE':
+            if self._get(args[0]) is None:
+                return 0
+            self.expires[args[0]] = time.monotonic() + int(args[1])
+            return 1
+        if name == 'TTL':
+            if self._get(args[0]) is None:
+                return -2
+            expires_at = self.expires.get(args[0])
+            return -1 if expires_at is None else int(expires_at - time.monotonic())
+        raise RedisError(f"unknown command '{name}'")
+
+
+async def _read_command(reader: asyncio.StreamReader) -> Optional[List[bytes]]:
+    # Команда клиента — массив bulk-строк: *<n>\r\n$<len>\r\n<arg>\r\n...
+    line = await reader.readline()
+    if not line:
+        return None
+    if not line.startswith(b'*'):
+        # Inline-команда (например, из telnet)
+        return line.split()
+    command = []
+    for _ in range(int(line[1:])):
+        length = int((await reader.readline())[1:])
+        command.append((await reader.readexactly(length + 2))[:-2])
+    return command
+
+
+def _encode_reply(reply) -> bytes:
+    if reply is None:
+        return b'$-1\r\n'
+    if isinstance(reply, str):
+        return f"+{reply}\r\n".encode()
+    if isinstance(reply, int):
+        return f":{reply}\r\n".encode()
+    if isinstance(reply, bytes):
+        return b'$%d\r\n%s\r\n' % (len(reply), reply)
+    return b'*%d\r\n' % len(reply) + b''.join(_encode_reply(item) for item in reply)
+
+
+# Поддельные серверы, доступные для запуска из командной строки
+SERVERS = {
+    'openai': FakeOpenAIServer,
+    'redis': FakeRedisServer,
+    'yookassa': FakeYooKassaServer,
+}
+
+
+async def _serve(name: str, port: int):
+    async with SERVERS[name](port=port) as server:
+        logger.info("Поддельный сервер '%s' запущен: %s", name, server.url)
+        await asyncio.Event().wait()
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO)
+    parser = argparse.ArgumentParser(description="Поддельные серверы внешних API")
+    parser.add_argument('server', choices=sorted(SERVERS))
+    parser.add_argument('--port', type=int, default=8081)
+    args = parser.parse_args()
+    asyncio.run(_serve(args.server, args.port))
@@ -0,0 +1,36 @@
+import httpx
+
+import config
+
+"""
+Общий асинхронный HTTP-клиент процесса.
+
+Все внешние интеграции ходят через один httpx.AsyncClient: соединения переиспользуются
+(keep-alive), поэтому TLS-рукопожатие не повторяется на каждый запрос, а общее число
+соединений ограничено настройками пула.
+"""
+
+_client: httpx.AsyncClient = None
+
+
+def get_http_client() -> httpx.AsyncClient:
+    """Возвращает общий HTTP-клиент, создавая его при первом обращении."""
+    global _client
+    if _client is None or _client.is_closed:
+        _client = httpx.AsyncClient(
+            limits=httpx.Limits(
+                max_connections=config.HTTP_MAX_CONNECTIONS,
+                max_keepalive_connections=config.HTTP_MAX_KEEPALIVE,
+                keepalive_expiry=config.HTTP_KEEPALIVE_EXPIRY,
+            ),
+            timeout=config.OPENAI_TIMEOUT,
+        )
+    return _client
+
+
+async def close_http_client():
+    """Закрывает общий HTTP-клиент (при остановке бота)."""
+    global _client
+    if _client is not None:
+        await _client.aclose()
+        _client = None
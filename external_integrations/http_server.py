@@ -0,0 +1,199 @@
+import abc
+import asyncio
+import json
+import logging
+from typing import AsyncIterator, Callable, Dict, NamedTuple, Optional, Tuple, Union
+
+logger = logging.getLogger(__name__)
+
+"""
+Минимальный HTTP/1.1-сервер на asyncio с поддержкой keep-alive, без внешних зависимостей.
+
+На нем работают прием уведомлений о платежах (external_integrations/payment_webhook.py) и
+поддельные серверы внешних API (external_integrations/fake_servers.py). Тело запроса
+ограничено max_body байт и читается только по Content-Length. На чтение запроса дается
+read_timeout секунд, а простаивающее соединение закрывается через idle_timeout. Некорректный
+запрос получает ответ 400 (слишком большое тело — 413), и соединение закрывается. Ошибка
+обработчика записывается в лог, а клиент получает 500.
+"""
+
+# Ограничения по умолчанию: размер тела в байтах, время чтения запроса и простоя соединения в секундах
+MAX_BODY = 1024 * 1024
+READ_TIMEOUT = 30.0
+IDLE_TIMEOUT = 60.0
+# Максимум заголовков в запросе
+MAX_HEADERS = 100
+
+
+class Request(NamedTuple):
+    method: str
+    path: str
+    headers: Dict[str, str]
+    body: bytes
+
+    def json(self):
+        return json.loads(self.body or b'null')
+
+
+class Response(NamedTuple):
+    status: int
+    body: Union[dict, AsyncIterator[bytes]]
+    headers: Dict[str, str] = {}
+
+
+class BadRequest(Exception):
+    """Запрос нельзя разобрать; клиенту отправляется ответ status, соединение закрывается."""
+
+    def __init__(self, message: str, status: int = 400):
+        super().__init__(message)
+        self.status = status
+
+
+class TCPServer(abc.ABC):
+    """Основа серверов: запуск на asyncio и остановка, в том числе через async with."""
+
+    scheme = 'tcp'
+
+    def __init__(self, host: str = '127.0.0.1', port: int = 0):
+        self.host = host
+        self.port = port
+        self._server = None
+
+    @property
+    def url(self) -> str:
+        return f"{self.scheme}://{self.host}:{self.port}"
+
+    async def start(self):
+        self._server = await asyncio.start_server(self._handle_connection, self.host, self.port)
+        # При port=0 порт выбирает система
+        self.port = self._server.sockets[0].getsockname()[1]
+        logger.info("%s слушает %s", type(self).__name__, self.url)
+
+    async def stop(self):
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
+            self._server = None
+
+    async def __aenter__(self):
+        await self.start()
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.stop()
+
+    @abc.abstractmethod
+    async def _handle_connection(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        """Обслуживает одно соединение клиента."""
+
+
+class HTTPServer(TCPServer):
+    """
+    HTTP/1.1-сервер: подклассы регистрируют обработчики в self.routes: {(метод, путь): handler(request)}.
+
+    Обработчик возвращает Response с JSON-словарем или асинхронным итератором байтов
+    (потоковый ответ, соединение закрывается после него).
+    """
+
+    scheme = 'http'
+
+    def __init__(self, host: str = '127.0.0.1', port: int = 0, max_body: int = MAX_BODY,
+                 read_timeout: float = READ_TIMEOUT, idle_timeout: float = IDLE_TIMEOUT):
+        """
+        Args:
+            host (str): Адрес, на котором слушает сервер.
+            port (int): Порт (0 — выбирает система).
+            max_body (int): Максимальный размер тела запроса в байтах.
+            read_timeout (float): Время на чтение запроса (заголовков и тела) в секундах.
+            idle_timeout (float): Через сколько секунд без запросов закрывать соединение.
+        """
+        super().__init__(host, port)
+        self.max_body = max_body
+        self.read_timeout = read_timeout
+        self.idle_timeout = idle_timeout
+        self.routes: Dict[Tuple[str, str], Callable] = {}
+
+    async def _handle_connection(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        try:
+            while True:
+                try:
+                    request_line = await asyncio.wait_for(reader.readline(), self.idle_timeout)
+                    if not request_line:
+                        break
+                    request = await asyncio.wait_for(self._read_request(request_line, reader), self.read_timeout)
+                except asyncio.TimeoutError:
+                    break
+                except BadRequest as error:
+                    await self._write_response(writer, Response(error.status, {'error': str(error)},
+                                                                {'Connection': 'close'}))
+                    break
+
+                if not await self._write_response(writer, await self.handle(request)):
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    async def _read_request(self, request_line: bytes, reader: asyncio.StreamReader) -> Request:
+        try:
+            method, target, _ = request_line.decode('latin-1').split(' ', 2)
+            headers = {}
+            while (line := await reader.readline()) not in (b'\r\n', b'\n', b''):
+                if len(headers) >= MAX_HEADERS:
+                    raise BadRequest("too many headers")
+                name, separator, value = line.decode('latin-1').partition(':')
+                if not separator:
+                    raise BadRequest("malformed header")
+                headers[name.strip().lower()] = value.strip()
+            length = int(headers.get('content-length', 0))
+        except ValueError:
+            # Строка запроса не из трех частей, нечисловой Content-Length или строка длиннее буфера чтения
+            raise BadRequest("malformed request")
+
+        if 'transfer-encoding' in headers:
+            raise BadRequest("transfer-encoding is not supported", 501)
+        if length < 0:
+            raise BadRequest("malformed content-length")
+        if length > self.max_body:
+            raise BadRequest("request body is too large", 413)
+        body = await reader.readexactly(length)
+        return Request(method, target.split('?', 1)[0], headers, body)
+
+    async def handle(self, request: Request) -> Response:
+        """Ответ на запрос: обработчик маршрута, 404 без него и 500 при ошибке обработчика."""
+        handler = self.route(request)
+        if handler is None:
+            return Response(404, {'error': 'not found'})
+        try:
+            return await handler(request)
+        except Exception:
+            logger.exception("Ошибка обработки %s %s", request.method, request.path)
+            return Response(500, {'error': 'internal error'})
+
+    def route(self, request: Request) -> Optional[Callable]:
+        """Обработчик запроса; подклассы переопределяют для путей с параметрами."""
+        return self.routes.get((request.method, request.path))
+
+    @staticmethod
+    async def _write_response(writer: asyncio.StreamWriter, response: Response) -> bool:
+        # Возвращает True, если соединение можно использовать повторно
+        if isinstance(response.body, dict):
+            payload = json.dumps(response.body).encode()
+            head = {'Content-Type': 'application/json', 'Content-Length': str(len(payload)), **response.headers}
+            writer.write(_status_line(response.status, head) + payload)
+            await writer.drain()
+            return True
+
+        head = {'Content-Type': 'text/event-stream', 'Connection': 'close', **response.headers}
+        writer.write(_status_line(response.status, head))
+        async for chunk in response.body:
+            writer.write(chunk)
+            await writer.drain()
+        return False
+
+
+def _status_line(status: int, headers: Dict[str, str]) -> bytes:
+    lines = [f"HTTP/1.1 {status} {'OK' if status < 400 else 'Error'}"]
+    lines += [f"{name}: {value}" for name, value in headers.items()]
+    return ('\r\n'.join(lines) + '\r\n\r\n').encode('latin-1')
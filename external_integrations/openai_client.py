@@ -0,0 +1,120 @@
+import asyncio
+import json
+from typing import AsyncIterator, List
+
+import config
+from external_integrations.http_client import get_http_client
+
+# Ограничение одновременных запросов к OpenAI на процесс (общее для всех клиентов)
+_semaphore: asyncio.Semaphore = None
+
+
+def _concurrency_limit() -> asyncio.Semaphore:
+    global _semaphore
+    if _semaphore is None:
+        _semaphore = asyncio.Semaphore(config.OPENAI_MAX_CONCURRENCY)
+    return _semaphore
+
+
+class OpenAIClient:
+    """
+    Асинхронный клиент OpenAI API поверх общего пула HTTP-соединений.
+
+    Экземпляры с разными ключами используют одни и те же соединения.
+    """
+
+    def __init__(self, api_key: str = None, base_url: str = None, timeout: float = None):
+        """
+        Args:
+            api_key (str): API-ключ OpenAI (по умолчанию из config).
+            base_url (str): Базовый адрес API (по умолчанию из config).
+            timeout (float): Таймаут запроса в секундах (по умолчанию из config).
+        """
+        self.api_key = api_key or config.OPENAI_API_KEY
+        self.base_url = (base_url or config.OPENAI_BASE_URL).rstrip('/')
+        self.timeout = timeout or config.OPENAI_TIMEOUT
+
+    def _headers(self) -> dict:
+        return {"Authorization": f"Bearer {self.api_key}", "Content-Type": "application/json"}
+
+    async def _post(self, path: str, payload: dict, timeout: float = None) -> dict:
+        async with _concurrency_limit():
+            response = await get_http_client().post(
+                f"{self.base_url}{path}", json=payload, headers=self._headers(), timeout=timeout or self.timeout)
+        response.raise_for_status()
+        return response.json()
+
+    async def chat_completion(self, model: str, messages: List[dict], max_tokens: int = None,
+                              timeout: float = None, **params) -> str:
+        """
+        Запрос к /chat/completions.
+
+        Args:
+            model (str): Название модели.
+            messages (List[dict]): Сообщения в формате OpenAI.
+            max_tokens (int): Ограничение длины ответа.
+            timeout (float): Таймаут этого запроса в секундах.
+
+        Returns:
+            str: Текст ответа модели.
+        """
+        payload = {"model": model, "messages": messages, **params}
+        if max_tokens is not None:
+            payload["max_tokens"] = max_tokens
+        data = await self._post("/chat/completions", payload, timeout)
+        return data["choices"][0]["message"]["content"].strip()
+
+    async def stream_chat_completion(self, model: str, messages: List[dict], timeout: float = None,
+                                     **params) -> AsyncIterator[str]:
+        """
+        Потоковый запрос к /chat/completions (server-sent events).
+
+        Returns:
+            AsyncIterator[str]: Фрагменты текста ответа по мере генерации.
+        """
+        payload = {"model": model, "messages": messages, "stream": True, **params}
+        async with _concurrency_limit():
+            async with get_http_client().stream(
+                    "POST", f"{self.base_url}/chat/completions", json=payload, headers=self._headers(),
+                    timeout=timeout or self.timeout) as response:
+                response.raise_for_status()
+                async for line in response.aiter_lines():
+                    if not line.startswith("data: "):
+                        continue
+                    data = line[len("data: "):]
+                    if data == "[DONE]":
+                        break
+                    delta = json.loads(data)["choices"][0].get("delta", {}).get("content")
+                    if delta:
+                        yield delta
+
+    async def create_image(self, prompt: str, size: str = "1024x1024", model: str = None,
+                           timeout: float = None) -> str:
+        """
+        Запрос к /images/generations.
+
+        Args:
+            prompt (str): Описание изображения.
+            size (str): Размер изображения.
+            model (str): Модель генерации (по умолчанию — модель API по умолчанию).
+            timeout (float): Таймаут этого запроса в секундах.
+
+        Returns:
+            str: URL сгенерированного изображения.
+        """
+        payload = {"prompt": prompt, "n": 1, "size": size}
+        if model is not None:
+            payload["model"] = model
+        data = await self._post("/images/generations", payload, timeout)
+        return data["data"][0]["url"]
+
+
+_default_client: OpenAIClient = None
+
+
+def get_openai_client() -> OpenAIClient:
+    """Клиент OpenAI с настройками из config."""
+    global _default_client
+    if _default_client is None:
+        _default_client = OpenAIClient()
+    return _default_client
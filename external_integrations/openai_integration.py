@@ -1,56 +1,149 @@
-# Импорт библиотеки OpenAI для взаимодействия с OpenAI API
-import openai
-from business_logic.dialog_management import DialogManager
-from data_access.database import get_session
+# Асинхронный клиент OpenAI API поверх общего пула HTTP-соединений
+import time
+from typing import AsyncIterator
+from business_logic.dialog_management import AsyncDialogManager
+from business_logic.message_sink import message_sink
+from external_integrations.openai_client import get_openai_client
+from business_logic.entitlements import entitlements
+from business_logic.llm_scheduler import FREE_TIER, llm_scheduler
+from external_integrations.response_cache import get_response_cache
+from monitoring.metrics import registry
 
+# Названия моделей OpenAI для значений bot_type диалога
+MODEL_NAMES = {
+    'gpt_4o': 'gpt-4o',
+    'gpt_4o_mini': 'gpt-4o-mini',
+    'o1': 'o1',
+    'o1_mini': 'o1-mini',
+}
 
-def get_openai_response(prompt):
+# Модель по умолчанию, если в диалоге указано неизвестное значение
+DEFAULT_MODEL = 'gpt-4o-mini'
+
+
+async def get_openai_response(prompt, bot_type=None, user_id=None, tier=FREE_TIER, role=None, use_cache=False):
     """
     Отправляет запрос к OpenAI API с заданным текстом и возвращает ответ.
 
+    Запрос ждет свободного слота модели в планировщике с учетом тарифа пользователя.
+
     :param prompt: Строка с текстовым запросом к модели
+    :param bot_type: Модель диалога (bot_type); по умолчанию DEFAULT_MODEL
+    :param user_id: Идентификатор пользователя (для очереди планировщика)
+    :param tier: Тариф пользователя (FREE_TIER — без подписки)
+    :param role: Роль диалога (часть ключа кэша ответов)
+    :param use_cache: Разрешить кэш ответов — только для запросов без истории диалога
     :return: Текстовый ответ от модели OpenAI
     """
+    model = MODEL_NAMES.get(bot_type, DEFAULT_MODEL)
+    cache = get_response_cache() if use_cache else None
+    # Параметр max_tokens ограничивает длину ответа до 150 токенов.
+    params = {'max_tokens': 150}
 
-    # Устанавливает API-ключ для аутентификации запросов к OpenAI
-    openai.api_key = "YOUR_OPENAI_API_KEY"
+    if cache is not None:
+        cached = await cache.get(model, role, prompt, params)
+        if cached is not None:
+            return cached
 
-    # Отправляет запрос к модели text-davinci-003 с заданным prompt.
-    # Параметр max_tokens ограничивает длину ответа до 150 токенов.
-    response = openai.Completion.create(
-        engine="text-davinci-003",
-        prompt=prompt,
-        max_tokens=150
-    )
+    async with llm_scheduler.slot(model, user_id, tier):
+        response_text = await get_openai_client().chat_completion(
+            model=model,
+            messages=[{"role": "user", "content": prompt}],
+            **params
+        )
+
+    if cache is not None:
+        await cache.set(model, role, prompt, response_text, params)
+    return response_text
+
+
+def build_prompt(dialog_history: str, user_message: str, ignore_history: bool) -> str:
+    """
+    Формирует prompt из истории диалога и нового сообщения.
 
-    # Извлекает текст ответа из объекта response и возвращает его, удаляя лишние пробелы
-    return response.choices[0].text.strip()
+    :param dialog_history: История диалога
+    :param user_message: Новое сообщение пользователя
+    :param ignore_history: Использовать только новое сообщение
+    :return: Текст запроса к модели
+    """
+    if ignore_history or not dialog_history:
+        return f":User   {user_message}\nAI:"
+    return f"{dialog_history}\n:User   {user_message}\nAI:"
 
 
-def chat_with_openai(dialog_id, user_id, user_message, context):
-    session = get_session()
-    dialog_manager = DialogManager(session)
+async def stream_openai_response(prompt: str, bot_type: str, user_id: int = None, tier: str = FREE_TIER,
+                                 role: str = None, use_cache: bool = False) -> AsyncIterator[str]:
+    """
+    Запрашивает ответ модели в потоковом режиме и отдает его фрагментами по мере генерации.
 
-    # Сохраняем сообщение пользователя
-    dialog_manager.save_message(dialog_id, user_id, user_message)
+    Слот модели в планировщике удерживается до конца потока. Время до первого фрагмента
+    (time-to-first-token) и полное время ответа записываются в метрики с меткой модели;
+    ожидание в очереди планировщика учитывается отдельно.
+
+    :param prompt: Текст запроса к модели
+    :param bot_type: Модель диалога (bot_type), например 'gpt_4o'
+    :param user_id: Идентификатор пользователя (для очереди планировщика)
+    :param tier: Тариф пользователя (FREE_TIER — без подписки)
+    :param role: Роль диалога (часть ключа кэша ответов)
+    :param use_cache: Разрешить кэш ответов — только для запросов без истории диалога
+    :return: Асинхронный итератор фрагментов текста ответа
+    """
+    model = MODEL_NAMES.get(bot_type, DEFAULT_MODEL)
+    cache = get_response_cache() if use_cache else None
+
+    if cache is not None:
+        cached = await cache.get(model, role, prompt)
+        if cached is not None:
+            # Готовый ответ отдаем одним фрагментом, без обращения к модели
+            yield cached
+            return
+
+    parts = []
+    async with llm_scheduler.slot(model, user_id, tier):
+        started = time.perf_counter()
+        first_token = True
+
+        async for delta in get_openai_client().stream_chat_completion(
+                model=model, messages=[{"role": "user", "content": prompt}]):
+            if first_token:
+                registry.histogram('llm_time_to_first_token_seconds', model=model).observe(
+                    time.perf_counter() - started)
+                first_token = False
+            parts.append(delta)
+            yield delta
+
+        registry.histogram('llm_response_seconds', model=model).observe(time.perf_counter() - started)
+
+    if cache is not None:
+        await cache.set(model, role, prompt, ''.join(parts))
+
+
+async def chat_with_openai(dialog_id, user_id, user_message, context):
+    dialog_manager = AsyncDialogManager(context.db_session)
 
     # Проверяем, нужно ли игнорировать старую историю
     ignore_history = context.user_data.get('ignore_history', False)
 
-    # Получаем историю диалога
-    dialog_history = dialog_manager.get_dialog_history(dialog_id)
+    # Получаем историю диалога (окно последних сообщений) до сохранения нового,
+    # чтобы сообщение пользователя не попало в prompt дважды
+    dialog_history = await dialog_manager.get_dialog_history(dialog_id)
+
+    # Тариф определяет место запроса в очереди к модели
+    tier = (await entitlements.get(context.db_session, user_id)).plan or FREE_TIER
+
+    # Ставим сообщение пользователя в очередь на запись
+    await message_sink.enqueue(dialog_id, user_id, user_message)
 
-    # Если нужно игнорировать старую историю, используем только новое сообщение
-    if ignore_history:
-        prompt = f":User   {user_message}\nAI:"
-    else:
-        # Формируем полный prompt с историей диалога и новым сообщением
-        prompt = f"{dialog_history}\n:User   {user_message}\nAI:"
+    # Формируем prompt: только новое сообщение или история диалога вместе с ним
+    prompt = build_prompt(dialog_history, user_message, ignore_history)
 
-    # Получаем ответ от OpenAI
-    response_text = get_openai_response(prompt)
+    # Получаем ответ от OpenAI; без истории ответ можно взять из кэша
+    dialog = await dialog_manager.get_dialog_by_id(dialog_id)
+    response_text = await get_openai_response(
+        prompt, bot_type=dialog.bot_type, user_id=user_id, tier=tier, role=dialog.role_type,
+        use_cache=ignore_history or not dialog_history)
 
-    # Сохраняем ответ от OpenAI
-    dialog_manager.save_message(dialog_id, user_id, response_text)
+    # Ставим ответ от OpenAI в очередь на запись
+    await message_sink.enqueue(dialog_id, user_id, response_text)
 
     return response_text
@@ -1,24 +1,177 @@
-import requests
-
-
-def create_payment(amount, description):
-    headers = {
-        'Authorization': f'Basic {YOO_KASSA_API_KEY}',
-        'Content-Type': 'application/json',
-    }
-
-    payment_data = {
-        "amount": {
-            "value": str(amount),
-            "currency": "RUB"
-        },
-        "confirmation": {
-            "type": "redirect",
-            "return_url": "https://yourwebsite.com/return"  # URL для возврата после оплаты
-        },
-        "description": description,
-        "capture": True,
-    }
-
-    response = requests.post(YOO_KASSA_API_URL, json=payment_data, headers=headers)
-    return response.json()
+import asyncio
+import logging
+import random
+import uuid
+from typing import NamedTuple, Optional
+
+import httpx
+
+import config
+from external_integrations.http_client import get_http_client
+from monitoring.metrics import registry
+
+logger = logging.getLogger(__name__)
+
+"""
+Асинхронный клиент платежного шлюза ЮKassa.
+
+Запросы идут через общий пул HTTP-соединений и не блокируют цикл событий. Ключ
+идемпотентности выводится из пользователя и заказа, поэтому повторное нажатие кнопки оплаты
+и повтор запроса после обрыва связи возвращают уже созданный платеж, а не создают новый.
+
+Сетевые ошибки, 429 и 5xx повторяются с паузой со случайным разбросом (full jitter), пока не
+исчерпаны попытки или общий срок PAYMENT_DEADLINE. Остальные ответы 4xx не повторяются.
+"""
+
+# Пространство имен ключей идемпотентности платежей
+IDEMPOTENCE_NAMESPACE = uuid.UUID('1438b1a1-369e-459f-bb84-566e09838da4')
+
+# Коды ответа, после которых запрос можно повторить с тем же ключом
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+
+class PaymentError(Exception):
+    """Шлюз отклонил запрос или не ответил до истечения срока."""
+
+    def __init__(self, message: str, status: Optional[int] = None, body: Optional[dict] = None):
+        super().__init__(message)
+        self.status = status
+        self.body = body
+
+
+class Payment(NamedTuple):
+    payment_id: str
+    status: str                         # pending, waiting_for_capture, succeeded, canceled
+    amount: float
+    confirmation_url: Optional[str]     # Куда отправить пользователя для оплаты
+    metadata: dict
+
+    @classmethod
+    def from_json(cls, data: dict) -> 'Payment':
+        return cls(data['id'], data['status'], float(data['amount']['value']),
+                   (data.get('confirmation') or {}).get('confirmation_url'), data.get('metadata') or {})
+
+
+def error_body(response: httpx.Response) -> dict:
+    """Тело ответа с ошибкой; прокси перед шлюзом может ответить не JSON, а, например, HTML."""
+    try:
+        body = response.json()
+    except ValueError:
+        return {'text': response.text}
+    return body if isinstance(body, dict) else {'text': response.text}
+
+
+def idempotence_key(user_id: int, order_id: str) -> str:
+    """Ключ идемпотентности: один и тот же для одного заказа пользователя."""
+    return str(uuid.uuid5(IDEMPOTENCE_NAMESPACE, f"{user_id}:{order_id}"))
+
+
+class PaymentClient:
+    def __init__(self, shop_id: str = None, secret_key: str = None, base_url: str = None,
+                 timeout: float = None, deadline: float = None, max_attempts: int = None):
+        """
+        Args:
+            shop_id (str): Идентификатор магазина (по умолчанию из config).
+            secret_key (str): Секретный ключ магазина (по умолчанию из config).
+            base_url (str): Базовый адрес API (по умолчанию из config).
+            timeout (float): Таймаут одной попытки в секундах.
+            deadline (float): Общий срок запроса со всеми повторами в секундах.
+            max_attempts (int): Максимум попыток.
+        """
+        self.auth = (shop_id or config.YOO_KASSA_SHOP_ID, secret_key or config.YOO_KASSA_SECRET_KEY)
+        self.base_url = (base_url or config.YOO_KASSA_API_URL).rstrip('/')
+        self.timeout = timeout or config.PAYMENT_TIMEOUT
+        self.deadline = deadline or config.PAYMENT_DEADLINE
+        self.max_attempts = max_attempts or config.PAYMENT_MAX_ATTEMPTS
+        self.retries = registry.counter('payment_retries_total')
+        self.latency = registry.histogram('payment_request_seconds')
+
+    @staticmethod
+    def _backoff(attempt: int, retry_after: Optional[str]) -> float:
+        if retry_after is not None:
+            try:
+                return float(retry_after)
+            except ValueError:
+                pass
+        return random.uniform(0, min(config.PAYMENT_BACKOFF_MAX, config.PAYMENT_BACKOFF_BASE * 2 ** attempt))
+
+    async def _request(self, method: str, path: str, payload: dict = None, key: str = None) -> dict:
+        loop = asyncio.get_running_loop()
+        started = loop.time()
+        deadline = started + self.deadline
+        headers = {'Idempotence-Key': key} if key else {}
+        attempt = 0
+        while True:
+            status, retry_after, error = None, None, None
+            try:
+                response = await get_http_client().request(
+                    method, f"{self.base_url}{path}", json=payload, headers=headers, auth=self.auth,
+                    timeout=max(0.1, min(self.timeout, deadline - loop.time())))
+                status = response.status_code
+                if status < 400:
+                    self.latency.observe(loop.time() - started)
+                    return response.json()
+                if status not in RETRY_STATUSES:
+                    raise PaymentError(f"Шлюз отклонил запрос {method} {path}: {status}", status, error_body(response))
+                retry_after = response.headers.get('Retry-After')
+                error = f"ответ {status}"
+            except httpx.TransportError as transport_error:
+                error = repr(transport_error)
+
+            attempt += 1
+            pause = self._backoff(attempt, retry_after)
+            if attempt >= self.max_attempts or loop.time() + pause >= deadline:
+                raise PaymentError(f"Шлюз не ответил на {method} {path}: {error}", status)
+            logger.warning("Повтор %s %s через %.1f с: %s", method, path, pause, error)
+            self.retries.inc()
+            await asyncio.sleep(pause)
+
+    async def create_payment(self, user_id: int, order_id: str, amount: float, description: str,
+                             return_url: str = None, plan: str = None) -> Payment:
+        """
+        Создает платеж (или возвращает уже созданный для этого заказа).
+
+        Args:
+            user_id (int): Идентификатор пользователя.
+            order_id (str): Идентификатор заказа; вместе с user_id определяет ключ идемпотентности.
+            amount (float): Сумма в рублях.
+            description (str): Назначение платежа.
+            return_url (str): Адрес возврата после оплаты (по умолчанию PAYMENT_RETURN_URL).
+            plan (str): Оплачиваемая подписка; None — пополнение баланса.
+
+        Returns:
+            Payment: Платеж со ссылкой на оплату.
+        """
+        payload = {
+            'amount': {'value': f"{amount:.2f}", 'currency': 'RUB'},
+            'confirmation': {'type': 'redirect', 'return_url': return_url or config.PAYMENT_RETURN_URL},
+            'capture': True,
+            'description': description,
+            # Вернется в уведомлении о платеже — по нему платеж сопоставляется с пользователем
+            'metadata': {'user_id': str(user_id), 'order_id': order_id},
+        }
+        if plan is not None:
+            payload['metadata']['plan'] = plan
+        data = await self._request('POST', '/payments', payload, key=idempotence_key(user_id, order_id))
+        return Payment.from_json(data)
+
+    async def get_payment(self, payment_id: str) -> Payment:
+        """Текущее состояние платежа."""
+        return Payment.from_json(await self._request('GET', f'/payments/{payment_id}'))
+
+
+_default_client: PaymentClient = None
+
+
+def get_payment_client() -> PaymentClient:
+    """Клиент ЮKassa с настройками из config."""
+    global _default_client
+    if _default_client is None:
+        _default_client = PaymentClient()
+    return _default_client
+
+
+async def create_payment(user_id: int, order_id: str, amount: float, description: str,
+                         plan: str = None) -> Payment:
+    """Создает платеж клиентом по умолчанию."""
+    return await get_payment_client().create_payment(user_id, order_id, amount, description, plan=plan)
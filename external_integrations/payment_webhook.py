@@ -0,0 +1,129 @@
+import argparse
+import asyncio
+import logging
+
+import config
+from business_logic.payment_ingestion import (SUCCEEDED_EVENT, PaymentFailedError, PaymentIngestor,
+                                              PaymentNotification, payment_ingestor)
+from external_integrations.http_client import close_http_client
+from external_integrations.http_server import HTTPServer, Request, Response
+from external_integrations.payment import PaymentClient, PaymentError, get_payment_client
+
+logger = logging.getLogger(__name__)
+
+"""
+Прием HTTP-уведомлений ЮKassa о платежах.
+
+Тело уведомления не считается доверенным: платеж перечитывается из API шлюза, и зачисляются
+сумма и metadata из ответа API. Ответ 200 отправляется только после записи платежа в БД
+(PaymentIngestor.submit с wait=True). Если запись не успела за PAYMENT_WEBHOOK_ACK_TIMEOUT или
+шлюз не ответил, возвращается 503 — шлюз повторит уведомление, а повтор не зачислит платеж дважды.
+Платеж, который записан, но не применен (status = failed), получает 500: повтор уведомления
+от шлюза снова попытается его применить.
+
+Запуск отдельным процессом (например, при BOT_MODE=supervisor):
+python -m external_integrations.payment_webhook
+"""
+
+
+class PaymentWebhookServer(HTTPServer):
+    """HTTP-сервер уведомлений о платежах с ограничениями PAYMENT_WEBHOOK_* на размер и время запроса."""
+
+    def __init__(self, host: str = None, port: int = None, path: str = None, ack_timeout: float = None,
+                 ingestor: PaymentIngestor = None, client: PaymentClient = None):
+        """
+        Args:
+            host (str): Адрес, на котором слушает сервер (по умолчанию из config).
+            port (int): Порт (по умолчанию из config; 0 — выбирает система).
+            path (str): Путь обработчика уведомлений (по умолчанию из config).
+            ack_timeout (float): Сколько секунд ждать записи платежа в БД перед ответом.
+            ingestor (PaymentIngestor): Прием платежей (по умолчанию общий для процесса).
+            client (PaymentClient): Клиент шлюза для проверки платежа (по умолчанию из config).
+        """
+        super().__init__(host or config.PAYMENT_WEBHOOK_LISTEN,
+                         config.PAYMENT_WEBHOOK_PORT if port is None else port,
+                         max_body=config.PAYMENT_WEBHOOK_MAX_BODY,
+                         read_timeout=config.PAYMENT_WEBHOOK_READ_TIMEOUT,
+                         idle_timeout=config.PAYMENT_WEBHOOK_IDLE_TIMEOUT)
+        self.ack_timeout = ack_timeout or config.PAYMENT_WEBHOOK_ACK_TIMEOUT
+        self.ingestor = ingestor or payment_ingestor
+        self.client = client or get_payment_client()
+        self.routes[('POST', path or config.PAYMENT_WEBHOOK_PATH)] = self.notification
+
+    async def notification(self, request: Request) -> Response:
+        try:
+            data = request.json()
+            event, payment_id = data['event'], str(data['object']['id'])
+        except (KeyError, TypeError, ValueError):
+            return Response(400, {'error': 'invalid notification'})
+        if event != SUCCEEDED_EVENT:
+            return Response(200, {'status': 'ignored'})
+
+        try:
+            payment = await self.client.get_payment(payment_id)
+        except PaymentError as error:
+            if error.status == 404:
+                logger.warning("Уведомление о неизвестном платеже %s", payment_id)
+                return Response(400, {'error': 'unknown payment'})
+            logger.warning("Не удалось проверить платеж %s: %s", payment_id, error)
+            return Response(503, {'error': 'payment gateway unavailable'})
+        except (KeyError, TypeError, ValueError):
+            # Шлюз (или прокси перед ним) ответил 200, но не платежом в JSON
+            logger.exception("Некорректный ответ шлюза на запрос платежа %s", payment_id)
+            return Response(503, {'error': 'payment gateway unavailable'})
+        if payment.status != 'succeeded':
+            logger.warning("Уведомление о завершении платежа %s в статусе %s", payment_id, payment.status)
+            return Response(400, {'error': 'payment is not succeeded'})
+
+        # Уведомление из данных API шлюза, а не из тела запроса
+        verified = {'event': SUCCEEDED_EVENT,
+                    'object': {'id': payment.payment_id, 'status': payment.status,
+                               'amount': {'value': f"{payment.amount:.2f}"}, 'metadata': payment.metadata}}
+        try:
+            PaymentNotification.from_json(verified)
+        except (KeyError, TypeError, ValueError):
+            logger.warning("Платеж %s без пользователя в metadata: %s", payment_id, payment.metadata)
+            return Response(400, {'error': 'payment without user'})
+
+        try:
+            accepted = await asyncio.wait_for(self.ingestor.submit(verified, wait=True), timeout=self.ack_timeout)
+        except asyncio.TimeoutError:
+            # Платеж остается в буфере и будет записан; повтор уведомления дождется записи
+            return Response(503, {'error': 'payment is not committed yet'})
+        except PaymentFailedError:
+            return Response(500, {'error': 'payment is not applied'})
+        return Response(200, {'status': 'accepted' if accepted else 'duplicate'})
+
+
+async def serve(host: str = None, port: int = None):
+    """Принимает уведомления до остановки процесса, затем применяет остаток буфера."""
+    from data_access.database import async_engine
+
+    try:
+        async with PaymentWebhookServer(host, port) as server:
+            logger.info("Уведомления о платежах принимаются на %s%s", server.url, config.PAYMENT_WEBHOOK_PATH)
+            await asyncio.Event().wait()
+    finally:
+        await payment_ingestor.stop()
+        await close_http_client()
+        await async_engine.dispose()
+
+
+def main():
+    from data_access.database import init_db
+
+    parser = argparse.ArgumentParser(description="Прием уведомлений ЮKassa о платежах")
+    parser.add_argument('--host', default=config.PAYMENT_WEBHOOK_LISTEN)
+    parser.add_argument('--port', type=int, default=config.PAYMENT_WEBHOOK_PORT or 8082)
+    args = parser.parse_args()
+
+    init_db()
+    try:
+        asyncio.run(serve(args.host, args.port))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO)
+    main()
@@ -0,0 +1,172 @@
+import asyncio
+import hashlib
+import json
+import logging
+import sqlite3
+import threading
+import time
+from typing import Optional
+
+import config
+from business_logic.cache import TTLCache
+from monitoring.metrics import registry
+
+logger = logging.getLogger(__name__)
+
+"""
+Кэш ответов модели на одиночные запросы.
+
+Многие пользователи отправляют одинаковые короткие запросы ("привет", "переведи", шаблонные
+вопросы) без истории диалога. Ответ на такой запрос зависит только от модели, роли, текста
+и параметров генерации (max_tokens, temperature и т.д.), поэтому его можно переиспользовать.
+Кэш двухуровневый: LRU в памяти с ограничением по байтам и файл SQLite, который переживает
+перезапуск бота. Запросы с историей диалога не кэшируются.
+"""
+
+# Как часто (в записях) чистить файл кэша от устаревших и лишних записей
+DISK_PURGE_EVERY = 200
+
+
+def normalize_prompt(prompt: str) -> str:
+    """Приводит запрос к каноническому виду: без регистра и лишних пробелов."""
+    return ' '.join(prompt.split()).casefold()
+
+
+def cache_key(model: str, role: Optional[str], prompt: str, params: Optional[dict] = None) -> str:
+    # Параметры генерации меняют ответ, поэтому входят в ключ (в каноническом порядке)
+    options = json.dumps(params or {}, sort_keys=True, separators=(',', ':'))
+    return hashlib.sha256(f"{model}\x1f{role or ''}\x1f{options}\x1f{normalize_prompt(prompt)}".encode()).hexdigest()
+
+
+class SQLiteResponseStore:
+    """Хранилище кэша в файле SQLite (вызывается из потока, чтобы не блокировать цикл событий)."""
+
+    def __init__(self, path: str, max_bytes: int):
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._writes = 0
+        self._connection = sqlite3.connect(path, check_same_thread=False)
+        self._connection.execute(
+            'CREATE TABLE IF NOT EXISTS responses ('
+            'key TEXT PRIMARY KEY, value TEXT NOT NULL, size INTEGER NOT NULL, '
+            'expires_at REAL NOT NULL, accessed_at REAL NOT NULL)')
+        self._connection.commit()
+
+    def get(self, key: str) -> Optional[tuple]:
+        """Возвращает (значение, оставшееся время жизни) или None."""
+        now = time.time()
+        with self._lock:
+            row = self._connection.execute(
+                'SELECT value, expires_at FROM responses WHERE key = ? AND expires_at > ?', (key, now)).fetchone()
+            if row is None:
+                return None
+            self._connection.execute('UPDATE responses SET accessed_at = ? WHERE key = ?', (now, key))
+            self._connection.commit()
+        return row[0], row[1] - now
+
+    def set(self, key: str, value: str, ttl: float):
+        now = time.time()
+        with self._lock:
+            self._connection.execute(
+                'INSERT OR REPLACE INTO responses (key, value, size, expires_at, accessed_at) VALUES (?, ?, ?, ?, ?)',
+                (key, value, len(value.encode()), now + ttl, now))
+            self._writes += 1
+            if self._writes % DISK_PURGE_EVERY == 0:
+                self._purge(now)
+            self._connection.commit()
+
+    def _purge(self, now: float):
+        # Удаляем устаревшие записи, затем самые давно использованные, пока размер не уложится в лимит
+        self._connection.execute('DELETE FROM responses WHERE expires_at <= ?', (now,))
+        total = self._connection.execute('SELECT COALESCE(SUM(size), 0) FROM responses').fetchone()[0]
+        if total > self.max_bytes:
+            self._connection.execute(
+                'DELETE FROM responses WHERE key IN ('
+                '  SELECT key FROM (SELECT key, SUM(size) OVER (ORDER BY accessed_at DESC) AS kept FROM responses)'
+                '  WHERE kept > ?)', (self.max_bytes,))
+
+    def close(self):
+        with self._lock:
+            self._connection.close()
+
+
+class ResponseCache:
+    def __init__(self, ttl: float, maxsize: int, max_bytes: int, store: Optional[SQLiteResponseStore] = None):
+        """
+        Args:
+            ttl (float): Время жизни ответа в секундах.
+            maxsize (int): Максимум записей в памяти.
+            max_bytes (int): Ограничение размера ответов в памяти, в байтах.
+            store (SQLiteResponseStore): Постоянное хранилище (None — только память).
+        """
+        self.ttl = ttl
+        self.memory = TTLCache('llm_response', maxsize=maxsize, ttl=ttl, max_bytes=max_bytes,
+                               sizeof=lambda value: len(value.encode()))
+        self.store = store
+        self.disk_hits = registry.counter('llm_response_cache_disk_hits_total')
+        self.misses = registry.counter('llm_response_cache_misses_total')
+
+    async def get(self, model: str, role: Optional[str], prompt: str, params: Optional[dict] = None) -> Optional[str]:
+        """Ответ из кэша или None (params — параметры генерации запроса)."""
+        key = cache_key(model, role, prompt, params)
+        value = self.memory.get(key)
+        if value is not None:
+            return value
+
+        if self.store is not None:
+            try:
+                found = await asyncio.to_thread(self.store.get, key)
+            except sqlite3.Error:
+                # Сбой файла кэша не должен ронять запрос — считаем промахом
+                logger.warning("Не удалось прочитать ответ из файла кэша", exc_info=True)
+                found = None
+            if found is not None:
+                value, ttl_left = found
+                self.memory.set(key, value, ttl=ttl_left)
+                self.disk_hits.inc()
+                return value
+
+        self.misses.inc()
+        return None
+
+    async def set(self, model: str, role: Optional[str], prompt: str, response: str, params: Optional[dict] = None):
+        """Сохраняет ответ в памяти и в постоянном хранилище (params — параметры генерации запроса)."""
+        if not response:
+            return
+        key = cache_key(model, role, prompt, params)
+        self.memory.set(key, response)
+        if self.store is not None:
+            try:
+                await asyncio.to_thread(self.store.set, key, response, self.ttl)
+            except sqlite3.Error:
+                # Ответ уже получен и остается в памяти — запрос не должен из-за этого падать
+                logger.warning("Не удалось записать ответ в файл кэша", exc_info=True)
+
+    def stats(self) -> dict:
+        """Доля ответов, найденных в кэше (в памяти или на диске)."""
+        memory = self.memory.stats()
+        hits = memory['hits'] + self.disk_hits.value
+        total = hits + self.misses.value
+        return {
+            'memory': memory,
+            'disk_hits': self.disk_hits.value,
+            'misses': self.misses.value,
+            'hit_rate': hits / total if total else 0.0,
+        }
+
+
+_response_cache: Optional[ResponseCache] = None
+
+
+def get_response_cache() -> Optional[ResponseCache]:
+    """Общий кэш ответов процесса или None, если кэш выключен в настройках."""
+    global _response_cache
+    if not config.RESPONSE_CACHE_ENABLED:
+        return None
+    if _response_cache is None:
+        store = None
+        if config.RESPONSE_CACHE_PATH:
+            store = SQLiteResponseStore(config.RESPONSE_CACHE_PATH, config.RESPONSE_CACHE_DISK_MAX_BYTES)
+        _response_cache = ResponseCache(config.RESPONSE_CACHE_TTL, config.RESPONSE_CACHE_SIZE,
+                                        config.RESPONSE_CACHE_MAX_BYTES, store)
+    return _response_cache
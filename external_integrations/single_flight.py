@@ -0,0 +1,82 @@
+import asyncio
+from typing import Any, Awaitable, Callable, Dict, Hashable
+
+from business_logic.cache import TTLCache
+from monitoring.metrics import registry
+
+# Сколько ключей хранить в статистике по ключам
+KEY_STATS_SIZE = 1000
+
+
+class SingleFlight:
+    """
+    Объединение одинаковых одновременных запросов к внешнему API.
+
+    Пока выполняется запрос по ключу, остальные вызовы с тем же ключом не идут во внешний API,
+    а ждут его результата. Успешный результат еще reuse_window секунд отдается новым вызовам
+    без повторного запроса. Ошибка передается всем ожидающим и не запоминается.
+    """
+
+    def __init__(self, name: str, reuse_window: float):
+        """
+        Args:
+            name (str): Имя в метриках.
+            reuse_window (float): Сколько секунд переиспользовать готовый результат.
+        """
+        self.name = name
+        self._inflight: Dict[Hashable, asyncio.Task] = {}
+        self._recent = TTLCache(f'{name}_results', maxsize=KEY_STATS_SIZE, ttl=reuse_window)
+        # Статистика по ключам: сколько раз ходили во внешний API, дождались чужого запроса, взяли готовое
+        self._key_stats = TTLCache(f'{name}_key_stats', maxsize=KEY_STATS_SIZE, ttl=3600.0)
+        self.upstream = registry.counter('single_flight_upstream_total', flight=name)
+        self.coalesced = registry.counter('single_flight_coalesced_total', flight=name)
+        self.reused = registry.counter('single_flight_reused_total', flight=name)
+
+    async def do(self, key: Hashable, call: Callable[[], Awaitable[Any]]) -> Any:
+        """
+        Выполняет call() не более одного раза на ключ среди одновременных вызовов.
+
+        Args:
+            key (Hashable): Ключ запроса.
+            call (Callable): Функция, выполняющая запрос к внешнему API.
+
+        Returns:
+            Any: Результат call().
+        """
+        result = self._recent.get(key)
+        if result is not None:
+            self._count(key, 'reused', self.reused)
+            return result
+
+        task = self._inflight.get(key)
+        if task is None:
+            self._count(key, 'upstream', self.upstream)
+            # Запрос выполняется отдельной задачей: отмена одного из ожидающих не отменяет его для остальных
+            task = asyncio.ensure_future(call())
+            self._inflight[key] = task
+            task.add_done_callback(lambda done: self._finish(key, done))
+        else:
+            self._count(key, 'coalesced', self.coalesced)
+
+        return await asyncio.shield(task)
+
+    def _finish(self, key: Hashable, task: asyncio.Task):
+        self._inflight.pop(key, None)
+        if not task.cancelled() and task.exception() is None and task.result() is not None:
+            self._recent.set(key, task.result())
+
+    def _count(self, key: Hashable, kind: str, counter):
+        counter.inc()
+        stats = self._key_stats.get(key)
+        if stats is None:
+            stats = {'upstream': 0, 'coalesced': 0, 'reused': 0}
+            self._key_stats.set(key, stats)
+        stats[kind] += 1
+
+    def key_stats(self, key: Hashable) -> dict:
+        """Счетчики по ключу (пока ключ не вытеснен из статистики)."""
+        return dict(self._key_stats.get(key) or {})
+
+    def inflight(self) -> int:
+        """Количество выполняющихся запросов."""
+        return len(self._inflight)
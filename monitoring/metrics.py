@@ -0,0 +1,140 @@
+import threading
+from bisect import bisect_left
+from typing import Dict, Iterable, Tuple
+
+"""
+Простые метрики процесса: счетчики, измерители (gauge) и гистограммы.
+
+Метрики регистрируются в общем реестре по имени и набору меток, а snapshot()
+отдает текущие значения словарем — его можно писать в лог или отдавать наружу.
+"""
+
+# Границы корзин гистограммы по умолчанию, в секундах
+DEFAULT_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+
+class Counter:
+    """Монотонно растущий счетчик."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.value = 0
+
+    def inc(self, amount: float = 1):
+        with self._lock:
+            self.value += amount
+
+    def snapshot(self):
+        return self.value
+
+
+class Gauge:
+    """Значение, которое может как расти, так и уменьшаться."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.value = 0
+
+    def set(self, value: float):
+        with self._lock:
+            self.value = value
+
+    def inc(self, amount: float = 1):
+        with self._lock:
+            self.value += amount
+
+    def dec(self, amount: float = 1):
+        self.inc(-amount)
+
+    def snapshot(self):
+        return self.value
+
+
+class Histogram:
+    """Распределение наблюдаемых значений по корзинам."""
+
+    def __init__(self, buckets: Tuple[float, ...] = DEFAULT_BUCKETS):
+        self._lock = threading.Lock()
+        self.buckets = tuple(sorted(buckets))
+        # Последняя корзина — для значений больше самой большой границы (+Inf)
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value: float):
+        with self._lock:
+            self.counts[bisect_left(self.buckets, value)] += 1
+            self.count += 1
+            self.sum += value
+
+    def snapshot(self):
+        with self._lock:
+            bounds = [str(bound) for bound in self.buckets] + ['+Inf']
+            return {'buckets': dict(zip(bounds, self.counts)), 'count': self.count, 'sum': self.sum}
+
+
+class MetricsRegistry:
+    """Реестр метрик: одна метрика на пару (имя, метки)."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._metrics: Dict[Tuple[str, Tuple], object] = {}
+
+    def _get_or_create(self, factory, name: str, labels: dict):
+        key = (name, tuple(sorted(labels.items())))
+        metric = self._metrics.get(key)
+        if metric is None:
+            with self._lock:
+                metric = self._metrics.setdefault(key, factory())
+        return metric
+
+    def counter(self, name: str, **labels) -> Counter:
+        return self._get_or_create(Counter, name, labels)
+
+    def gauge(self, name: str, **labels) -> Gauge:
+        return self._get_or_create(Gauge, name, labels)
+
+    def histogram(self, name: str, buckets: Tuple[float, ...] = DEFAULT_BUCKETS, **labels) -> Histogram:
+        return self._get_or_create(lambda: Histogram(buckets), name, labels)
+
+    def snapshot(self, prefix: str = '') -> dict:
+        """
+        Текущие значения метрик.
+
+        Args:
+            prefix (str): Вернуть только метрики, имя которых начинается с prefix.
+
+        Returns:
+            dict: {'имя{метка=значение,...}': значение}.
+        """
+        result = {}
+        for (name, labels), metric in list(self._metrics.items()):
+            if not name.startswith(prefix):
+                continue
+            label_text = ','.join(f'{key}={value}' for key, value in labels)
+            result[f'{name}{{{label_text}}}' if label_text else name] = metric.snapshot()
+        return result
+
+
+def merge_snapshots(snapshots: Iterable[dict]) -> dict:
+    """
+    Сводит снимки метрик нескольких процессов в один.
+
+    Счетчики и измерители складываются; у гистограмм складываются корзины, count и sum.
+    """
+    result = {}
+    for snapshot in snapshots:
+        for key, value in snapshot.items():
+            if isinstance(value, dict):
+                merged = result.setdefault(key, {'buckets': {}, 'count': 0, 'sum': 0.0})
+                for bound, count in value['buckets'].items():
+                    merged['buckets'][bound] = merged['buckets'].get(bound, 0) + count
+                merged['count'] += value['count']
+                merged['sum'] += value['sum']
+            else:
+                result[key] = result.get(key, 0) + value
+    return result
+
+
+# Общий реестр метрик процесса
+registry = MetricsRegistry()
@@ -0,0 +1,98 @@
+# Общие фикстуры тестов: отдельная база SQLite на сессию тестов, схема пересоздается для каждого теста
+import asyncio
+import os
+import sys
+import tempfile
+from contextlib import asynccontextmanager
+
+import pytest
+
+# Движки создаются при импорте data_access.database, поэтому адрес базы задается до любых импортов проекта
+os.environ.setdefault('DATABASE_URL', f"sqlite:///{os.path.join(tempfile.mkdtemp(), 'test.db')}")
+# Модули bot/ импортируют друг друга как скрипты (бот запускается из этого каталога)
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'bot'))
+
+
+def pytest_addoption(parser):
+    parser.addoption('--benchmark', action='store_true', help="Запускать замеры производительности (benchmark)")
+
+
+def pytest_configure(config):
+    config.addinivalue_line('markers', "benchmark: замер производительности, запускается только с --benchmark")
+
+
+def pytest_collection_modifyitems(config, items):
+    # Замеры по времени зависят от загрузки машины, поэтому в обычный прогон не входят
+    if config.getoption('--benchmark'):
+        return
+    skip = pytest.mark.skip(reason="замер производительности: запуск с --benchmark")
+    for item in items:
+        if 'benchmark' in item.keywords:
+            item.add_marker(skip)
+
+
+@pytest.fixture
+def database():
+    """Чистая схема (create_all и миграции) для теста; возвращает синхронный движок."""
+    from data_access import models  # noqa: F401 — регистрирует таблицы в Base.metadata
+    from data_access.database import Base, engine, init_db
+    from data_access.migrations import migrations_metadata
+
+    Base.metadata.drop_all(engine)
+    migrations_metadata.drop_all(engine)
+    init_db()
+    yield engine
+
+
+@pytest.fixture
+def run():
+    """Выполняет корутину в новом цикле событий и закрывает соединения асинхронного пула в нем же."""
+    from data_access.database import async_engine
+
+    def run(coroutine):
+        async def main():
+            try:
+                return await coroutine
+            finally:
+                # Соединения aiosqlite привязаны к циклу событий и не переживают asyncio.run
+                await async_engine.dispose()
+
+        return asyncio.run(main())
+
+    return run
+
+
+class SlowSessions:
+    """Фабрика настоящих сессий БД, в которых операторы выполняются с задержкой."""
+
+    def __init__(self, delay: float, first_only: bool = False):
+        """
+        Args:
+            delay (float): Задержка перед выполнением оператора в секундах (можно менять по ходу теста).
+            first_only (bool): Задерживать только первый оператор, остальные выполнять сразу.
+        """
+        self.delay = delay
+        self.first_only = first_only
+        self.started = asyncio.Event()  # Первый оператор начал выполняться
+
+    @asynccontextmanager
+    async def __call__(self):
+        from data_access.database import get_async_session
+
+        async with get_async_session() as session:
+            execute = session.execute
+
+            async def slow_execute(*args, **kwargs):
+                if not (self.first_only and self.started.is_set()):
+                    self.started.set()
+                    await asyncio.sleep(self.delay)
+                return await execute(*args, **kwargs)
+
+            session.execute = slow_execute
+            yield session
+
+
+@pytest.fixture
+def slow_sessions():
+    """Фабрика сессий с задержкой: slow_sessions(delay, first_only=False) — для проверки остановки и отмены записи."""
+    return SlowSessions
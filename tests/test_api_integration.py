@@ -0,0 +1,29 @@
+from sqlalchemy import select
+
+from business_logic.api_integration import APIIntegration
+from business_logic.dialog_management import AsyncDialogManager, dialog_pages
+from business_logic.user_management import AsyncUserManager
+from data_access.database import get_async_session
+from data_access.models import DALLEMessage
+from external_integrations.fake_servers import FakeOpenAIServer
+from external_integrations.http_client import close_http_client
+
+
+def test_generated_image_is_recorded_in_callers_session(database, run):
+    async def scenario():
+        dialog_pages.clear()
+        try:
+            async with FakeOpenAIServer() as server, get_async_session() as session:
+                user, _ = await AsyncUserManager(session).register_user('Имя', '920')
+                dialog_id = await AsyncDialogManager(session).create_dialog(user.user_id, 'gpt-4o', 'assistant')
+                api = APIIntegration('key', 'key')
+                api.dalle_client.base_url = server.base_url
+                url = await api.generate_image('кот', session=session, dialog_id=dialog_id, user_id=user.user_id)
+                await session.commit()
+                rows = (await session.execute(select(DALLEMessage.message_text, DALLEMessage.dalle_image))).all()
+        finally:
+            await close_http_client()
+        return url, [tuple(row) for row in rows]
+
+    url, rows = run(scenario())
+    assert url and rows == [('кот', url)]
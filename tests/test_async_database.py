@@ -0,0 +1,40 @@
+import asyncio
+import time
+
+from data_access.database import get_async_session, get_session
+from data_access.models import User
+from business_logic.user_management import AsyncUserManager, identity_cache
+
+
+def test_concurrent_async_sessions_do_not_block_loop(database, run):
+    with get_session() as session:
+        session.add_all(User(telegram_id=str(number), user_name=f"user {number}") for number in range(50))
+        session.commit()
+    identity_cache.clear()
+
+    async def lookup(telegram_id: str):
+        async with get_async_session() as session:
+            return await AsyncUserManager(session).get_user_id_by_telegram_id(telegram_id)
+
+    async def scenario():
+        ticks = 0
+
+        async def ticker():
+            nonlocal ticks
+            while True:
+                ticks += 1
+                await asyncio.sleep(0)
+
+        ticking = asyncio.create_task(ticker())
+        started = time.perf_counter()
+        user_ids = await asyncio.gather(*(lookup(str(number)) for number in range(50)))
+        elapsed = time.perf_counter() - started
+        ticking.cancel()
+        return user_ids, ticks, elapsed
+
+    user_ids, ticks, elapsed = run(scenario())
+
+    assert sorted(user_ids) == list(range(1, 51))
+    # Пока запросы ждут базу, цикл событий продолжает выполнять другие задачи
+    assert ticks > 50
+    print(f"50 параллельных запросов: {elapsed * 1000:.1f} мс")
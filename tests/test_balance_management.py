@@ -0,0 +1,72 @@
+import asyncio
+from datetime import datetime
+
+import pytest
+
+import config
+from business_logic.balance_management import AsyncBalanceManager, InsufficientFundsError, hot_account_load
+from business_logic.user_management import AsyncUserManager
+from data_access.database import get_async_session
+
+
+async def _funded_user(amount: float) -> int:
+    async with get_async_session() as session:
+        user, _ = await AsyncUserManager(session).register_user('Имя', '700')
+        await AsyncBalanceManager(session).add_funds(user.user_id, amount, "Пополнение")
+        await session.commit()
+        return user.user_id
+
+
+def test_concurrent_debits_cannot_overdraw(database, run):
+    async def debit(user_id: int) -> bool:
+        async with get_async_session() as session:
+            try:
+                await AsyncBalanceManager(session).deduct_funds(user_id, 10, "Списание")
+            except InsufficientFundsError:
+                await session.rollback()
+                return False
+            await session.commit()
+            return True
+
+    async def scenario():
+        user_id = await _funded_user(100)
+        results = await asyncio.gather(*(debit(user_id) for _ in range(25)))
+        async with get_async_session() as session:
+            balances = AsyncBalanceManager(session)
+            journal = sum([item.amount async for item in balances.iter_transactions(user_id)])
+            return results, await balances.get_balance(user_id), journal
+
+    results, balance, journal = run(scenario())
+    assert results.count(True) == 10
+    assert balance == 0
+    # Журнал сходится с остатком: отклоненные списания в нем не оставили следа
+    assert journal == pytest.approx(balance)
+
+
+def test_balance_at_matches_journal_across_checkpoints(database, run, monkeypatch):
+    monkeypatch.setattr(config, 'BALANCE_CHECKPOINT_INTERVAL', 3)
+
+    async def scenario():
+        user_id = await _funded_user(50)
+        async with get_async_session() as session:
+            balances = AsyncBalanceManager(session)
+            for amount in (5, 7, 11, 13):
+                await balances.add_funds(user_id, amount)
+                await balances.deduct_funds(user_id, 2)
+            await session.commit()
+            return await balances.get_balance_at(user_id, datetime.now()), await balances.get_balance(user_id)
+
+    at_now, current = run(scenario())
+    assert at_now == pytest.approx(current) == pytest.approx(50 + 5 + 7 + 11 + 13 - 8)
+
+
+@pytest.mark.benchmark
+def test_hot_account_debit_throughput(database, run):
+    async def scenario():
+        user_id = await _funded_user(300)
+        done, rejected, elapsed = await hot_account_load(user_id, debits=400, concurrency=20)
+        async with get_async_session() as session:
+            return done, rejected, elapsed, await AsyncBalanceManager(session).get_balance(user_id)
+
+    done, rejected, elapsed, balance = run(scenario())
+    assert (done, rejected, balance) == (300, 100, 0), f"{400 / elapsed:.1f} списаний/с"
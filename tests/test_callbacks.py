@@ -0,0 +1,75 @@
+import timeit
+
+import pytest
+
+from callbacks import (CallbackRouter, DIALOG_PAGE, MAX_CALLBACK_DATA, SELECT_DIALOG, SET_MODEL, SET_ROLE,
+                       decode_callback, encode_callback)
+
+PLANS = ('basic', 'premium', 'unlimited')
+MODELS = ('gpt_4o_mini', 'gpt_4o', 'o1_mini', 'o1')
+MENUS = ('buy', 'create_choose_dialog', 'subscriptions', 'create_dialog', 'choose_dialog', 'conduct_dialog',
+         'settings_dialog', 'reset_dialog', 'text', 'image', 'model_choose', 'role_choose')
+
+
+async def handler(update, context, **params):
+    return params
+
+
+def build_router() -> CallbackRouter:
+    # Та же таблица, что в bot/dialogs.py, с одним обработчиком на все действия
+    router = CallbackRouter()
+    for code in MENUS + PLANS + tuple(f"{model}_create" for model in MODELS):
+        router.add(code, handler)
+    router.add(SELECT_DIALOG, handler, dialog_id=int)
+    router.add(DIALOG_PAGE, handler, direction=str, cursor=int)
+    router.add(SET_MODEL, handler, model=str)
+    router.add(SET_ROLE, handler, role=str, dialog_id=int)
+    return router
+
+
+def legacy_resolve(data: str):
+    # Прежний button_callback: словарь замыканий собирается на каждое нажатие, параметры — через split('_')
+    if data.startswith('dialog_'):
+        return handler, {'dialog_id': data.split('_')[1]}
+    actions = {code: (lambda: handler) for code in MENUS + PLANS}
+    actions.update({f"{model}_create": (lambda: handler) for model in MODELS})
+    actions.update({model: (lambda: handler) for model in MODELS})
+    actions.update({'role_1': lambda: handler, 'role_2': lambda: handler})
+    action = actions.get(data)
+    return (action(), {}) if action else None
+
+
+def test_codec_round_trip():
+    data = encode_callback(SET_ROLE, 'role_1', 1234567890)
+    assert decode_callback(data) == (SET_ROLE, ['role_1', '1234567890'])
+    assert build_router().resolve(data)[1] == {'role': 'role_1', 'dialog_id': 1234567890}
+    # Названия моделей с подчеркиваниями больше не ломают разбор
+    assert build_router().resolve(encode_callback(SET_MODEL, 'gpt_4o_mini'))[1] == {'model': 'gpt_4o_mini'}
+
+
+def test_codec_rejects_invalid_data():
+    with pytest.raises(ValueError):
+        encode_callback(SET_ROLE, 'a:b', 1)
+    with pytest.raises(ValueError):
+        encode_callback(SET_MODEL, 'x' * MAX_CALLBACK_DATA)
+
+    router = build_router()
+    assert router.resolve('missing') is None
+    assert router.resolve(encode_callback(SELECT_DIALOG, 'abc')) is None
+    assert router.resolve(f"{SELECT_DIALOG}:1:2") is None
+    with pytest.raises(ValueError):
+        router.add('buy', handler)
+
+
+@pytest.mark.benchmark
+def test_router_is_faster_than_legacy_dispatch():
+    # Микробенчмарк разбора нажатий: таблица собирается один раз, разбор — один split и поиск в словаре
+    router = build_router()
+    presses = ['buy', 'premium', 'o1_create', encode_callback(SELECT_DIALOG, 42),
+               encode_callback(SET_ROLE, 'role_2', 42), 'unknown']
+    legacy_presses = ['buy', 'premium', 'o1_create', 'dialog_42', 'role_2', 'unknown']
+
+    routed = min(timeit.repeat(lambda: [router.resolve(data) for data in presses], number=2000, repeat=3))
+    legacy = min(timeit.repeat(lambda: [legacy_resolve(data) for data in legacy_presses], number=2000, repeat=3))
+    assert routed < legacy, (f"Разбор {len(presses)} нажатий: таблица {routed * 1e6 / 2000:.1f} мкс, "
+                             f"прежний путь {legacy * 1e6 / 2000:.1f} мкс")
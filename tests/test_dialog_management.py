@@ -0,0 +1,78 @@
+from data_access.database import get_async_session
+from business_logic.dialog_context import dialog_contexts
+from business_logic.dialog_management import AsyncDialogManager, dialog_pages
+from business_logic.user_management import AsyncUserManager
+
+
+async def _new_dialog(session) -> int:
+    # База пересоздается для каждого теста, а кэши процесса — нет
+    dialog_pages.clear()
+    user, _ = await AsyncUserManager(session).register_user('Имя', '300')
+    dialog_id = await AsyncDialogManager(session).create_dialog(user.user_id, 'gpt-4o', 'assistant')
+    await session.commit()
+    dialog_contexts.invalidate(dialog_id)
+    return user.user_id, dialog_id
+
+
+def test_rolled_back_message_does_not_reach_context(database, run):
+    async def scenario():
+        async with get_async_session() as session:
+            manager = AsyncDialogManager(session)
+            user_id, dialog_id = await _new_dialog(session)
+            await manager.save_message(dialog_id, user_id, 'сохранено')
+            await session.commit()
+            await manager.get_dialog_history(dialog_id)
+
+            await manager.save_message(dialog_id, user_id, 'откатано')
+            await session.rollback()
+            return dialog_id, await manager.get_dialog_history(dialog_id)
+
+    dialog_id, history = run(scenario())
+    assert 'сохранено' in history
+    assert 'откатано' not in history
+
+
+def test_dialog_update_drops_context_after_commit(database, run):
+    async def scenario():
+        async with get_async_session() as session:
+            manager = AsyncDialogManager(session)
+            _, dialog_id = await _new_dialog(session)
+            await manager.get_dialog_history(dialog_id)
+
+            await manager.update_dialog(dialog_id, dialog_vol=5)
+            cached_before_commit = dialog_contexts.get(dialog_id) is not None
+            await session.commit()
+            return cached_before_commit, dialog_contexts.get(dialog_id) is not None
+
+    assert run(scenario()) == (True, False)
+
+
+def test_page_cache_is_keyed_by_limit(database, run):
+    async def scenario():
+        async with get_async_session() as session:
+            manager = AsyncDialogManager(session)
+            user_id, _ = await _new_dialog(session)
+            for _ in range(2):
+                await manager.create_dialog(user_id, 'gpt-4o', 'assistant')
+            await session.commit()
+            return (len((await manager.get_dialog_page(user_id, limit=1)).dialogs),
+                    len((await manager.get_dialog_page(user_id, limit=3)).dialogs))
+
+    assert run(scenario()) == (1, 3)
+
+
+def test_new_dialog_drops_pages_after_commit(database, run):
+    async def scenario():
+        async with get_async_session() as session:
+            manager = AsyncDialogManager(session)
+            user_id, _ = await _new_dialog(session)
+            await manager.get_dialog_page(user_id)
+
+            await manager.create_dialog(user_id, 'gpt-4o', 'assistant')
+            await session.rollback()
+            kept_after_rollback = dialog_pages.get(user_id) is not None
+            await manager.create_dialog(user_id, 'gpt-4o', 'assistant')
+            await session.commit()
+            return kept_after_rollback, len((await manager.get_dialog_page(user_id)).dialogs)
+
+    assert run(scenario()) == (True, 2)
@@ -0,0 +1,72 @@
+import asyncio
+
+from external_integrations.http_server import HTTPServer, Response
+
+
+class EchoServer(HTTPServer):
+    def __init__(self, **limits):
+        super().__init__(**limits)
+        self.routes[('POST', '/echo')] = self.echo
+        self.routes[('GET', '/fail')] = self.fail
+
+    async def echo(self, request):
+        return Response(200, {'body': request.body.decode()})
+
+    async def fail(self, request):
+        raise RuntimeError("сбой обработчика")
+
+
+async def _exchange(server: HTTPServer, *chunks: bytes) -> bytes:
+    # Отправляет байты как есть и читает ответ до закрытия соединения сервером
+    reader, writer = await asyncio.open_connection(server.host, server.port)
+    try:
+        for chunk in chunks:
+            writer.write(chunk)
+        await writer.drain()
+        return await asyncio.wait_for(reader.read(), timeout=2)
+    finally:
+        writer.close()
+
+
+def _status(response: bytes) -> int:
+    return int(response.split(b' ', 2)[1]) if response else None
+
+
+def test_malformed_and_oversized_requests_get_4xx():
+    async def scenario():
+        async with EchoServer(max_body=16, read_timeout=1, idle_timeout=1) as server:
+            return [_status(await _exchange(server, request)) for request in (
+                b'GARBAGE\r\n\r\n',
+                b'POST /echo HTTP/1.1\r\nContent-Length: abc\r\n\r\n',
+                b'POST /echo HTTP/1.1\r\nContent-Length: -1\r\n\r\n',
+                b'POST /echo HTTP/1.1\r\nContent-Length: 1000000\r\n\r\n',
+                b'POST /echo HTTP/1.1\r\nTransfer-Encoding: chunked\r\n\r\n',
+                b'POST /echo HTTP/1.1\r\nno colon here\r\n\r\n',
+            )]
+
+    assert asyncio.run(scenario()) == [400, 400, 400, 413, 501, 400]
+
+
+def test_handler_error_returns_500_and_keeps_connection():
+    async def scenario():
+        async with EchoServer(read_timeout=1, idle_timeout=0.2) as server:
+            response = await _exchange(server, b'GET /fail HTTP/1.1\r\n\r\n',
+                                       b'POST /echo HTTP/1.1\r\nContent-Length: 2\r\n\r\nok')
+            return response.count(b'HTTP/1.1 500'), response.count(b'HTTP/1.1 200'), b'"ok"' in response
+
+    assert asyncio.run(scenario()) == (1, 1, True)
+
+
+def test_slow_and_idle_clients_are_disconnected():
+    async def scenario():
+        async with EchoServer(read_timeout=0.1, idle_timeout=0.1) as server:
+            loop = asyncio.get_running_loop()
+            started = loop.time()
+            # Тело обещано, но не отправлено — соединение закрывается без ответа
+            slow = await _exchange(server, b'POST /echo HTTP/1.1\r\nContent-Length: 10\r\n\r\nab')
+            idle = await _exchange(server)
+            return slow, idle, loop.time() - started
+
+    slow, idle, elapsed = asyncio.run(scenario())
+    assert slow == idle == b''
+    assert elapsed < 1.5
@@ -0,0 +1,17 @@
+from business_logic.api_integration import APIIntegration
+from business_logic.llm_scheduler import llm_scheduler
+
+
+def test_generate_text_waits_for_scheduler_slot(run):
+    api = APIIntegration('openai-key', 'dalle-key')
+    seen = []
+
+    async def chat_completion(model, **_):
+        seen.append(llm_scheduler.stats()[model]['active'])
+        return 'ответ'
+
+    api.openai_client.chat_completion = chat_completion
+    assert run(api.generate_text('привет', model='gpt-test')) == 'ответ'
+    # Во время запроса слот модели занят, после — освобожден
+    assert seen == [1]
+    assert llm_scheduler.stats()['gpt-test']['active'] == 0
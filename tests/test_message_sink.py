@@ -0,0 +1,58 @@
+import asyncio
+
+from sqlalchemy import select
+
+from business_logic.dialog_management import AsyncDialogManager, dialog_pages
+from business_logic.message_sink import MessageSink
+from business_logic.user_management import AsyncUserManager
+from data_access.database import get_async_session
+from data_access.models import GPTMessage
+
+
+async def _dialog():
+    dialog_pages.clear()
+    async with get_async_session() as session:
+        user, _ = await AsyncUserManager(session).register_user('Имя', '800')
+        dialog_id = await AsyncDialogManager(session).create_dialog(user.user_id, 'gpt-4o', 'assistant')
+        await session.commit()
+        return dialog_id, user.user_id
+
+
+async def _written():
+    async with get_async_session() as session:
+        return list((await session.execute(select(GPTMessage.message_text).order_by(GPTMessage.message_id))).scalars())
+
+
+def test_stop_waits_for_running_flush(database, run, slow_sessions):
+    async def scenario():
+        dialog_id, user_id = await _dialog()
+        sessions = slow_sessions(0.05)
+        sink = MessageSink(batch_size=2, flush_interval=10, session_factory=sessions)
+        await sink.enqueue(dialog_id, user_id, 'первое')
+        await sink.enqueue(dialog_id, user_id, 'второе')
+        await sessions.started.wait()
+        # Пакет записывается фоновой задачей — остановка не должна его потерять
+        await sink.enqueue(dialog_id, user_id, 'третье')
+        await sink.stop()
+        return await _written(), sink.has_pending(dialog_id)
+
+    written, pending = run(scenario())
+    assert written == ['первое', 'второе', 'третье']
+    assert not pending
+
+
+def test_cancelled_flush_returns_rows_to_buffer(database, run, slow_sessions):
+    async def scenario():
+        dialog_id, user_id = await _dialog()
+        sessions = slow_sessions(1)
+        sink = MessageSink(batch_size=100, flush_interval=10, session_factory=sessions)
+        await sink.enqueue(dialog_id, user_id, 'сообщение')
+        flush = asyncio.ensure_future(sink.flush())
+        await sessions.started.wait()
+        flush.cancel()
+        await asyncio.gather(flush, return_exceptions=True)
+        sessions.delay = 0
+        await sink.stop()
+        return await _written()
+
+    assert run(scenario()) == ['сообщение']
@@ -0,0 +1,70 @@
+from datetime import datetime, timedelta
+
+from sqlalchemy import inspect, select, text
+
+from business_logic.balance_management import AsyncBalanceManager
+from data_access.database import get_async_session, init_db
+from data_access.migrations import MIGRATIONS, schema_migrations
+
+
+def _indexes(engine, table: str) -> set:
+    return {index['name'] for index in inspect(engine).get_indexes(table)}
+
+
+def _plan(engine, sql: str, **params) -> str:
+    with engine.connect() as connection:
+        return ' '.join(row[-1] for row in connection.execute(text(f'EXPLAIN QUERY PLAN {sql}'), params))
+
+
+def test_migrations_are_applied_once(database):
+    init_db()
+    init_db()
+    with database.connect() as connection:
+        versions = list(connection.scalars(select(schema_migrations.c.version).order_by(schema_migrations.c.version)))
+    assert versions == sorted(item.version for item in MIGRATIONS)
+
+
+def test_hot_query_indexes_exist(database):
+    assert 'ix_gpt_messages_dialog_id_message_time' in _indexes(database, 'gpt_messages')
+    assert 'ix_dialogs_user_id_dialog_id' in _indexes(database, 'dialogs')
+    assert 'ix_dialogs_user_id' not in _indexes(database, 'dialogs')
+    assert {'ix_subscriptions_user_id_end_date', 'ix_subscriptions_is_active_end_date'} <= _indexes(database,
+                                                                                                  'subscriptions')
+    assert 'ix_transactions_user_id_date_id' in _indexes(database, 'transactions')
+    assert 'ix_balance_history_user_id_created_at' in _indexes(database, 'balance_history')
+
+
+def test_hot_queries_use_indexes(database):
+    # Регрессия плана: горячие запросы не должны деградировать до полного просмотра таблицы
+    assert 'ix_gpt_messages_dialog_id_message_time' in _plan(
+        database, 'SELECT * FROM gpt_messages WHERE dialog_id = :id ORDER BY message_time DESC LIMIT 20', id=1)
+    assert 'ix_dialogs_user_id_dialog_id' in _plan(
+        database, 'SELECT * FROM dialogs WHERE user_id = :id AND dialog_id < :after ORDER BY dialog_id DESC LIMIT 10',
+        id=1, after=100)
+    assert 'ix_transactions_user_id_date_id' in _plan(
+        database, 'SELECT * FROM transactions WHERE user_id = :id '
+                  'ORDER BY transaction_date DESC, transaction_id DESC LIMIT 10', id=1)
+    assert 'ix_subscriptions_is_active_end_date' in _plan(
+        database, 'SELECT * FROM subscriptions WHERE is_active = 1 AND end_date < :now', now='2026-01-01')
+
+
+def test_existing_accounts_get_opening_checkpoint(database, run):
+    opened = datetime(2024, 1, 10, 12, 0)
+    with database.begin() as connection:
+        connection.execute(text("INSERT INTO users (user_id, telegram_id, user_name) VALUES (1, '800', 'Имя')"))
+        # Счет до контрольных точек: остаток 70 при журнале только из последних операций
+        connection.execute(text('INSERT INTO user_balances (user_id, balance_id, balance_now, up_date, op_count) '
+                                'VALUES (1, 1, 70, :opened, 0)'), {'opened': opened})
+        connection.execute(text("INSERT INTO transactions (user_id, transaction_sum, transaction_type, "
+                                "transaction_date) VALUES (1, -30, 'withdrawal', :opened)"), {'opened': opened})
+        connection.execute(schema_migrations.delete().where(schema_migrations.c.version == 6))
+    init_db()
+    init_db()
+
+    async def balance_at(at: datetime) -> float:
+        async with get_async_session() as session:
+            return await AsyncBalanceManager(session).get_balance_at(1, at)
+
+    with database.connect() as connection:
+        assert connection.scalar(text("SELECT COUNT(*) FROM balance_history WHERE transaction_type = 'checkpoint'")) == 1
+    assert run(balance_at(opened + timedelta(days=1))) == 70
@@ -0,0 +1,76 @@
+import pytest
+
+import config
+from external_integrations.fake_servers import FakeYooKassaServer, Response
+from external_integrations.http_client import close_http_client
+from external_integrations.payment import PaymentClient, PaymentError
+
+
+class FlakyYooKassaServer(FakeYooKassaServer):
+    """Шлюз, который теряет ответы на первые failures запросов (платеж при этом уже создан)."""
+
+    def __init__(self, failures: int):
+        super().__init__()
+        self.failures = failures
+
+    async def _fail(self) -> bool:
+        self.failures -= 1
+        return self.failures >= 0
+
+
+class HtmlErrorServer(FakeYooKassaServer):
+    """Шлюз за прокси, который отвечает на запрос страницей с ошибкой."""
+
+    async def create_payment(self, request):
+        async def page():
+            yield b'<html><body>400 Bad Request</body></html>'
+
+        return Response(400, page(), {'Content-Type': 'text/html'})
+
+
+@pytest.fixture(autouse=True)
+def fast_backoff(monkeypatch):
+    monkeypatch.setattr(config, 'PAYMENT_BACKOFF_BASE', 0.001)
+    monkeypatch.setattr(config, 'PAYMENT_BACKOFF_MAX', 0.01)
+
+
+def _client(server) -> PaymentClient:
+    return PaymentClient('shop', 'secret', server.base_url, timeout=2, deadline=5, max_attempts=5)
+
+
+def test_lost_responses_are_retried_with_the_same_key(run):
+    async def scenario():
+        try:
+            async with FlakyYooKassaServer(failures=2) as server:
+                client = _client(server)
+                first = await client.create_payment(1, 'order-1', 199.0, "Подписка")
+                again = await client.create_payment(1, 'order-1', 199.0, "Подписка")
+                other = await client.create_payment(1, 'order-2', 199.0, "Подписка")
+                keys = [request.headers['idempotence-key'] for request in server.requests]
+                return first, again, other, keys, len(server.payments)
+        finally:
+            await close_http_client()
+
+    first, again, other, keys, created = run(scenario())
+    # Два потерянных ответа и успешная третья попытка — все с одним ключом
+    assert len(set(keys[:3])) == 1 and len(keys) == 5
+    assert first.payment_id == again.payment_id != other.payment_id
+    assert first.amount == 199.0 and first.confirmation_url
+    assert created == 2
+
+
+def test_rejection_with_non_json_body(run):
+    async def scenario():
+        try:
+            async with HtmlErrorServer() as server:
+                with pytest.raises(PaymentError) as error:
+                    await _client(server).create_payment(1, 'order-1', 199.0, "Подписка")
+                return error.value, len(server.requests)
+        finally:
+            await close_http_client()
+
+    error, attempts = run(scenario())
+    assert error.status == 400
+    assert 'Bad Request' in error.body['text']
+    # Отказ 4xx не повторяется
+    assert attempts == 1
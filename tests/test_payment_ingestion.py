@@ -0,0 +1,137 @@
+import asyncio
+import json
+
+from sqlalchemy import func, select
+
+from business_logic.balance_management import AsyncBalanceManager
+from business_logic.payment_ingestion import PaymentIngestor, read_notifications, replay
+from business_logic.user_management import AsyncUserManager
+from data_access.database import get_async_session
+from data_access.models import PaymentEvent
+from monitoring.metrics import registry
+
+
+def notification(payment_id: str, user_id: int, amount: float, plan: str = None) -> dict:
+    metadata = {'user_id': str(user_id), 'order_id': payment_id}
+    if plan is not None:
+        metadata['plan'] = plan
+    return {'type': 'notification', 'event': 'payment.succeeded',
+            'object': {'id': payment_id, 'status': 'succeeded', 'amount': {'value': f"{amount:.2f}", 'currency': 'RUB'},
+                       'metadata': metadata}}
+
+
+async def _user(telegram_id: str) -> int:
+    async with get_async_session() as session:
+        user, _ = await AsyncUserManager(session).register_user('Имя', telegram_id)
+        await session.commit()
+        return user.user_id
+
+
+async def _balance_and_events(user_id: int):
+    async with get_async_session() as session:
+        return (await AsyncBalanceManager(session).get_balance(user_id),
+                await session.scalar(select(func.count()).select_from(PaymentEvent)))
+
+
+def test_stop_finishes_running_batch(database, run, slow_sessions):
+    async def scenario():
+        user_id = await _user('900')
+        sessions = slow_sessions(0.05, first_only=True)
+        ingestor = PaymentIngestor(batch_size=2, flush_interval=10, session_factory=sessions)
+        await ingestor.submit(notification('p-1', user_id, 100))
+        await ingestor.submit(notification('p-2', user_id, 50))
+        await sessions.started.wait()
+        # Пакет применяется фоновой задачей — остановка должна его дождаться, а не отменить
+        await ingestor.submit(notification('p-3', user_id, 25))
+        await ingestor.stop()
+        return await _balance_and_events(user_id)
+
+    assert run(scenario()) == (175, 3)
+
+
+def test_cancelled_flush_returns_batch_to_buffer(database, run, slow_sessions):
+    async def scenario():
+        user_id = await _user('901')
+        sessions = slow_sessions(10)
+        ingestor = PaymentIngestor(batch_size=10, flush_interval=10, session_factory=sessions)
+        await ingestor.submit(notification('p-1', user_id, 100))
+        flush = asyncio.get_running_loop().create_task(ingestor.flush())
+        await sessions.started.wait()
+        flush.cancel()
+        await asyncio.gather(flush, return_exceptions=True)
+        buffered = list(ingestor._buffer)
+        # Повтор после отмены применяет платеж, а не теряет его
+        sessions.delay = 0
+        await ingestor.stop()
+        return buffered, await _balance_and_events(user_id)
+
+    assert run(scenario()) == (['p-1'], (100, 1))
+
+
+def test_failing_payment_is_dead_lettered_without_blocking_batch(database, run):
+    async def scenario():
+        user_id = await _user('902')
+        ingestor = PaymentIngestor(batch_size=10, flush_interval=10)
+        for payment_id, amount in (('p-1', 100), ('p-bad', 0), ('p-2', 50)):
+            await ingestor.submit(notification(payment_id, user_id, amount))
+        applied = await ingestor.flush()
+        balance, _ = await _balance_and_events(user_id)
+        async with get_async_session() as session:
+            status, error = (await session.execute(
+                select(PaymentEvent.status, PaymentEvent.error).where(PaymentEvent.payment_id == 'p-bad'))).one()
+
+        # Исправленное уведомление того же платежа применяется заново
+        accepted = await ingestor.submit(notification('p-bad', user_id, 30))
+        await ingestor.stop()
+        async with get_async_session() as session:
+            retried = (await session.execute(
+                select(PaymentEvent.status, PaymentEvent.error).where(PaymentEvent.payment_id == 'p-bad'))).one()
+        return applied, balance, status, error, accepted, tuple(retried), await _balance_and_events(user_id)
+
+    applied, balance, status, error, accepted, retried, after = run(scenario())
+    assert (applied, balance, status) == (2, 150, 'failed')
+    assert error.startswith('ValueError')
+    assert accepted and retried == ('applied', None)
+    assert after == (180, 3)
+
+
+def test_submit_waits_until_payment_is_committed(database, run):
+    async def scenario():
+        user_id = await _user('903')
+        ingestor = PaymentIngestor(batch_size=10, flush_interval=0.05)
+        try:
+            first, repeated = await asyncio.gather(
+                ingestor.submit(notification('p-1', user_id, 100), wait=True),
+                ingestor.submit(notification('p-1', user_id, 100), wait=True))
+            # Ответ получен — платеж уже записан, без остановки приема
+            committed = await _balance_and_events(user_id)
+            late = await ingestor.submit(notification('p-1', user_id, 100), wait=True)
+        finally:
+            await ingestor.stop()
+        return first, repeated, committed, late
+
+    assert run(scenario()) == (True, False, (100, 1), False)
+
+
+def test_replaying_recorded_file_twice_credits_once(database, run, tmp_path):
+    path = tmp_path / 'notifications.jsonl'
+
+    async def scenario():
+        user_id = await _user('904')
+        with open(path, 'w', encoding='utf-8') as stream:
+            for payment_id, amount in (('p-1', 100), ('p-2', 50), ('p-1', 100)):
+                stream.write(json.dumps(notification(payment_id, user_id, amount)) + '\n')
+            stream.write(json.dumps({'event': 'payment.canceled', 'object': {'id': 'p-3'}}) + '\n')
+
+        replayed = registry.counter('payment_notifications_total', result='replayed')
+        before = replayed.value
+        first = await replay(list(read_notifications(path)), batch_size=2)
+        credited = await _balance_and_events(user_id)
+        second = await replay(list(read_notifications(path)), batch_size=2)
+        return first, credited, second, replayed.value - before, await _balance_and_events(user_id)
+
+    first, credited, second, replayed, after = run(scenario())
+    assert first == second == {'accepted': 2, 'rejected': 2}
+    assert credited == after == (150, 2)
+    # Второй прогон принимает уведомления, но находит платежи уже примененными
+    assert replayed == 2
@@ -0,0 +1,117 @@
+import copy
+
+import httpx
+from sqlalchemy import select
+
+from business_logic.balance_management import AsyncBalanceManager
+from business_logic.payment_ingestion import PaymentIngestor
+from business_logic.user_management import AsyncUserManager
+from data_access.database import get_async_session
+from data_access.models import PaymentEvent
+from external_integrations.fake_servers import FakeYooKassaServer, Response
+from external_integrations.http_client import close_http_client
+from external_integrations.payment import PaymentClient
+from external_integrations.payment_webhook import PaymentWebhookServer
+
+
+def test_notification_is_verified_and_committed_before_ack(database, run):
+    async def scenario():
+        async with get_async_session() as session:
+            user, _ = await AsyncUserManager(session).register_user('Имя', '910')
+            await session.commit()
+            user_id = user.user_id
+
+        ingestor = PaymentIngestor(batch_size=10, flush_interval=0.05)
+        try:
+            async with FakeYooKassaServer() as gateway:
+                client = PaymentClient('shop', 'secret', gateway.base_url, timeout=2, deadline=5, max_attempts=2)
+                paid = await client.create_payment(user_id, 'order-1', 150.0, "Пополнение")
+                pending = await client.create_payment(user_id, 'order-2', 300.0, "Пополнение")
+                gateway.complete(paid.payment_id)
+                notification = copy.deepcopy(gateway.notification(paid.payment_id))
+                # Подделанная сумма в теле уведомления не зачисляется — сумма берется из API шлюза
+                notification['object']['amount']['value'] = '100000.00'
+                forged = copy.deepcopy(gateway.notification(pending.payment_id))
+                forged['event'] = 'payment.succeeded'
+
+                async with PaymentWebhookServer('127.0.0.1', 0, '/yookassa', ack_timeout=5,
+                                                ingestor=ingestor, client=client) as server, \
+                        httpx.AsyncClient(base_url=server.url) as http:
+                    responses = [await http.post('/yookassa', json=notification),
+                                 await http.post('/yookassa', json=notification),
+                                 await http.post('/yookassa', json=gateway.notification(pending.payment_id)),
+                                 await http.post('/yookassa', json=forged),
+                                 await http.post('/yookassa', content=b'not json')]
+                    # Ответ 200 получен — платеж уже в БД, хотя прием еще не остановлен
+                    async with get_async_session() as session:
+                        balance = await AsyncBalanceManager(session).get_balance(user_id)
+        finally:
+            await ingestor.stop()
+            await close_http_client()
+        return [(response.status_code, response.json()) for response in responses], balance
+
+    responses, balance = run(scenario())
+    assert responses == [(200, {'status': 'accepted'}), (200, {'status': 'duplicate'}),
+                         (200, {'status': 'ignored'}), (400, {'error': 'payment is not succeeded'}),
+                         (400, {'error': 'invalid notification'})]
+    assert balance == 150
+
+
+class HtmlPaymentServer(FakeYooKassaServer):
+    """Шлюз за прокси, который на запрос платежа отвечает 200 со страницей вместо JSON."""
+
+    async def get_payment(self, request):
+        async def page():
+            yield b'<html><body>maintenance</body></html>'
+
+        return Response(200, page(), {'Content-Type': 'text/html'})
+
+
+def test_non_json_gateway_answer_asks_for_retry(run):
+    async def scenario():
+        ingestor = PaymentIngestor(batch_size=10, flush_interval=0.05)
+        try:
+            async with HtmlPaymentServer() as gateway:
+                client = PaymentClient('shop', 'secret', gateway.base_url, timeout=2, deadline=5, max_attempts=2)
+                payment = await client.create_payment(1, 'order-1', 150.0, "Пополнение")
+                gateway.complete(payment.payment_id)
+                webhook = PaymentWebhookServer('127.0.0.1', 0, '/yookassa', ingestor=ingestor, client=client)
+                async with webhook as server, httpx.AsyncClient(base_url=server.url) as http:
+                    response = await http.post('/yookassa', json=gateway.notification(payment.payment_id))
+        finally:
+            await ingestor.stop()
+            await close_http_client()
+        return response.status_code, response.json()
+
+    assert run(scenario()) == (503, {'error': 'payment gateway unavailable'})
+
+
+def test_failed_payment_is_not_acknowledged_and_retry_applies_it(database, run):
+    async def scenario():
+        async with get_async_session() as session:
+            user, _ = await AsyncUserManager(session).register_user('Имя', '911')
+            await session.commit()
+            user_id = user.user_id
+
+        ingestor = PaymentIngestor(batch_size=10, flush_interval=0.05)
+        try:
+            async with FakeYooKassaServer() as gateway:
+                client = PaymentClient('shop', 'secret', gateway.base_url, timeout=2, deadline=5, max_attempts=2)
+                # Нулевая сумма не зачисляется — платеж уходит в failed
+                payment = await client.create_payment(user_id, 'order-1', 0.0, "Пополнение")
+                gateway.complete(payment.payment_id)
+                webhook = PaymentWebhookServer('127.0.0.1', 0, '/yookassa', ingestor=ingestor, client=client)
+                async with webhook as server, httpx.AsyncClient(base_url=server.url) as http:
+                    failed = await http.post('/yookassa', json=gateway.notification(payment.payment_id))
+                    # Повтор уведомления от шлюза после исправления платежа
+                    gateway.payments[payment.payment_id]['amount']['value'] = '10.00'
+                    retried = await http.post('/yookassa', json=gateway.notification(payment.payment_id))
+        finally:
+            await ingestor.stop()
+            await close_http_client()
+        async with get_async_session() as session:
+            status = await session.scalar(select(PaymentEvent.status))
+            balance = await AsyncBalanceManager(session).get_balance(user_id)
+        return failed.status_code, retried.status_code, status, balance
+
+    assert run(scenario()) == (500, 200, 'applied', 10)
@@ -0,0 +1,35 @@
+from persistence import USER, StatePersistence
+
+
+class MemoryStore:
+    def __init__(self):
+        self.data = {}
+        self.loads = 0
+
+    async def load(self, kind, key):
+        self.loads += 1
+        return self.data.get((kind, key))
+
+    async def save(self, kind, key, value):
+        self.data[(kind, key)] = value
+
+    async def delete(self, kind, key):
+        self.data.pop((kind, key), None)
+
+    async def close(self):
+        pass
+
+
+def test_state_is_not_reloaded_on_every_update(run):
+    store = MemoryStore()
+    store.data[(USER, 7)] = '{"current_dialog_id":3}'
+    persistence = StatePersistence(store)
+
+    async def scenario():
+        user_data = {}
+        for _ in range(5):
+            await persistence.refresh_user_data(7, user_data)
+        return user_data
+
+    assert run(scenario()) == {'current_dialog_id': 3}
+    assert store.loads == 1
@@ -0,0 +1,71 @@
+import asyncio
+from datetime import datetime, timedelta
+
+from sqlalchemy import select
+
+import config
+from business_logic.quota import QuotaEngine, _UserQuota
+from data_access.database import get_async_session
+from data_access.models import QuotaUsage
+
+
+async def _used(subscription_id: int):
+    async with get_async_session() as session:
+        return await session.scalar(select(QuotaUsage.used).where(QuotaUsage.subscription_id == subscription_id))
+
+
+def _engine(sessions) -> QuotaEngine:
+    engine = QuotaEngine(flush_interval=0.01, session_factory=sessions)
+    engine._states.set(1, _UserQuota(subscription_id=10, limit=100, synced=5))
+    return engine
+
+
+def test_states_are_bounded(monkeypatch):
+    monkeypatch.setattr(config, 'QUOTA_STATE_CACHE_SIZE', 2)
+    engine = QuotaEngine()
+    for user_id in range(5):
+        engine._states.set(user_id, _UserQuota(None, None, 0))
+    assert len(engine._states) == 2
+
+
+def test_stop_waits_for_running_flush(database, run, slow_sessions):
+    async def scenario():
+        sessions = slow_sessions(0.05)
+        engine = _engine(sessions)
+        engine._pending[10] += 3
+        engine.start()
+        await sessions.started.wait()
+        engine._pending[10] += 1
+        await engine.stop()
+        return await _used(10), engine.remaining(1), dict(engine._inflight)
+
+    written, remaining, inflight = run(scenario())
+    assert written == 4
+    assert remaining == 100 - 5 - 4
+    assert inflight == {}
+
+
+def test_cancelled_flush_keeps_requests_pending(database, run, slow_sessions):
+    async def scenario():
+        sessions = slow_sessions(1)
+        engine = _engine(sessions)
+        engine._pending[10] += 2
+        flush = asyncio.ensure_future(engine.flush())
+        await sessions.started.wait()
+        flush.cancel()
+        await asyncio.gather(flush, return_exceptions=True)
+        return dict(engine._pending), dict(engine._inflight), engine.remaining(1)
+
+    assert run(scenario()) == ({10: 2}, {}, 100 - 5 - 2)
+
+
+def test_quota_is_reloaded_after_subscription_end(database, run):
+    async def scenario():
+        engine = QuotaEngine(session_factory=get_async_session)
+        # Лимит исчерпан, но подписка уже закончилась; событие об истечении пришло в другой процесс
+        engine._states.set(1, _UserQuota(10, limit=1, synced=1, expires_at=datetime.utcnow() - timedelta(minutes=1)))
+        async with get_async_session() as session:
+            return await engine.consume(session, 1)
+
+    decision = run(scenario())
+    assert decision.allowed and decision.remaining is None
@@ -0,0 +1,31 @@
+import sqlite3
+
+from external_integrations.response_cache import ResponseCache, cache_key
+
+
+class BrokenStore:
+    def get(self, key):
+        raise sqlite3.OperationalError('database is locked')
+
+    def set(self, key, value, ttl):
+        raise sqlite3.OperationalError('disk I/O error')
+
+
+def test_generation_parameters_are_part_of_key():
+    short = cache_key('gpt-4o', None, 'Привет', {'max_tokens': 100, 'temperature': 0.7})
+    assert short == cache_key('gpt-4o', None, '  привет ', {'temperature': 0.7, 'max_tokens': 100})
+    assert short != cache_key('gpt-4o', None, 'Привет', {'max_tokens': 150, 'temperature': 0.7})
+    assert short != cache_key('gpt-4o', None, 'Привет', {'max_tokens': 100, 'temperature': 0.2})
+    assert short != cache_key('gpt-4o', None, 'Привет')
+
+
+def test_store_errors_do_not_fail_request(run):
+    cache = ResponseCache(ttl=60, maxsize=10, max_bytes=1024, store=BrokenStore())
+
+    async def scenario():
+        await cache.set('gpt-4o', None, 'привет', 'здравствуйте', {'max_tokens': 100})
+        remembered = await cache.get('gpt-4o', None, 'привет', {'max_tokens': 100})
+        cache.memory.clear()
+        return remembered, await cache.get('gpt-4o', None, 'привет', {'max_tokens': 100})
+
+    assert run(scenario()) == ('здравствуйте', None)
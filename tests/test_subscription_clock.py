@@ -0,0 +1,101 @@
+import asyncio
+import time
+from datetime import datetime, timedelta
+
+import pytest
+from sqlalchemy import func, select
+
+from business_logic.entitlements import FREE_ENTITLEMENTS, EntitlementService
+from business_logic.events import SUBSCRIPTION_EXPIRED, event_bus
+from business_logic.subscription_sweeper import SubscriptionSweeper
+from data_access.database import get_async_session, get_session
+from data_access.models import Subscription, User
+
+
+@pytest.fixture
+def local_time_ahead_of_utc(monkeypatch):
+    # Местное время сервера на пять часов впереди UTC: при смешении часов подписка истечет раньше срока
+    monkeypatch.setenv('TZ', 'Asia/Yekaterinburg')
+    time.tzset()
+    yield
+    monkeypatch.undo()
+    time.tzset()
+
+
+def _subscription_ending_in(delta: timedelta) -> int:
+    with get_session() as session:
+        user = User(user_name='Имя', telegram_id='500')
+        session.add(user)
+        session.flush()
+        session.add(Subscription(user_id=user.user_id, subscription_type='basic', start_date=datetime.utcnow(),
+                                 end_date=datetime.utcnow() + delta, conditions={}, is_active=True))
+        session.commit()
+        return user.user_id
+
+
+def test_sweeper_uses_the_same_clock_as_end_date(database, run, local_time_ahead_of_utc):
+    _subscription_ending_in(timedelta(hours=1))
+    assert run(SubscriptionSweeper().sweep()) == 0
+
+
+def test_entitlements_live_until_end_date(database, run, local_time_ahead_of_utc):
+    user_id = _subscription_ending_in(timedelta(hours=1))
+
+    async def scenario():
+        service = EntitlementService(ttl=3600)
+        async with get_async_session() as session:
+            await service.get(session, user_id)
+            # Снимок не должен устареть сразу: до конца подписки еще час
+            return service._cache.get(user_id)
+
+    assert run(scenario()).plan == 'basic'
+
+
+def test_expired_subscription_gives_no_entitlements_before_sweep(database, run):
+    # Срок вышел минуту назад, но обход еще не снял is_active
+    user_id = _subscription_ending_in(-timedelta(minutes=1))
+
+    async def scenario():
+        service = EntitlementService(ttl=3600)
+        async with get_async_session() as session:
+            current = await service.get(session, user_id)
+            # Снимок без подписки кэшируется, а не перечитывается на каждом сообщении
+            return current, service._cache.get(user_id)
+
+    assert run(scenario()) == (FREE_ENTITLEMENTS, FREE_ENTITLEMENTS)
+
+
+def test_stop_publishes_events_of_committed_batch(database, run):
+    with get_session() as session:
+        for index in range(3):
+            user = User(user_name='Имя', telegram_id=f"51{index}")
+            session.add(user)
+            session.flush()
+            session.add(Subscription(user_id=user.user_id, subscription_type='basic', start_date=datetime.utcnow(),
+                                     end_date=datetime.utcnow() - timedelta(minutes=1), conditions={}, is_active=True))
+        session.commit()
+
+    async def scenario():
+        published, started = [], asyncio.Event()
+
+        async def slow_handler(user_id, **_):
+            started.set()
+            await asyncio.sleep(0.05)
+            published.append(user_id)
+
+        event_bus.subscribe(SUBSCRIPTION_EXPIRED, slow_handler)
+        try:
+            sweeper = SubscriptionSweeper(interval=10, batch_size=1)
+            sweeper.start()
+            await started.wait()
+            # Остановка приходит, когда пакет уже зафиксирован, а события еще публикуются
+            await sweeper.stop()
+        finally:
+            event_bus._handlers[SUBSCRIPTION_EXPIRED].remove(slow_handler)
+        async with get_async_session() as session:
+            inactive = await session.scalar(
+                select(func.count()).select_from(Subscription).where(Subscription.is_active.is_(False)))
+        return len(published), inactive
+
+    published, inactive = run(scenario())
+    assert published == inactive >= 1
@@ -0,0 +1,27 @@
+from business_logic.entitlements import entitlements
+from business_logic.subscription_management import AsyncSubscriptionManager
+from business_logic.user_management import AsyncUserManager
+from data_access.database import get_async_session
+
+
+def test_entitlements_are_dropped_after_commit(database, run):
+    async def scenario():
+        async with get_async_session() as session:
+            user, _ = await AsyncUserManager(session).register_user('Имя', '600')
+            await session.commit()
+            user_id = user.user_id
+            # Кэш прав общий для процесса, а база пересоздается для каждого теста
+            entitlements.invalidate(user_id)
+            await entitlements.get(session, user_id)
+            manager = AsyncSubscriptionManager(session)
+
+            await manager.add_subscription(user_id, 'premium', 90)
+            await session.rollback()
+            after_rollback = (await entitlements.get(session, user_id)).plan
+
+            await manager.add_subscription(user_id, 'premium', 90)
+            before_commit = entitlements._cache.get(user_id) is not None
+            await session.commit()
+            return after_rollback, before_commit, (await entitlements.get(session, user_id)).plan
+
+    assert run(scenario()) == (None, True, 'premium')
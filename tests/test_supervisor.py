@@ -0,0 +1,33 @@
+import asyncio
+import queue
+from types import SimpleNamespace
+
+from supervisor import _send_heartbeats, shard_key
+
+
+def test_updates_of_one_user_go_to_one_worker():
+    message = {'update_id': 1, 'message': {'from': {'id': 77}, 'chat': {'id': 5}}}
+    callback = {'update_id': 2, 'callback_query': {'from': {'id': 77}}}
+    assert shard_key(message) == shard_key(callback) == 77
+    assert shard_key({'update_id': 3}) == 3
+
+
+def test_saturated_worker_keeps_sending_heartbeats(run):
+    status = queue.Queue()
+
+    async def scenario():
+        application = SimpleNamespace(update_queue=asyncio.Queue(maxsize=1))
+        await application.update_queue.put('первое')
+        heartbeat = asyncio.ensure_future(_send_heartbeats(0, status, application, 0.01))
+        # Очередь приложения заполнена: прием обновлений ждет, пока она не освободится
+        blocked = asyncio.ensure_future(application.update_queue.put('второе'))
+        await asyncio.sleep(0.1)
+        heartbeat.cancel()
+        blocked.cancel()
+
+    run(scenario())
+    beats = []
+    while not status.empty():
+        beats.append(status.get_nowait())
+    assert len(beats) >= 5
+    assert all(pending == 1 for _, _, pending, _ in beats)
@@ -0,0 +1,33 @@
+from data_access.database import get_async_session, on_commit
+from business_logic.user_management import AsyncUserManager, identity_cache
+
+
+def test_cache_is_invalidated_only_after_commit(database, run):
+    identity_cache.clear()
+
+    async def scenario():
+        async with get_async_session() as session:
+            identity_cache.set('42', -1)
+            await AsyncUserManager(session).register_user('Имя', '42')
+            # До фиксации кэш не трогаем: параллельное чтение не увидело бы новую строку
+            assert identity_cache.get('42') == -1
+            await session.commit()
+            assert identity_cache.get('42') is None
+
+    run(scenario())
+
+
+def test_on_commit_callbacks_are_dropped_on_rollback(database, run):
+    calls = []
+
+    async def scenario():
+        async with get_async_session() as session:
+            await AsyncUserManager(session).register_user('Имя', '43')
+            on_commit(session, lambda: calls.append('rolled back'))
+            await session.rollback()
+            on_commit(session, lambda: calls.append('committed'))
+            await AsyncUserManager(session).register_user('Имя', '44')
+            await session.commit()
+
+    run(scenario())
+    assert calls == ['committed']
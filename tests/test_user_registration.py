@@ -0,0 +1,26 @@
+from data_access.database import get_async_session, get_session
+from business_logic.user_management import AsyncUserManager, UserManager
+
+
+def test_register_user_reports_creation_once(database):
+    with get_session() as session:
+        manager = UserManager(session)
+        user, created = manager.register_user('Первое имя', '100')
+        again, created_again = manager.register_user('Новое имя', '100')
+
+        assert created is True
+        assert created_again is False
+        assert again.user_id == user.user_id
+        assert again.user_name == 'Новое имя'
+
+
+def test_async_register_user_reports_creation_once(database, run):
+    async def scenario():
+        async with get_async_session() as session:
+            manager = AsyncUserManager(session)
+            _, created = await manager.register_user('Имя', '200')
+            _, created_again = await manager.register_user('Имя', '200')
+            await session.commit()
+        return created, created_again
+
+    assert run(scenario()) == (True, False)